@@ -0,0 +1,232 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List
+
+from benchmarks.workloads import WORKLOADS, build_workload
+from services import (
+    CompactStorage,
+    DictStorage,
+    DirectoryManager,
+    FileManger,
+    NullSink,
+    SQLiteStorage,
+)
+
+STORAGE_ENGINES = {
+    "dict": DictStorage,
+    "compact": CompactStorage,
+    "sqlite": SQLiteStorage,
+}
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(sorted_values: List[float], percent: float) -> float:
+    """
+    Returns the nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(percent / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def measure_latency(commands: List[str], storage: str) -> Dict[str, dict]:
+    """
+    Runs the commands through `command_execute` and reports the throughput and latency
+    percentiles of every command type.
+
+    Returns:
+        dict: {command type: {"count", "ops_per_sec", "p50_us", "p90_us", "p99_us"}}.
+    """
+    directory_manager = DirectoryManager(
+        storage=STORAGE_ENGINES[storage](), output=NullSink()
+    )
+    latencies = {}
+    clock = time.perf_counter_ns
+    for command in commands:
+        started = clock()
+        directory_manager.command_execute(command)
+        latencies.setdefault(command.split(" ", 1)[0], []).append(clock() - started)
+
+    report = {}
+    for command_type, values in latencies.items():
+        values.sort()
+        report[command_type] = {
+            "count": len(values),
+            "ops_per_sec": len(values) / (sum(values) / 1e9 or 1e-9),
+        }
+        for percent in PERCENTILES:
+            report[command_type][f"p{percent}_us"] = percentile(values, percent) / 1e3
+    return report
+
+
+def measure_memory(commands: List[str], storage: str) -> Dict[str, float]:
+    """
+    Runs the commands under tracemalloc and reports the peak memory allocated by a single
+    command of every type, plus the memory held by the final tree.
+
+    Returns:
+        dict: {"<type>_peak_kib": ..., "tree_kib": ...}.
+    """
+    tracemalloc.start()
+    directory_manager = DirectoryManager(
+        storage=STORAGE_ENGINES[storage](), output=NullSink()
+    )
+    peaks = {}
+    for command in commands:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        directory_manager.command_execute(command)
+        peak = tracemalloc.get_traced_memory()[1] - before
+        command_type = command.split(" ", 1)[0]
+        peaks[command_type] = max(peaks.get(command_type, 0), peak)
+    tree_size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    report = {f"{key}_peak_kib": value / 1024 for key, value in peaks.items()}
+    report["tree_kib"] = tree_size / 1024
+    return report
+
+
+def measure_file_manager(commands: List[str], storage: str) -> float:
+    """
+    Writes the commands to a temporary file and measures the end-to-end throughput of
+    `FileManger.execute` in commands per second.
+    """
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as file:
+        file.write("\n".join(commands) + "\n")
+    try:
+        file_manager = FileManger(
+            file_path=file.name, storage=STORAGE_ENGINES[storage](), output=NullSink()
+        )
+        started = time.perf_counter()
+        file_manager.execute()
+        return len(commands) / (time.perf_counter() - started)
+    finally:
+        os.remove(file.name)
+
+
+def run(workloads: List[str], scale: float, storage: str, memory: bool) -> dict:
+    """
+    Runs the benchmarks of the given workloads.
+
+    Returns:
+        dict: {workload: {"commands", "latency", "file_manager_ops_per_sec"[, "memory"]}}.
+    """
+    results = {}
+    for name in workloads:
+        commands = list(build_workload(name, scale))
+        results[name] = {
+            "commands": len(commands),
+            "latency": measure_latency(commands, storage),
+            "file_manager_ops_per_sec": measure_file_manager(commands, storage),
+        }
+        if memory:
+            results[name]["memory"] = measure_memory(commands, storage)
+    return results
+
+
+def print_report(results: dict):
+    """
+    Prints the results as a table.
+    """
+    for name, result in results.items():
+        print(
+            f"{name}: {result['commands']} commands, "
+            f"FileManger {result['file_manager_ops_per_sec']:.0f} ops/s"
+        )
+        for command_type, stats in sorted(result["latency"].items()):
+            print(
+                f"  {command_type:<7} {stats['count']:>8} ops "
+                f"{stats['ops_per_sec']:>12.0f} ops/s "
+                + " ".join(
+                    f"p{percent} {stats[f'p{percent}_us']:>9.1f}us"
+                    for percent in PERCENTILES
+                )
+            )
+        for key, value in sorted(result.get("memory", {}).items()):
+            print(f"  {key:<18} {value:>12.1f}")
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> List[str]:
+    """
+    Compares the results with a saved baseline.
+
+    Args:
+        results (dict): The current results.
+        baseline (dict): The results loaded from a baseline file.
+        threshold (float): The tolerated relative slowdown, e.g. 0.1 for 10%.
+
+    Returns:
+        List[str]: A description of every throughput or p99 latency regression.
+    """
+    regressions = []
+    for name, result in results.items():
+        for command_type, stats in result["latency"].items():
+            before = baseline.get(name, {}).get("latency", {}).get(command_type)
+            if before is None:
+                continue
+            if stats["ops_per_sec"] < before["ops_per_sec"] * (1 - threshold):
+                regressions.append(
+                    f"{name} {command_type}: {stats['ops_per_sec']:.0f} ops/s "
+                    f"(baseline {before['ops_per_sec']:.0f})"
+                )
+            if stats["p99_us"] > before["p99_us"] * (1 + threshold):
+                regressions.append(
+                    f"{name} {command_type}: p99 {stats['p99_us']:.1f}us "
+                    f"(baseline {before['p99_us']:.1f}us)"
+                )
+    return regressions
+
+
+def main():
+    """
+    Command-line entry point: python -m benchmarks.bench [--workload NAME] [--save FILE] ...
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the DirectoryManager.")
+    parser.add_argument(
+        "--workload",
+        action="append",
+        choices=WORKLOADS,
+        help="Workload to run (repeatable, all by default)",
+    )
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="Workload size multiplier"
+    )
+    parser.add_argument("--storage", choices=STORAGE_ENGINES, default="dict")
+    parser.add_argument(
+        "--memory", action="store_true", help="Also measure peak memory (slower)"
+    )
+    parser.add_argument("--save", help="Save the results as a JSON baseline")
+    parser.add_argument("--compare", help="Compare the results with a JSON baseline")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Tolerated relative slowdown before reporting a regression",
+    )
+    args = parser.parse_args()
+
+    results = run(
+        args.workload or list(WORKLOADS), args.scale, args.storage, args.memory
+    )
+    print_report(results)
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
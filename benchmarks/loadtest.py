@@ -0,0 +1,160 @@
+import argparse
+import asyncio
+import time
+from typing import Dict, List, Optional
+
+from benchmarks.bench import PERCENTILES, percentile
+from benchmarks.workloads import WORKLOADS, build_workload
+
+
+def client_commands(commands: List[str], client: int) -> List[str]:
+    """
+    Moves a workload into the top-level folder of one client, so clients don't collide.
+
+    Args:
+        commands (List[str]): The commands of a workload.
+        client (int): The number of the client, which owns the folder "client<client>".
+
+    Returns:
+        List[str]: "CREATE client<client>" followed by the commands with their paths prefixed.
+    """
+    root = f"client{client}"
+    prefixed = [f"CREATE {root}"]
+    for command in commands:
+        parts = command.split(" ")
+        paths = [root if path == "/" else f"{root}/{path}" for path in parts[1:]]
+        if parts[0] == "LIST" and not paths:
+            paths = [root]
+        prefixed.append(" ".join([parts[0]] + paths))
+    return prefixed
+
+
+async def run_client(
+    commands: List[str],
+    host: Optional[str],
+    port: Optional[int],
+    path: Optional[str],
+    pipeline: int,
+) -> List[int]:
+    """
+    Sends the commands over one connection, with up to `pipeline` commands in flight.
+
+    Returns:
+        List[int]: The latency of every command in nanoseconds, from sending it to
+                   receiving the end of its response.
+    """
+    if path is not None:
+        reader, writer = await asyncio.open_unix_connection(path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    clock = time.perf_counter_ns
+    sent = []
+    window = asyncio.Semaphore(pipeline)
+
+    async def send():
+        for command in commands:
+            await window.acquire()
+            sent.append(clock())
+            writer.write(f"{command}\n".encode("utf-8"))
+            await writer.drain()
+
+    sender = asyncio.create_task(send())
+    latencies = []
+    while len(latencies) < len(commands):
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("The server closed the connection")
+        if line == b"\n":
+            latencies.append(clock() - sent[len(latencies)])
+            window.release()
+    await sender
+    writer.close()
+    await writer.wait_closed()
+    return latencies
+
+
+async def load_test(
+    commands: List[str],
+    clients: int,
+    pipeline: int,
+    host: Optional[str] = None,
+    port: Optional[int] = None,
+    path: Optional[str] = None,
+) -> Dict[str, float]:
+    """
+    Runs a workload on `clients` concurrent connections and measures the server.
+
+    Returns:
+        dict: {"commands", "seconds", "ops_per_sec", "p50_us", "p90_us", "p99_us"}.
+    """
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(
+            run_client(client_commands(commands, client), host, port, path, pipeline)
+            for client in range(clients)
+        )
+    )
+    seconds = time.perf_counter() - started
+    latencies = sorted(latency for result in results for latency in result)
+    report = {
+        "commands": len(latencies),
+        "seconds": seconds,
+        "ops_per_sec": len(latencies) / seconds,
+    }
+    for percent in PERCENTILES:
+        report[f"p{percent}_us"] = percentile(latencies, percent) / 1e3
+    return report
+
+
+def main():
+    """
+    Command-line entry point: python -m benchmarks.loadtest --connect HOST:PORT [--clients N] ...
+    """
+    parser = argparse.ArgumentParser(description="Load-test a directory server.")
+    parser.add_argument(
+        "--connect",
+        required=True,
+        help="Server address: HOST:PORT, or unix:PATH for a Unix socket",
+    )
+    parser.add_argument("--workload", choices=WORKLOADS, default="move")
+    parser.add_argument(
+        "--scale", type=float, default=0.1, help="Workload size multiplier"
+    )
+    parser.add_argument(
+        "--clients", type=int, default=4, help="Number of concurrent connections"
+    )
+    parser.add_argument(
+        "--pipeline",
+        type=int,
+        default=64,
+        help="Maximum number of commands in flight per connection",
+    )
+    args = parser.parse_args()
+
+    host = port = path = None
+    if args.connect.startswith("unix:"):
+        path = args.connect[len("unix:") :]
+    else:
+        host, _, port = args.connect.rpartition(":")
+        port = int(port)
+    report = asyncio.run(
+        load_test(
+            list(build_workload(args.workload, args.scale)),
+            args.clients,
+            args.pipeline,
+            host,
+            port,
+            path,
+        )
+    )
+    print(
+        f"{report['commands']} commands in {report['seconds']:.2f}s: "
+        f"{report['ops_per_sec']:.0f} ops/s "
+        + " ".join(
+            f"p{percent} {report[f'p{percent}_us']:.1f}us" for percent in PERCENTILES
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import inspect
+import random
+from typing import Callable, Dict, Iterator
+
+
+def deep_chain(depth: int = 2000, lists: int = 5) -> Iterator[str]:
+    """
+    Builds one chain of nested folders, listing the tree a few times along the way.
+
+    Args:
+        depth (int): The number of nested folders.
+        lists (int): The number of LIST commands spread over the workload.
+    """
+    path = ""
+    list_every = max(depth // max(lists, 1), 1)
+    for level in range(depth):
+        path = f"{path}/d{level}" if path else f"d{level}"
+        yield f"CREATE {path}"
+        if (level + 1) % list_every == 0:
+            yield "LIST"
+    yield f"MOVE {path} /"
+    yield "DELETE d0"
+
+
+def wide_levels(roots: int = 20, children: int = 2500, lists: int = 5) -> Iterator[str]:
+    """
+    Builds a few top-level folders with very many children each.
+
+    Args:
+        roots (int): The number of top-level folders.
+        children (int): The number of children of every top-level folder.
+        lists (int): The number of LIST commands issued after the tree is built.
+    """
+    for root in range(roots):
+        yield f"CREATE r{root}"
+        for child in range(children):
+            yield f"CREATE r{root}/c{child}"
+    for _ in range(lists):
+        yield "LIST"
+        yield f"CREATE r0/extra{_}"
+
+
+def move_heavy(
+    roots: int = 50, folders: int = 5000, moves: int = 20000, seed: int = 0
+) -> Iterator[str]:
+    """
+    Builds small subtrees under a set of top-level folders, then keeps moving them around.
+
+    Args:
+        roots (int): The number of top-level folders the subtrees move between (at least 2).
+        folders (int): The number of moved subtrees, each holding one subfolder.
+        moves (int): The number of MOVE commands.
+        seed (int): The random seed, so the same workload is generated every time.
+    """
+    rng = random.Random(seed)
+    location = {}
+    for root in range(roots):
+        yield f"CREATE r{root}"
+    for folder in range(folders):
+        location[folder] = rng.randrange(roots)
+        yield f"CREATE r{location[folder]}/f{folder}"
+        yield f"CREATE r{location[folder]}/f{folder}/leaf"
+    for move in range(moves):
+        folder, target = rng.randrange(folders), rng.randrange(roots - 1)
+        target += target >= location[folder]
+        yield f"MOVE r{location[folder]}/f{folder} r{target}"
+        location[folder] = target
+        if move % (moves // 4 or 1) == 0:
+            yield "LIST"
+
+
+def delete_heavy(
+    subtrees: int = 500, fanout: int = 10, depth: int = 2, seed: int = 0
+) -> Iterator[str]:
+    """
+    Repeatedly creates subtrees and deletes them, some right away and some later.
+
+    Args:
+        subtrees (int): The number of created subtrees.
+        fanout (int): The number of children of every folder in a subtree.
+        depth (int): The number of levels below the top folder of a subtree.
+        seed (int): The random seed, so the same workload is generated every time.
+    """
+    rng = random.Random(seed)
+    alive = []
+    for subtree in range(subtrees):
+        level = [f"s{subtree}"]
+        yield f"CREATE s{subtree}"
+        for _ in range(depth):
+            level = [f"{path}/n{child}" for path in level for child in range(fanout)]
+            for path in level:
+                yield f"CREATE {path}"
+        alive.append(subtree)
+        if rng.random() < 0.7:
+            yield f"DELETE s{alive.pop(rng.randrange(len(alive)))}"
+    yield "LIST"
+    for subtree in alive:
+        yield f"DELETE s{subtree}"
+
+
+WORKLOADS: Dict[str, Callable[..., Iterator[str]]] = {
+    "deep": deep_chain,
+    "wide": wide_levels,
+    "move": move_heavy,
+    "delete": delete_heavy,
+}
+
+SCALED_PARAMETERS: Dict[str, tuple] = {
+    "deep": ("depth",),
+    "wide": ("children",),
+    "move": ("folders", "moves"),
+    "delete": ("subtrees",),
+}
+
+
+def build_workload(name: str, scale: float = 1.0) -> Iterator[str]:
+    """
+    Generates a named workload with its size parameters multiplied by `scale`.
+
+    Args:
+        name (str): One of the WORKLOADS names.
+        scale (float): The factor applied to the SCALED_PARAMETERS of the workload.
+    """
+    workload = WORKLOADS[name]
+    parameters = inspect.signature(workload).parameters
+    sizes = {
+        parameter: max(int(parameters[parameter].default * scale), 1)
+        for parameter in SCALED_PARAMETERS[name]
+    }
+    return workload(**sizes)
@@ -1,17 +1,238 @@
 import argparse
+import asyncio
+import os
+
+from services import (
+    BufferedSink,
+    CommandServer,
+    CompactStorage,
+    DictStorage,
+    FileManger,
+    IndexedStorage,
+    JsonLinesSink,
+    LoguruSink,
+    Metrics,
+    NullSink,
+    Persistence,
+    SQLiteStorage,
+)
+from services.file_manager import DEFAULT_BUFFER_SIZE, DEFAULT_READ_AHEAD, PROFILERS
+
+STORAGE_ENGINES = {
+    "dict": DictStorage,
+    "compact": CompactStorage,
+    "sqlite": SQLiteStorage,
+}
+OUTPUT_SINKS = {
+    "log": LoguruSink,
+    "buffered": BufferedSink,
+    "json": JsonLinesSink,
+    "quiet": NullSink,
+}
+
+
+def bulk_load(directory_manager, path: str) -> int:
+    """
+    Imports the subdirectories of a directory, or the folder paths listed one per line in a file.
+    """
+    if os.path.isdir(path):
+        return directory_manager.bulk_load_directory(path)
+    with open(path, encoding="utf-8") as file:
+        return directory_manager.bulk_load(line.strip() for line in file)
 
-from services import FileManger
 
 if __name__ == "__main__":
     """
     Main entry point of the script.
 
-    Parses command-line arguments to get the file path, initializes a FileManager
-    instance with the given file path, and executes the file processing.
+    Parses command-line arguments to get the file paths, storage engine, buffer size, output sink
+    persistence files, metrics and profiler, initializes
+    a FileManager instance with them, and executes the file processing.
     """
     parser = argparse.ArgumentParser(description="Process a file.")
-    parser.add_argument("file_path", type=str, help="Path to the file to process")
+    parser.add_argument(
+        "file_paths",
+        type=str,
+        nargs="*",
+        metavar="file_path",
+        help="Files or directories of files to process in order (gzip/zstd compressed or '-' for stdin)",
+    )
+    parser.add_argument(
+        "--storage",
+        choices=STORAGE_ENGINES,
+        default="dict",
+        help="Storage engine holding the folders",
+    )
+    parser.add_argument(
+        "--database",
+        help="Database file of the sqlite storage engine (in memory by default)",
+    )
+    parser.add_argument(
+        "--search-index",
+        action="store_true",
+        help="Maintain a name index and subtree sizes for fast FIND and COUNT",
+    )
+    parser.add_argument(
+        "--buffer-size",
+        type=int,
+        default=DEFAULT_BUFFER_SIZE,
+        help="Size in bytes of the read buffer",
+    )
+    parser.add_argument(
+        "--read-ahead",
+        type=int,
+        default=DEFAULT_READ_AHEAD,
+        help="Buffers read and parsed ahead on background threads (0 to read inline)",
+    )
+    parser.add_argument(
+        "--output",
+        choices=OUTPUT_SINKS,
+        help="Where command results go: loguru (default), buffered stdout, JSON lines or nowhere",
+    )
+    parser.add_argument(
+        "--background-writer",
+        action="store_true",
+        help="Write buffered/json output on a background thread",
+    )
+    parser.add_argument(
+        "--snapshot", help="Snapshot file to restore the tree from and checkpoint it to"
+    )
+    parser.add_argument(
+        "--wal", help="Write-ahead log of the applied commands (requires --snapshot)"
+    )
+    parser.add_argument(
+        "--checkpoint-interval",
+        type=int,
+        help="Write a snapshot after this many logged commands",
+    )
+    parser.add_argument(
+        "--metrics",
+        help="Write command metrics to this file once the input is processed",
+    )
+    parser.add_argument(
+        "--metrics-format",
+        choices=("prometheus", "json"),
+        default="prometheus",
+        help="Format of the --metrics file",
+    )
+    parser.add_argument(
+        "--profile", choices=PROFILERS, help="Profile the processing and log a report"
+    )
+    parser.add_argument("--profile-path", help="Dump the raw cProfile stats to a file")
+    parser.add_argument(
+        "--batch-window",
+        type=int,
+        help="Analyze this many commands at once and skip the ones that cancel out",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Execute the commands on this many processes, sharded by top-level folder",
+    )
+    parser.add_argument(
+        "--compile",
+        metavar="SCRIPT",
+        help="Compile the commands into a binary script for fast replays instead of running them",
+    )
+    parser.add_argument(
+        "--serve",
+        metavar="ADDRESS",
+        help="Serve the commands over HOST:PORT, or unix:PATH, instead of processing a file",
+    )
+    parser.add_argument(
+        "--bulk-load",
+        metavar="PATH",
+        help="Import the subdirectories of a directory, or a file of folder paths, first",
+    )
     args = parser.parse_args()
+    if (args.snapshot is None) != (args.wal is None):
+        parser.error("--snapshot and --wal must be given together")
+    if args.database and args.storage != "sqlite":
+        parser.error("--database requires --storage sqlite")
+    if bool(args.file_paths) == (args.serve is not None):
+        parser.error("either a file path or --serve must be given")
+    if args.database and args.workers:
+        parser.error("--database can't be combined with --workers")
+    if args.bulk_load and args.workers:
+        parser.error("--bulk-load can't be combined with --workers")
+    if args.serve:
+        ignored = {
+            "--output": args.output,
+            "--background-writer": args.background_writer,
+            "--workers": args.workers,
+            "--batch-window": args.batch_window,
+            "--profile": args.profile,
+            "--profile-path": args.profile_path,
+            "--compile": args.compile,
+        }
+        for option, value in ignored.items():
+            if value:
+                parser.error(f"{option} can't be combined with --serve")
+
+    output_sink = OUTPUT_SINKS[args.output or "log"]
+    if issubclass(output_sink, BufferedSink):
+        output = output_sink(background=args.background_writer)
+    else:
+        output = output_sink()
+    metrics = Metrics() if args.metrics else None
+    if args.storage == "sqlite" and args.database:
+        storage = SQLiteStorage(args.database)
+    else:
+        storage = STORAGE_ENGINES[args.storage]()
+    if args.search_index:
+        storage = IndexedStorage(storage)
+    persistence = (
+        Persistence(args.snapshot, args.wal, args.checkpoint_interval)
+        if args.snapshot
+        else None
+    )
+
+    if args.serve:
+        server = CommandServer(
+            storage=storage,
+            persistence=persistence,
+            metrics=metrics,
+        )
+        if args.bulk_load:
+            bulk_load(server.directory_manager, args.bulk_load)
+        if args.serve.startswith("unix:"):
+            address = {"path": args.serve[len("unix:") :]}
+        else:
+            host, _, port = args.serve.rpartition(":")
+            address = {"host": host or None, "port": int(port)}
+
+        async def serve():
+            await server.start(**address)
+            await server.serve_forever()
 
-    file_manager = FileManger(file_path=args.file_path)
-    file_manager.execute()
+        try:
+            asyncio.run(serve())
+        except KeyboardInterrupt:
+            pass
+    else:
+        file_manager = FileManger(
+            file_path=args.file_paths,
+            storage=storage,
+            buffer_size=args.buffer_size,
+            read_ahead=args.read_ahead,
+            output=output,
+            persistence=persistence,
+            metrics=metrics,
+            profiler=args.profile,
+            profile_path=args.profile_path,
+            batch_window=args.batch_window,
+            workers=args.workers,
+        )
+        if args.bulk_load:
+            bulk_load(file_manager.directory_manager, args.bulk_load)
+        if args.compile:
+            file_manager.compile(args.compile)
+        else:
+            file_manager.execute()
+    if metrics is not None:
+        with open(args.metrics, "w") as file:
+            file.write(
+                metrics.to_json()
+                if args.metrics_format == "json"
+                else metrics.to_prometheus()
+            )
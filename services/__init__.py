@@ -1,2 +1,19 @@
+from .changes import Change, ChangeLog, Subscription
+from .compiler import CommandScript
+from .concurrency import ConcurrentDirectoryManager, SnapshotStorage, TreeSnapshot
 from .directory_manager import DirectoryManager
 from .file_manager import FileManger
+from .metrics import Metrics
+from .output import (
+    BufferedSink,
+    JsonLinesSink,
+    LoguruSink,
+    MemorySink,
+    NullSink,
+    OutputSink,
+)
+from .persistence import Persistence
+from .search import IndexedStorage
+from .server import CommandServer
+from .sharding import ShardedExecutor
+from .storage import CompactStorage, DictStorage, SQLiteStorage, Storage
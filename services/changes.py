@@ -0,0 +1,171 @@
+import queue
+import threading
+from collections import deque
+from itertools import islice
+from typing import Callable, Iterator, List, NamedTuple, Optional
+
+DEFAULT_CAPACITY = 65536
+
+
+class Change(NamedTuple):
+    """
+    One change of the tree: a CREATE, MOVE or DELETE that was applied.
+
+    Paths are canonical ("a/b"); the target of a MOVE is the path of the new parent, "/" for
+    the root, so `command` gives back a command that replays the change on a mirror.
+    """
+
+    seq: int
+    kind: str
+    folder_path: str
+    new_folder_path: Optional[str] = None
+
+    @property
+    def command(self) -> str:
+        """
+        The change as a command, e.g. "MOVE fruits/apples vegetables".
+        """
+        if self.new_folder_path is None:
+            return f"{self.kind} {self.folder_path}"
+        return f"{self.kind} {self.folder_path} {self.new_folder_path}"
+
+
+class ChangeLog:
+    """
+    An ordered log of the changes applied to a tree, numbered from 1.
+
+    Only the last `capacity` changes are kept. A reader that knows the tree as of sequence
+    number N gets the changes after it with `since(N)`, or None when they are no longer all
+    retained and it has to reload the whole tree. Subscribers are called with every change as it
+    is appended, on the thread of the writer. Sequence numbers start over with every process, so
+    a reader must not reuse one from before a restart.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        """
+        Initializes an empty log.
+
+        Args:
+            capacity (int, optional): The number of changes kept for `since`.
+        """
+        self.seq = 0
+        self._changes = deque(maxlen=capacity)
+        self._subscribers: List[Callable[[Change], None]] = []
+        self._lock = threading.Lock()
+
+    def append(
+        self, kind: str, folder_path: str, new_folder_path: Optional[str] = None
+    ) -> Change:
+        """
+        Logs a change, gives it the next sequence number and notifies the subscribers.
+        """
+        with self._lock:
+            self.seq += 1
+            change = Change(self.seq, kind, folder_path, new_folder_path)
+            self._changes.append(change)
+        for subscriber in self._subscribers:
+            subscriber(change)
+        return change
+
+    def truncate(self):
+        """
+        Drops the retained changes, e.g. after the whole tree was replaced or restored, and
+        skips a sequence number, so every reader, even one that saw no change yet, has to reload
+        the tree.
+        """
+        with self._lock:
+            self.seq += 1
+            self._changes.clear()
+
+    def _since(self, seq: int) -> Optional[List[Change]]:
+        first = self.seq - len(self._changes)
+        if not first <= seq <= self.seq:
+            return None
+        return list(islice(self._changes, seq - first, None))
+
+    def since(self, seq: int) -> Optional[List[Change]]:
+        """
+        Returns the changes with a sequence number above `seq`.
+
+        Returns:
+            Optional[List[Change]]: The changes in order, or None if some of them were dropped
+            or `seq` is not a sequence number of this log.
+        """
+        with self._lock:
+            return self._since(seq)
+
+    def subscribe(self, subscriber: Callable[[Change], None]):
+        """
+        Calls `subscriber` with every change appended from now on.
+        """
+        self._subscribers = self._subscribers + [subscriber]
+
+    def unsubscribe(self, subscriber: Callable[[Change], None]):
+        """
+        Stops calling a subscriber.
+        """
+        self._subscribers = [item for item in self._subscribers if item != subscriber]
+
+    def follow(self, seq: Optional[int] = None) -> "Subscription":
+        """
+        Returns an iterator over the changes after `seq` (the current one by default) that
+        blocks waiting for new changes, e.g. to feed a mirror from another thread.
+
+        Raises:
+            ValueError: If the changes after `seq` are no longer retained.
+        """
+        subscription = Subscription(self)
+        with self._lock:
+            backlog = self._since(self.seq if seq is None else seq)
+            if backlog is None:
+                raise ValueError(f"The changes after {seq} are no longer retained")
+            subscription.seq = self.seq if seq is None else seq
+            for change in backlog:
+                subscription._queue.put(change)
+            self.subscribe(subscription._queue.put)
+        return subscription
+
+
+class Subscription:
+    """
+    A blocking iterator over the changes of a ChangeLog, see `ChangeLog.follow`.
+    """
+
+    def __init__(self, change_log: ChangeLog):
+        self._change_log = change_log
+        self._queue = queue.Queue()
+        self.seq = change_log.seq
+
+    def __iter__(self) -> Iterator[Change]:
+        return self
+
+    def __next__(self) -> Change:
+        change = self.get()
+        if change is None:
+            raise StopIteration
+        return change
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Change]:
+        """
+        Returns the next change, or None if the subscription is closed or no change arrives
+        within `timeout` seconds.
+        """
+        while True:
+            try:
+                change = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                return None
+            if change is None:
+                self._queue.put(None)
+                return None
+            # A change appended while following started is both in the backlog and notified.
+            if change.seq > self.seq:
+                self.seq = change.seq
+                return change
+
+    def close(self):
+        """
+        Unsubscribes; the changes already received can still be read.
+        """
+        self._change_log.unsubscribe(self._queue.put)
+        self._queue.put(None)
@@ -0,0 +1,204 @@
+import struct
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+OP_TEXT = 0
+OP_CREATE = 1
+OP_MOVE = 2
+OP_DELETE = 3
+OP_LIST = 4
+
+SCRIPT_MAGIC = b"DIRCMDS1"
+SCRIPT_HEADER = struct.Struct("<8sQQQ")
+STRING_SIZE = struct.Struct("<I")
+
+
+def _split_components(folder_path: Optional[str]) -> Optional[List[str]]:
+    """
+    Splits a path that is written in canonical form ("a/b", no empty components).
+
+    Returns:
+        Optional[List[str]]: The path components, or None if the path is not canonical.
+    """
+    if not folder_path:
+        return None
+    folder_path_items = folder_path.split("/")
+    return None if "" in folder_path_items else folder_path_items
+
+
+def parse_command(
+    command_line: str,
+) -> Optional[Tuple[int, List[str], Optional[List[str]]]]:
+    """
+    Parses a command whose text can be rebuilt exactly from its path components.
+
+    Args:
+        command_line (str): A text command, e.g. "MOVE fruits/apples vegetables".
+
+    Returns:
+        Optional[Tuple[int, List[str], Optional[List[str]]]]: The opcode, the path components
+        and, for MOVE, the components of the target ([] for "/"), or None if the command is not
+        a plain LIST or a CREATE, MOVE or DELETE of canonical paths.
+    """
+    parts = command_line.split(" ", 2)
+    command = parts[0]
+    if command == "LIST" and len(parts) == 1:
+        return OP_LIST, [], None
+    if command in ("CREATE", "DELETE") and len(parts) == 2:
+        folder_path_items = _split_components(parts[1])
+        if folder_path_items is not None:
+            opcode = OP_CREATE if command == "CREATE" else OP_DELETE
+            return opcode, folder_path_items, None
+    if command == "MOVE" and len(parts) == 3:
+        folder_path_items = _split_components(parts[1])
+        new_folder_path_items = [] if parts[2] == "/" else _split_components(parts[2])
+        if folder_path_items is not None and new_folder_path_items is not None:
+            return OP_MOVE, folder_path_items, new_folder_path_items
+    return None
+
+
+class CommandScript:
+    """
+    A command file compiled into a compact opcode stream, replayed by `DirectoryManager.replay`.
+
+    Path components are interned once into `names`, and every command becomes a few integers in
+    `code`, so a replay does not split or compare any strings:
+
+        CREATE a/b  ->  OP_CREATE, 2, id(a), id(b)
+        MOVE a b/c  ->  OP_MOVE, 1, id(a), 2, id(b), id(c)   ("/" as target gives a length of 0)
+        DELETE a    ->  OP_DELETE, 1, id(a)
+        LIST        ->  OP_LIST
+
+    Commands whose text would not be reproduced exactly from their components (leading slashes,
+    empty components, extra arguments, LIST options, unknown commands) are kept as text in
+    `texts` and compiled to OP_TEXT, index, so a replay always behaves like `command_execute`.
+    """
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.texts: List[str] = []
+        self.code = array("q")
+        self.count = 0
+        self._name_ids: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator[str]:
+        """
+        Decodes the script back into its text commands.
+        """
+        names, code = self.names, self.code
+        position, end = 0, len(code)
+        while position < end:
+            opcode = code[position]
+            position += 1
+            if opcode == OP_TEXT:
+                yield self.texts[code[position]]
+                position += 1
+                continue
+            if opcode == OP_LIST:
+                yield "LIST"
+                continue
+            folder_paths = []
+            for _ in range(2 if opcode == OP_MOVE else 1):
+                size = code[position]
+                folder_paths.append(
+                    "/".join(
+                        names[name_id]
+                        for name_id in code[position + 1 : position + 1 + size]
+                    )
+                )
+                position += 1 + size
+            if opcode == OP_MOVE:
+                yield f"MOVE {folder_paths[0]} {folder_paths[1] or '/'}"
+            else:
+                yield f"{'CREATE' if opcode == OP_CREATE else 'DELETE'} {folder_paths[0]}"
+
+    @classmethod
+    def compile(cls, command_lines: Iterable[str]) -> "CommandScript":
+        """
+        Compiles text commands, e.g. the lines of a command file.
+        """
+        script = cls()
+        for command_line in command_lines:
+            script.add(command_line)
+        return script
+
+    def _emit_path(self, folder_path_items: List[str]):
+        """
+        Appends a path as its length followed by the interned IDs of its components.
+        """
+        self.code.append(len(folder_path_items))
+        for folder_name in folder_path_items:
+            name_id = self._name_ids.get(folder_name)
+            if name_id is None:
+                name_id = self._name_ids[folder_name] = len(self.names)
+                self.names.append(folder_name)
+            self.code.append(name_id)
+
+    def add(self, command_line: str):
+        """
+        Compiles one command and appends it to the script.
+        """
+        self.count += 1
+        parsed = parse_command(command_line)
+        if parsed is None:
+            self.code.append(OP_TEXT)
+            self.code.append(len(self.texts))
+            self.texts.append(command_line)
+            return
+        opcode, folder_path_items, new_folder_path_items = parsed
+        self.code.append(opcode)
+        if opcode != OP_LIST:
+            self._emit_path(folder_path_items)
+        if opcode == OP_MOVE:
+            self._emit_path(new_folder_path_items)
+
+    def save(self, path: str):
+        """
+        Writes the script to a binary file: a header (magic, command count, name count, text
+        count), the names and texts as length-prefixed UTF-8 strings, then the opcode stream.
+        """
+        with open(path, "wb") as file:
+            file.write(
+                SCRIPT_HEADER.pack(
+                    SCRIPT_MAGIC, self.count, len(self.names), len(self.texts)
+                )
+            )
+            for string in self.names + self.texts:
+                data = string.encode("utf-8")
+                file.write(STRING_SIZE.pack(len(data)))
+                file.write(data)
+            self.code.tofile(file)
+
+    @classmethod
+    def load(cls, path: str) -> "CommandScript":
+        """
+        Reads a script written by `save`.
+        """
+        script = cls()
+        with open(path, "rb") as file:
+            data = file.read()
+        magic, script.count, names, texts = SCRIPT_HEADER.unpack_from(data, 0)
+        if magic != SCRIPT_MAGIC:
+            raise ValueError(f"{path} is not a compiled command script")
+        offset = SCRIPT_HEADER.size
+        strings = []
+        for _ in range(names + texts):
+            (size,) = STRING_SIZE.unpack_from(data, offset)
+            offset += STRING_SIZE.size
+            strings.append(data[offset : offset + size].decode("utf-8"))
+            offset += size
+        script.names, script.texts = strings[:names], strings[names:]
+        script._name_ids = {name: name_id for name_id, name in enumerate(script.names)}
+        script.code.frombytes(data[offset:])
+        return script
+
+    @staticmethod
+    def is_script(path: str) -> bool:
+        """
+        Returns True if the file starts with the magic number of a compiled script.
+        """
+        with open(path, "rb") as file:
+            return file.read(len(SCRIPT_MAGIC)) == SCRIPT_MAGIC
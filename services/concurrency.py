@@ -0,0 +1,560 @@
+import bisect
+import threading
+from contextlib import contextmanager
+from itertools import islice
+from typing import Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+from loguru import logger
+
+from .directory_manager import DirectoryManager
+from .storage import ROOT_ID, DictStorage, Storage
+
+SNAPSHOT_PIECE_SIZE = 32
+
+
+class _Leaf:
+    """
+    A piece of the children of a snapshot folder: their names, sorted, and their nodes.
+    """
+
+    __slots__ = ("owner", "names", "nodes")
+
+    def __init__(self, owner: object, names: list, nodes: list):
+        self.owner = owner
+        self.names = names
+        self.nodes = nodes
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def copy(self, owner: object) -> "_Leaf":
+        return _Leaf(owner, self.names[:], self.nodes[:])
+
+    def split(self) -> Tuple[str, "_Leaf"]:
+        """
+        Moves the second half of the children to a new piece; returns its first name and it.
+        """
+        middle = len(self.names) // 2
+        right = _Leaf(self.owner, self.names[middle:], self.nodes[middle:])
+        del self.names[middle:], self.nodes[middle:]
+        return right.names[0], right
+
+
+class _Branch:
+    """
+    An inner piece: the pieces below it, and the names that separate them; the children named
+    from `bounds[i - 1]` up to, but not including, `bounds[i]` are in `pieces[i]`.
+    """
+
+    __slots__ = ("owner", "bounds", "pieces")
+
+    def __init__(self, owner: object, bounds: list, pieces: list):
+        self.owner = owner
+        self.bounds = bounds
+        self.pieces = pieces
+
+    def __len__(self) -> int:
+        return len(self.pieces)
+
+    def copy(self, owner: object) -> "_Branch":
+        return _Branch(owner, self.bounds[:], self.pieces[:])
+
+    def split(self) -> Tuple[str, "_Branch"]:
+        """
+        Moves the second half of the pieces to a new piece; returns its lower bound and it.
+        """
+        middle = len(self.pieces) // 2
+        bound = self.bounds[middle - 1]
+        right = _Branch(self.owner, self.bounds[middle:], self.pieces[middle:])
+        del self.bounds[middle - 1 :], self.pieces[middle:]
+        return bound, right
+
+
+_EMPTY_LEAF = _Leaf(None, [], [])
+
+
+class _SnapshotNode:
+    """
+    A folder of a snapshot tree: its children, by name, in a persistent B-tree of pieces holding
+    up to 2 * SNAPSHOT_PIECE_SIZE entries each.
+
+    A node and its pieces belong to the write transaction that created them and may only be
+    changed in place by that transaction; once published they are frozen and a later write
+    copies them instead. A copy of a node shares all of its pieces, and a change of a child then
+    copies only the pieces on the way to its name, so a write costs O(log(children)) whatever
+    the number of siblings.
+    """
+
+    __slots__ = ("owner", "_tree", "_size")
+
+    def __init__(self, owner: object):
+        self.owner = owner
+        self._tree = _EMPTY_LEAF
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def copy(self, owner: object) -> "_SnapshotNode":
+        """
+        Returns a copy of the node, with the same children, owned by another transaction.
+        """
+        node = _SnapshotNode(owner)
+        node._tree, node._size = self._tree, self._size
+        return node
+
+    def get(self, folder_name: str) -> Optional["_SnapshotNode"]:
+        """
+        Returns the node of a child, or None if there is no child with that name.
+        """
+        piece = self._tree
+        while piece.__class__ is _Branch:
+            piece = piece.pieces[bisect.bisect_right(piece.bounds, folder_name)]
+        index = bisect.bisect_left(piece.names, folder_name)
+        if index < len(piece.names) and piece.names[index] == folder_name:
+            return piece.nodes[index]
+        return None
+
+    def __getitem__(self, folder_name: str) -> "_SnapshotNode":
+        node = self.get(folder_name)
+        if node is None:
+            raise KeyError(folder_name)
+        return node
+
+    def __leaf(self, folder_name: str) -> Tuple[_Leaf, List[Tuple[_Branch, int]]]:
+        """
+        Returns the leaf where a name belongs and the (branch, index) pairs leading to it,
+        after copying the frozen pieces on the way.
+        """
+        owner = self.owner
+        if self._tree.owner is not owner:
+            self._tree = self._tree.copy(owner)
+        piece, path = self._tree, []
+        while piece.__class__ is _Branch:
+            index = bisect.bisect_right(piece.bounds, folder_name)
+            path.append((piece, index))
+            child = piece.pieces[index]
+            if child.owner is not owner:
+                child = piece.pieces[index] = child.copy(owner)
+            piece = child
+        return piece, path
+
+    def __setitem__(self, folder_name: str, node: "_SnapshotNode"):
+        leaf, path = self.__leaf(folder_name)
+        index = bisect.bisect_left(leaf.names, folder_name)
+        if index < len(leaf.names) and leaf.names[index] == folder_name:
+            leaf.nodes[index] = node
+            return
+        leaf.names.insert(index, folder_name)
+        leaf.nodes.insert(index, node)
+        self._size += 1
+        piece = leaf
+        while len(piece) > 2 * SNAPSHOT_PIECE_SIZE:
+            bound, right = piece.split()
+            if not path:
+                self._tree = _Branch(self.owner, [bound], [piece, right])
+                return
+            piece, index = path.pop()
+            piece.bounds.insert(index, bound)
+            piece.pieces.insert(index + 1, right)
+
+    def __delitem__(self, folder_name: str):
+        leaf, path = self.__leaf(folder_name)
+        index = bisect.bisect_left(leaf.names, folder_name)
+        if index == len(leaf.names) or leaf.names[index] != folder_name:
+            raise KeyError(folder_name)
+        del leaf.names[index], leaf.nodes[index]
+        self._size -= 1
+        piece = leaf
+        while not len(piece) and path:
+            piece, index = path.pop()
+            del piece.pieces[index]
+            if piece.bounds:
+                del piece.bounds[max(index - 1, 0)]
+        while self._tree.__class__ is _Branch and len(self._tree) == 1:
+            self._tree = self._tree.pieces[0]
+
+    def iter_sorted(
+        self, after: Optional[str] = None
+    ) -> Iterator[Tuple[str, "_SnapshotNode"]]:
+        """
+        Yields the (name, node) pairs of the children in name order.
+
+        Args:
+            after (str, optional): Only yield the children whose name sorts after this one.
+        """
+        stack, piece = [], self._tree
+        while True:
+            while piece.__class__ is _Branch:
+                index = 0 if after is None else bisect.bisect_right(piece.bounds, after)
+                stack.append((piece, index + 1))
+                piece = piece.pieces[index]
+            start = 0 if after is None else bisect.bisect_right(piece.names, after)
+            yield from islice(zip(piece.names, piece.nodes), start, None)
+            after = None
+            while stack and stack[-1][1] == len(stack[-1][0].pieces):
+                stack.pop()
+            if not stack:
+                return
+            branch, index = stack.pop()
+            stack.append((branch, index + 1))
+            piece = branch.pieces[index]
+
+
+class TreeSnapshot:
+    """
+    An immutable view of the directory tree at one point in time.
+
+    Snapshots share all unchanged folders with each other, so taking one costs nothing and
+    holding one doesn't block the writer: later commands build new folders instead of changing
+    the ones a snapshot can see.
+    """
+
+    def __init__(self, root: _SnapshotNode, version: int = 0):
+        """
+        Initializes a snapshot.
+
+        Args:
+            root (_SnapshotNode): The frozen root folder.
+            version (int, optional): The number of changes published before this snapshot.
+        """
+        self._root = root
+        self.version = version
+
+    def _get_node(self, folder_path: str) -> Optional[_SnapshotNode]:
+        """
+        Returns the node of a folder, the root for "/", or None if the folder doesn't exist.
+        """
+        node = self._root
+        for folder_name in DirectoryManager._split_path(folder_path):
+            node = node.get(folder_name)
+            if node is None:
+                return None
+        return node
+
+    def exists(self, folder_path: str) -> bool:
+        """
+        Returns True if the folder exists in the snapshot.
+        """
+        return self._get_node(folder_path) is not None
+
+    def is_empty(self) -> bool:
+        """
+        Returns True if the snapshot holds no folders.
+        """
+        return not self._root
+
+    def iter_directory(
+        self,
+        folder_path: str = "/",
+        depth: Optional[int] = None,
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+    ) -> Iterator[str]:
+        """
+        Lazily walks the contents of a folder, exactly like `DirectoryManager.iter_directory`.
+
+        Args:
+            folder_path (str, optional): The path of the folder to list, "/" for the whole tree.
+            depth (int, optional): The maximum number of levels to descend.
+            limit (int, optional): The maximum number of folders to yield.
+            after (str, optional): The path, relative to `folder_path`, to resume after.
+
+        Yields:
+            str: The path of each folder relative to `folder_path`, e.g. "fruits/apples".
+        """
+        node = self._get_node(folder_path)
+        if node is None:
+            logger.warning(f"Cannot list: {folder_path} doesn't exist")
+            return
+
+        stack = [(node.iter_sorted(), "", 0)]
+        if after:
+            after_items = DirectoryManager._split_path(after)[:depth]
+            stack, prefix = [], ""
+            for level, folder_name in enumerate(after_items):
+                stack.append((node.iter_sorted(after=folder_name), prefix, level))
+                node = node.get(folder_name)
+                if node is None:
+                    break
+                prefix = f"{prefix}{folder_name}/"
+            else:
+                if depth is None or len(after_items) < depth:
+                    stack.append((node.iter_sorted(), prefix, len(after_items)))
+
+        count = 0
+        while stack and (limit is None or count < limit):
+            children, prefix, level = stack[-1]
+            for child_name, child in children:
+                child_path = prefix + child_name
+                yield child_path
+                count += 1
+                if depth is None or level + 1 < depth:
+                    stack.append((child.iter_sorted(), child_path + "/", level + 1))
+                break
+            else:
+                stack.pop()
+
+    def render(self) -> List[str]:
+        """
+        Renders the tree like a plain LIST: one line per folder, in name order, indented by one
+        space per depth level. An empty tree gives no lines.
+        """
+        lines = []
+        stack = [(self._root.iter_sorted(), "")]
+        while stack:
+            children, indent = stack[-1]
+            for child_name, child in children:
+                lines.append(f"{indent}{child_name}")
+                stack.append((child.iter_sorted(), indent + " "))
+                break
+            else:
+                stack.pop()
+        return lines
+
+
+class SnapshotStorage(Storage):
+    """
+    A storage engine wrapper that also keeps the tree as a persistent, copy-on-write structure
+    and publishes an immutable `TreeSnapshot` of it after every change.
+
+    All reads and writes of the wrapped engine come from the single writer. A change copies only
+    the folders on the path from the root to the changed folder; folders created by the current
+    transaction are changed in place, so a bulk load inside one transaction doesn't copy at all.
+    Publishing replaces a single reference, so readers never see half of a change.
+    """
+
+    def __init__(self, storage: Optional[Storage] = None):
+        """
+        Initializes the wrapper.
+
+        Args:
+            storage (Storage, optional): The wrapped engine. Defaults to a DictStorage. The
+                folders it already holds, e.g. those of a reopened SQLiteStorage, are in the
+                first snapshot.
+        """
+        self._storage = storage if storage is not None else DictStorage()
+        self._transactions = 0
+        self._owner = object()
+        self._root = _SnapshotNode(None)
+        self._changed = False
+        self.snapshot = TreeSnapshot(self._root)
+        if not self._storage.is_empty():
+            self._load_tree()
+
+    def _load_tree(self):
+        """
+        Builds the tree of the folders already in the wrapped engine and publishes it.
+        """
+        self._root = _SnapshotNode(self._owner)
+        stack = [(ROOT_ID, self._root)]
+        while stack:
+            parent_id, node = stack.pop()
+            for folder_name, folder_id in self._storage.iter_children(parent_id):
+                child = node[folder_name] = _SnapshotNode(self._owner)
+                stack.append((folder_id, child))
+        self._changed_tree()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Defers publishing until the end of the block, so all of its changes appear at once.
+        """
+        self._transactions += 1
+        try:
+            yield
+        finally:
+            self._transactions -= 1
+            if not self._transactions:
+                self.publish()
+
+    def publish(self):
+        """
+        Freezes the current tree and makes it the snapshot seen by readers, if it changed.
+        """
+        if not self._changed:
+            return
+        self.snapshot = TreeSnapshot(self._root, self.snapshot.version + 1)
+        self._owner = object()
+        self._changed = False
+
+    def _changed_tree(self):
+        """
+        Marks the tree as changed and publishes it unless a transaction is open.
+        """
+        self._changed = True
+        if not self._transactions:
+            self.publish()
+
+    def _writable(self, parent_id: Optional[Hashable]) -> _SnapshotNode:
+        """
+        Returns the node of a folder, copying it and its ancestors first if they are frozen.
+        """
+        folder_names = []
+        while parent_id is not ROOT_ID:
+            folder_name, parent_id = self._storage.get_folder(parent_id)
+            folder_names.append(folder_name)
+        if self._root.owner is not self._owner:
+            self._root = self._root.copy(self._owner)
+        node = self._root
+        for folder_name in reversed(folder_names):
+            child = node[folder_name]
+            if child.owner is not self._owner:
+                child = node[folder_name] = child.copy(self._owner)
+            node = child
+        return node
+
+    def clear(self):
+        self._storage.clear()
+        self._root = _SnapshotNode(self._owner)
+        self._changed_tree()
+
+    def is_empty(self) -> bool:
+        return self._storage.is_empty()
+
+    def get_child(self, parent_id: Optional[Hashable], folder_name: str):
+        return self._storage.get_child(parent_id, folder_name)
+
+    def iter_children(
+        self, parent_id: Optional[Hashable], after: Optional[str] = None
+    ) -> Iterator[Tuple[str, Hashable]]:
+        return self._storage.iter_children(parent_id, after)
+
+    def get_folder(self, folder_id: Hashable) -> Tuple[str, Optional[Hashable]]:
+        return self._storage.get_folder(folder_id)
+
+    def add_folder(self, folder_name: str, parent_id: Optional[Hashable]) -> Hashable:
+        self._writable(parent_id)[folder_name] = _SnapshotNode(self._owner)
+        folder_id = self._storage.add_folder(folder_name, parent_id)
+        self._changed_tree()
+        return folder_id
+
+    def move_folder(self, folder_id: Hashable, new_parent_id: Optional[Hashable]):
+        folder_name, parent_id = self._storage.get_folder(folder_id)
+        siblings = self._writable(parent_id)
+        node = siblings[folder_name]
+        del siblings[folder_name]
+        self._writable(new_parent_id)[folder_name] = node
+        self._storage.move_folder(folder_id, new_parent_id)
+        self._changed_tree()
+
+    def remove_folder(self, folder_id: Hashable):
+        folder_name, parent_id = self._storage.get_folder(folder_id)
+        del self._writable(parent_id)[folder_name]
+        self._storage.remove_folder(folder_id)
+        self._changed_tree()
+
+    def reclaim(
+        self,
+        budget: Optional[int] = None,
+        on_free: Optional[Callable[[Hashable, str], None]] = None,
+    ) -> int:
+        return self._storage.reclaim(budget, on_free)
+
+    def find(self, pattern: str) -> Iterator[Hashable]:
+        return self._storage.find(pattern)
+
+    def close(self):
+        self._storage.close()
+
+    def count_descendants(self, folder_id: Optional[Hashable]) -> int:
+        return self._storage.count_descendants(folder_id)
+
+    def load_dict(self, directory: Dict[int, Dict[Hashable, dict]]):
+        with self.transaction():
+            super().load_dict(directory)
+
+
+class ConcurrentDirectoryManager(DirectoryManager):
+    """
+    A DirectoryManager that can be shared by one writer and any number of reader threads.
+
+    Commands are serialized by a write lock. Reads go through `snapshot`, which never takes the
+    lock: it returns the immutable tree published after the last completed command, so a LIST or
+    a lookup never blocks a write and never sees a command, such as a MOVE, half applied.
+    """
+
+    def __init__(self, storage: Optional[Storage] = None, **kwargs):
+        """
+        Initializes the manager.
+
+        Args:
+            storage (Storage, optional): The storage engine, wrapped in a SnapshotStorage.
+                Defaults to a DictStorage.
+            **kwargs: The other arguments of DirectoryManager.
+        """
+        self._write_lock = threading.RLock()
+        super().__init__(storage=SnapshotStorage(storage), **kwargs)
+
+    def snapshot(self) -> TreeSnapshot:
+        """
+        Returns the tree as of the last completed command, without waiting for the writer.
+        """
+        return self._storage.snapshot
+
+    def _restore(self):
+        with self._write_lock, self._storage.transaction():
+            super()._restore()
+
+    def checkpoint(self):
+        with self._write_lock:
+            super().checkpoint()
+
+    @DirectoryManager.directory.setter
+    def directory(self, directory: Dict[int, Dict[Hashable, dict]]):
+        with self._write_lock:
+            DirectoryManager.directory.fset(self, directory)
+
+    def iter_directory(
+        self,
+        folder_path: str = "/",
+        depth: Optional[int] = None,
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+    ) -> Iterator[str]:
+        """
+        Lazily walks the contents of a folder in the current snapshot; see
+        `DirectoryManager.iter_directory`. The walk keeps seeing the same snapshot while
+        commands go on.
+        """
+        return self.snapshot().iter_directory(folder_path, depth, limit, after)
+
+    def find(self, pattern: str) -> List[str]:
+        """
+        Finds folders by name, see `DirectoryManager.find`; waits for the running command.
+        """
+        with self._write_lock:
+            return super().find(pattern)
+
+    def count(self, folder_path: str = "/") -> Optional[int]:
+        """
+        Counts the folders below a folder, see `DirectoryManager.count`; waits for the
+        running command.
+        """
+        with self._write_lock:
+            return super().count(folder_path)
+
+    def _show_directory(self, *args, **kwargs):
+        """
+        Publishes the changes of the open transaction, e.g. the commands replayed on restore,
+        before listing from the snapshot.
+        """
+        self._storage.publish()
+        super()._show_directory(*args, **kwargs)
+
+    def detach_subtree(self, folder_path: str) -> List[str]:
+        with self._write_lock, self._storage.transaction():
+            self._storage.publish()
+            return super().detach_subtree(folder_path)
+
+    def attach_subtree(self, parent_path: str, folder_paths: List[str]):
+        with self._write_lock, self._storage.transaction():
+            super().attach_subtree(parent_path, folder_paths)
+
+    def _bulk_insert(self, paths: Iterable[List[str]]) -> int:
+        with self._write_lock, self._storage.transaction():
+            return super()._bulk_insert(paths)
+
+    def _execute(self, command: str, handler: Callable, *args):
+        with self._write_lock, self._storage.transaction():
+            super()._execute(command, handler, *args)
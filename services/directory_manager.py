@@ -1,79 +1,813 @@
-import uuid
-from typing import Tuple
+import bisect
+import os
+import time
+from itertools import chain
+from typing import Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
 
 from loguru import logger
 
+from .changes import ChangeLog
+from .compiler import OP_CREATE, OP_DELETE, OP_LIST, OP_MOVE, OP_TEXT, CommandScript
+from .metrics import Metrics, TimedSink
+from .optimizer import find_transient_subtrees
+from .output import LoguruSink, MemorySink, NullSink, OutputSink
+from .persistence import Persistence
+from .storage import ROOT_ID, DictStorage, Storage
+
+RECLAIM_BUDGET = 1024
+BATCH_WINDOW = 65536
+MOVE_ERRORS = {
+    "missing_folder": "ERROR MOVE: {folder_name} doesn't exist on level",
+    "missing_parent": "ERROR MOVE: {folder_name} to {new_folder_name} doesn't exist",
+    "invalid_move": "ERROR MOVE: {folder_name} can't be moved into itself",
+    "already_exists": "ERROR MOVE: {folder_name} already exists in {new_folder_name}",
+}
+RENDER_CHUNK_SIZE = 256
+
+
+class _RenderBlock:
+    """
+    The cached rendering of a folder with subfolders: its name and the blocks of its children,
+    in name order, split into chunks of consecutive names.
+
+    The block of a folder without subfolders is just its name. Blocks hold no indentation, so a
+    moved subtree keeps its blocks. Chunk `i` holds the children whose names sort after
+    `lows[i]` (None for the first chunk) up to `lows[i + 1]`; a change of a child only marks its
+    chunk as dirty (None), so a folder with many children re-renders one chunk of them.
+    """
+
+    __slots__ = ("name", "lows", "chunks", "dirty")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.lows = [None]
+        self.chunks = [None]
+        self.dirty = True
+
+    def invalidate(self, folder_name: str) -> bool:
+        """
+        Marks the chunk that holds a child as dirty.
+
+        Returns:
+            bool: False if the chunk already was, so its ancestors already are too.
+        """
+        index = bisect.bisect_left(self.lows, folder_name, 1) - 1
+        if self.chunks[index] is None:
+            return False
+        self.chunks[index] = None
+        self.dirty = True
+        return True
+
+    def split(self):
+        """
+        Drops the empty chunks and splits the ones that grew above twice the chunk size.
+        """
+        lows, chunks = [], []
+        for low, chunk in zip(self.lows, self.chunks):
+            if not chunk:
+                continue
+            lows.append(low if lows else None)
+            chunks.append(chunk)
+            while len(chunks[-1]) > 2 * RENDER_CHUNK_SIZE:
+                chunk = chunks.pop()
+                chunks.extend((chunk[:RENDER_CHUNK_SIZE], chunk[RENDER_CHUNK_SIZE:]))
+                last = chunk[RENDER_CHUNK_SIZE - 1]
+                lows.append(last if last.__class__ is str else last.name)
+        self.lows, self.chunks = lows, chunks
+        self.dirty = False
+
 
 class DirectoryManager:
     """
     Manages a directory structure where folders can be created, listed, and organized in a hierarchical.
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        storage: Optional[Storage] = None,
+        reclaim_budget: int = RECLAIM_BUDGET,
+        output: Optional[OutputSink] = None,
+        persistence: Optional[Persistence] = None,
+        metrics: Optional[Metrics] = None,
+        changes: Optional[ChangeLog] = None,
+    ):
         """
         Initializes a new DirectoryManager with an empty directory structure.
+
+        Args:
+            storage (Storage, optional): The storage engine holding the folders. Defaults to
+                a DictStorage; pass a CompactStorage to hold very large trees in less memory.
+            reclaim_budget (int, optional): The maximum number of deleted folders freed after
+                each command, which bounds the cleanup work a single command pays for.
+            output (OutputSink, optional): The sink receiving the command results. Defaults to
+                a LoguruSink; warnings and errors are always logged with loguru.
+            persistence (Persistence, optional): Snapshot and write-ahead log storage. When given,
+                the saved state is restored right away and every mutating command is logged.
+            metrics (Metrics, optional): Collects command latencies, error counts and output
+                time. Without it the commands run uninstrumented.
+            changes (ChangeLog, optional): Records every CREATE, MOVE and DELETE applied to the
+                tree, for `LIST --since`. Without it the changes are not recorded.
         """
-        self.directory = {}
+        self._storage = storage if storage is not None else DictStorage()
+        self.reclaim_budget = reclaim_budget
+        self._output = output if output is not None else LoguruSink()
+        self._render_cache = {}
+        self._block_cache = {}
+        self._persistence = persistence
+        self.metrics = metrics
+        self.changes = changes
+        self._restoring = False
+        if metrics is not None:
+            self._output = TimedSink(self._output, metrics)
+            metrics.folder_counter = self.folder_counts
+        if persistence is not None:
+            self._restore()
 
-    def __draw_directory(self):
+    def _restore(self):
+        """
+        Loads the persisted snapshot and replays the logged commands without printing their output.
+        The errors of the replayed commands were reported when they first ran, so they are
+        neither logged nor counted again.
         """
-        Recursively prints the directory structure starting from the root level.
+        output, self._output = self._output, NullSink()
+        self._restoring = True
+        try:
+            self._persistence.restore(self._storage, self._command_line_parser)
+        finally:
+            self._output = output
+            self._restoring = False
+        self._storage.reclaim()
+        self._clear_render_cache()
+        if self.changes is not None:
+            self.changes.truncate()
 
-        This method helps visualize the directory structure in a hierarchical format,
-        with indentation representing folder depth.
+    def checkpoint(self):
         """
+        Writes a snapshot of the directory and truncates the write-ahead log.
+        """
+        self._persistence.checkpoint(self._storage)
 
-        def print_folders(depth, parent_id=None, indent=""):
-            """
-            Helper function to recursively print folder names with proper indentation.
+    def _record_change(
+        self, kind: str, folder_path: str, new_folder_path: Optional[str] = None
+    ):
+        """
+        Appends an applied change to the change log, if there is one.
 
-            Args:
-                depth (int): The current depth level in the directory hierarchy.
-                parent_id (str, optional): The parent folder ID to match for subfolders.
-                indent (str): The current indentation string to format the output.
-            """
-            for item_id, item_info in sorted(self.directory.get(depth, {}).items()):
-                if item_info["parent_id"] == parent_id:
-                    logger.info(f"{indent}{item_info['name']}")
-                    print_folders(depth + 1, item_id, indent + " ")
+        Args:
+            kind (str): "CREATE", "MOVE" or "DELETE".
+            folder_path (str): The canonical path of the folder, e.g. "foods/fruits".
+            new_folder_path (str, optional): For a MOVE, the path of the new parent, "/" for the root.
+        """
+        if self.changes is not None:
+            self.changes.append(kind, folder_path, new_folder_path)
 
-        print_folders(0)
+    def _report_error(self, error: str, message: str):
+        """
+        Logs a failed command and counts it in the metrics, unless it is replayed on restore.
 
-    def _show_directory(self):
+        Args:
+            error (str): The kind of error, e.g. "missing_parent".
+            message (str): The warning to log.
+        """
+        if self._restoring:
+            return
+        logger.warning(message)
+        if self.metrics is not None:
+            self.metrics.count_error(error)
+
+    def folder_counts(self) -> Dict[int, int]:
+        """
+        Counts the folders of every depth level with a breadth-first walk of the tree.
+
+        Returns:
+            Dict[int, int]: {depth: number of folders}, the top-level folders being at depth 0.
+        """
+        counts = {}
+        level = [ROOT_ID]
+        depth = 0
+        while level:
+            level = [
+                child_id
+                for parent_id in level
+                for _, child_id in self._storage.iter_children(parent_id)
+            ]
+            if level:
+                counts[depth] = len(level)
+            depth += 1
+        return counts
+
+    @property
+    def directory(self) -> Dict[int, Dict[Hashable, dict]]:
+        """
+        The folders grouped by depth: {depth: {folder_id: {"name": ..., "parent_id": ...}}}.
+        """
+        return self._storage.to_dict()
+
+    @directory.setter
+    def directory(self, directory: Dict[int, Dict[Hashable, dict]]):
+        """
+        Replaces the whole directory structure.
+
+        Args:
+            directory (dict): The folders grouped by depth, in the same format as the getter.
+        """
+        self._storage.load_dict(directory)
+        self._clear_render_cache()
+        if self.changes is not None:
+            self.changes.truncate()
+
+    def _clear_render_cache(self):
+        """
+        Drops all the cached renderings, e.g. after the whole tree was replaced.
+        """
+        self._render_cache.clear()
+        self._block_cache.clear()
+
+    def _invalidate_render_cache(self, folder_id: Hashable):
+        """
+        Marks the cached renderings of a folder's ancestors as dirty, when the folder is about
+        to be removed from its parent or was just added to it.
+
+        Only the chunk holding the folder is dirtied in each ancestor; the walk up stops at the
+        first ancestor whose chunk already was, since the ones above it are dirty too.
+
+        Args:
+            folder_id: The ID of the folder that is added, moved or removed.
+        """
+        blocks = self._block_cache
+        while True:
+            folder_name, parent_id = self._storage.get_folder(folder_id)
+            if parent_id is ROOT_ID:
+                self._render_cache.pop(folder_id, None)
+                return
+            block = blocks.get(parent_id)
+            if block is not None and not block.invalidate(folder_name):
+                return
+            folder_id = parent_id
+
+    def _forget_rendering(self, folder_id: Hashable, folder_name: str):
+        """
+        Drops the cached block of a reclaimed folder, to free the memory of its rendering.
+        """
+        self._block_cache.pop(folder_id, None)
+
+    def __is_leaf(self, folder_id: Hashable) -> bool:
+        return next(iter(self._storage.iter_children(folder_id)), None) is None
+
+    def __render_chunks(self, block: _RenderBlock, folder_id: Hashable):
+        """
+        Re-renders the dirty chunks of a block from the storage.
+
+        This is a generator, so that deep trees are rendered without recursion: it yields the
+        (name, ID) of every child whose block is missing or dirty, is sent back that child's
+        block, and finally returns the folder's block, or its name if it has no subfolders.
+        """
+        blocks = self._block_cache
+        for index, chunk in enumerate(block.chunks):
+            if chunk is not None:
+                continue
+            high = block.lows[index + 1] if index + 1 < len(block.lows) else None
+            chunk = []
+            for child_name, child_id in self._storage.iter_children(
+                folder_id, block.lows[index]
+            ):
+                if high is not None and child_name > high:
+                    break
+                child_block = blocks.get(child_id)
+                if child_block is None:
+                    if self.__is_leaf(child_id):
+                        child_block = child_name
+                    else:
+                        child_block = yield child_name, child_id
+                elif child_block.dirty:
+                    child_block = yield child_name, child_id
+                chunk.append(child_block)
+            block.chunks[index] = chunk
+        block.split()
+        if not block.chunks:
+            blocks.pop(folder_id, None)
+            return block.name
+        blocks[folder_id] = block
+        return block
+
+    def __render_block(self, folder_name: str, folder_id: Hashable):
+        """
+        Returns the up-to-date block of a folder, re-rendering its dirty and missing blocks.
+        """
+        block = self._block_cache.get(folder_id)
+        if block is not None and not block.dirty:
+            return block
+        stack = [self.__render_chunks(block or _RenderBlock(folder_name), folder_id)]
+        child_block = None
+        while stack:
+            try:
+                child_name, child_id = stack[-1].send(child_block)
+            except StopIteration as stop:
+                stack.pop()
+                child_block = stop.value
+                continue
+            block = self._block_cache.get(child_id) or _RenderBlock(child_name)
+            stack.append(self.__render_chunks(block, child_id))
+            child_block = None
+        return child_block
+
+    @staticmethod
+    def __block_lines(block) -> List[str]:
+        """
+        Joins the block of a top-level folder into lines, indented by one space per depth level.
+        """
+        if block.__class__ is str:
+            return [block]
+        lines = [block.name]
+        stack = [(chain.from_iterable(block.chunks), " ")]
+        while stack:
+            children, indent = stack[-1]
+            for child in children:
+                if child.__class__ is str:
+                    lines.append(indent + child)
+                else:
+                    lines.append(indent + child.name)
+                    stack.append((chain.from_iterable(child.chunks), indent + " "))
+                    break
+            else:
+                stack.pop()
+        return lines
+
+    def __draw_directory(self):
+        """
+        Prints the directory structure starting from the root level.
+
+        This method helps visualize the directory structure in a hierarchical format,
+        with indentation representing folder depth and folders ordered by name.
+        Every folder's rendering is cached as a block until a command changes its subtree, and
+        the lines of each top-level folder are cached until then too, so repeated listings only
+        re-render the changed folders and re-join the blocks of the top-level folders above them.
+        """
+        for folder_name, folder_id in self._storage.iter_children(ROOT_ID):
+            lines = self._render_cache.get(folder_id)
+            if lines is None:
+                lines = self.__block_lines(self.__render_block(folder_name, folder_id))
+                self._render_cache[folder_id] = lines
+            self._output.write_lines(lines)
+
+    def _show_directory(
+        self,
+        folder_path: Optional[str] = None,
+        depth: Optional[int] = None,
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+        since: Optional[int] = None,
+    ):
         """
         Prints the directory listing.
 
         Shows "LIST" followed by either the directory structure if it is not empty,
-        or "EMPTY DIRECTORY" if the directory is empty.
+        or "EMPTY DIRECTORY" if the directory is empty. Without arguments the whole tree
+        is printed from the render cache; otherwise the listing is streamed by `iter_directory`.
+
+        Args:
+            folder_path (str, optional): The path of the folder whose contents are listed.
+            depth (int, optional): The maximum number of levels to list below the folder.
+            limit (int, optional): The maximum number of folders to list. If more folders remain,
+                                   a final "NEXT <cursor>" line gives the cursor of the next page.
+            after (str, optional): The cursor returned by the previous page.
+            since (int, optional): A sequence number of the change log: only the changes made
+                                   after it are printed, see `_show_changes`.
+        """
+        self._output.write(self._list_echo(folder_path, depth, limit, after, since))
+        if since is not None:
+            self._show_changes(since)
+            return
+        if folder_path is None and depth is None and limit is None and after is None:
+            self.__write_tree()
+            return
+
+        folder_path = folder_path or "/"
+        if not self._get_folder_id(self._split_path(folder_path))[1]:
+            self._report_error(
+                "missing_folder", f"Cannot list: {folder_path} doesn't exist"
+            )
+            return
+        folder_paths = self.iter_directory(
+            folder_path=folder_path,
+            depth=depth,
+            limit=None if limit is None else limit + 1,
+            after=after,
+        )
+        self._write_page(self._output, folder_paths, limit, after)
+
+    def __write_tree(self):
+        """
+        Prints the whole tree, or "EMPTY DIRECTORY" if it is empty.
         """
-        logger.info("LIST")
         (
-            logger.info("EMPTY DIRECTORY")
-            if not self.directory
+            self._output.write("EMPTY DIRECTORY")
+            if self._storage.is_empty()
             else self.__draw_directory()
         )
 
+    def _show_changes(self, since: int):
+        """
+        Prints the changes made after the sequence number `since`, one replayable command per
+        line, e.g. "MOVE fruits/apples vegetables", then "SEQ <n>" with the sequence number of
+        the last change.
+
+        If those changes are no longer in the change log, or the tree was replaced or restored
+        since, "RESYNC" and the whole tree are printed instead of them, so a client can rebuild
+        its copy and carry on from the final sequence number.
+        """
+        if self.changes is None:
+            self._report_error(
+                "invalid_arguments", "ERROR LIST: --since needs a change log"
+            )
+            return
+        changes = self.changes.since(since)
+        if changes is None:
+            self._output.write("RESYNC")
+            self.__write_tree()
+        else:
+            self._output.write_lines([change.command for change in changes])
+        self._output.write(f"SEQ {self.changes.seq}")
+
+    @staticmethod
+    def _list_echo(
+        folder_path: Optional[str],
+        depth: Optional[int],
+        limit: Optional[int],
+        after: Optional[str],
+        since: Optional[int] = None,
+    ) -> str:
+        """
+        Formats the first output line of a LIST, e.g. "LIST foods --depth 1".
+        """
+        options = {
+            "--depth": depth,
+            "--limit": limit,
+            "--after": after,
+            "--since": since,
+        }
+        return " ".join(
+            ["LIST"]
+            + ([folder_path] if folder_path is not None else [])
+            + [f"{key} {val}" for key, val in options.items() if val is not None]
+        )
+
+    @staticmethod
+    def _write_page(
+        output: OutputSink,
+        folder_paths: Iterable[str],
+        limit: Optional[int],
+        after: Optional[str],
+    ):
+        """
+        Writes a page of a LIST from the relative paths yielded by `iter_directory`.
+
+        Args:
+            output (OutputSink): The sink to write the page to.
+            folder_paths (Iterable[str]): The listed paths, at most `limit` + 1 of them.
+            limit (int, optional): The page size; an extra path means that a next page exists.
+            after (str, optional): The cursor the page starts after.
+        """
+        for line in DirectoryManager._iter_page(folder_paths, limit, after):
+            output.write(line)
+
+    @staticmethod
+    def _iter_page(
+        folder_paths: Iterable[str], limit: Optional[int], after: Optional[str]
+    ) -> Iterator[str]:
+        """
+        Lazily formats the output lines of a page of a LIST; see `_write_page`.
+        """
+        cursor = None
+        for count, item_path in enumerate(folder_paths):
+            if limit is not None and count == limit:
+                yield f"NEXT {cursor}"
+                break
+            folder_path_items = item_path.split("/")
+            yield f"{' ' * (len(folder_path_items) - 1)}{folder_path_items[-1]}"
+            cursor = item_path
+        if cursor is None and after is None:
+            yield "EMPTY DIRECTORY"
+
+    def iter_directory(
+        self,
+        folder_path: str = "/",
+        depth: Optional[int] = None,
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+    ) -> Iterator[str]:
+        """
+        Lazily walks the contents of a folder in name order (pre-order, parents before children).
+
+        Folders are visited one at a time straight from the child indexes, so a page of a huge
+        tree can be streamed without rendering the rest of it.
+
+        Args:
+            folder_path (str, optional): The path of the folder to list, "/" for the whole tree.
+            depth (int, optional): The maximum number of levels to descend; 1 lists only the
+                                   direct children of the folder.
+            limit (int, optional): The maximum number of folders to yield.
+            after (str, optional): A cursor to resume from: the path, relative to `folder_path`,
+                                   of the last folder of the previous page.
+
+        Yields:
+            str: The path of each folder relative to `folder_path`, e.g. "fruits/apples".
+        """
+        folder_id, status = self._get_folder_id(self._split_path(folder_path))
+        if not status:
+            logger.warning(f"Cannot list: {folder_path} doesn't exist")
+            return
+
+        stack = [(self._storage.iter_children(folder_id), "", 0)]
+        if after:
+            # A cursor below the depth limit resumes after its ancestor at the limit.
+            after_items = self._split_path(after)[:depth]
+            stack, parent_id, prefix = [], folder_id, ""
+            for level, folder_name in enumerate(after_items):
+                children = self._storage.iter_children(parent_id, after=folder_name)
+                stack.append((children, prefix, level))
+                parent_id = self._storage.get_child(parent_id, folder_name)
+                if parent_id is None:
+                    break
+                prefix = f"{prefix}{folder_name}/"
+            else:
+                if depth is None or len(after_items) < depth:
+                    children = self._storage.iter_children(parent_id)
+                    stack.append((children, prefix, len(after_items)))
+
+        count = 0
+        while stack and (limit is None or count < limit):
+            children, prefix, level = stack[-1]
+            for child_name, child_id in children:
+                child_path = prefix + child_name
+                yield child_path
+                count += 1
+                if depth is None or level + 1 < depth:
+                    stack.append(
+                        (
+                            self._storage.iter_children(child_id),
+                            child_path + "/",
+                            level + 1,
+                        )
+                    )
+                break
+            else:
+                stack.pop()
+
+    def _folder_path(self, folder_id: Hashable) -> str:
+        """
+        Builds the path of a folder by following its parent pointers up to the root.
+        """
+        folder_path_items = []
+        while folder_id is not ROOT_ID:
+            folder_name, folder_id = self._storage.get_folder(folder_id)
+            folder_path_items.append(folder_name)
+        return "/".join(reversed(folder_path_items))
+
+    def find(self, pattern: str) -> List[str]:
+        """
+        Finds the folders whose name matches a pattern, anywhere in the tree.
+
+        With an IndexedStorage the folders are found through its name index; other storage
+        engines are walked in full.
+
+        Args:
+            pattern (str): A folder name, e.g. "apples", or a glob pattern, e.g. "app*" or
+                           "[ab]?c" (case-sensitive, matched against the name only).
+
+        Returns:
+            List[str]: The paths of the matching folders, in name order.
+        """
+        return sorted(
+            self._folder_path(folder_id) for folder_id in self._storage.find(pattern)
+        )
+
+    def count(self, folder_path: str = "/") -> Optional[int]:
+        """
+        Counts the folders below a folder, at any depth.
+
+        With an IndexedStorage the count is maintained by every command and read in O(depth);
+        other storage engines walk the subtree.
+
+        Args:
+            folder_path (str, optional): The path of the folder, "/" to count the whole tree.
+
+        Returns:
+            Optional[int]: The number of descendants, or None if the folder doesn't exist.
+        """
+        folder_id, status = self._get_folder_id(self._split_path(folder_path))
+        if not status:
+            return None
+        return self._storage.count_descendants(folder_id)
+
+    def _find_folders(self, pattern: str):
+        """
+        Prints "FIND <pattern>" followed by the paths of the matching folders, or "NOT FOUND".
+        """
+        self._output.write(f"FIND {pattern}" if pattern else "FIND")
+        if not pattern:
+            self._report_error("invalid_arguments", "ERROR FIND: missing pattern")
+            return
+        folder_paths = self.find(pattern)
+        self._output.write_lines(folder_paths or ["NOT FOUND"])
+
+    def _count_folders(self, folder_path: Optional[str]):
+        """
+        Prints "COUNT [<path>]" followed by the number of folders below the folder.
+        """
+        self._output.write(f"COUNT {folder_path}" if folder_path else "COUNT")
+        count = self.count(folder_path or "/")
+        if count is None:
+            self._report_error(
+                "missing_folder", f"Cannot count: {folder_path} doesn't exist"
+            )
+            return
+        self._output.write(str(count))
+
+    def detach_subtree(self, folder_path: str) -> List[str]:
+        """
+        Removes a folder and returns its subtree, so it can be attached somewhere else.
+
+        Args:
+            folder_path (str): The path of an existing folder, e.g. "foods/fruits".
+
+        Returns:
+            List[str]: The paths of the folder and of its subfolders relative to its parent,
+                       parents first, e.g. ["fruits", "fruits/apples"].
+        """
+        folder_path_items = self._split_path(folder_path)
+        folder_id = self._get_folder_id(folder_path_items)[0]
+        folder_name = folder_path_items[-1]
+        folder_paths = [folder_name] + [
+            f"{folder_name}/{item_path}"
+            for item_path in self.iter_directory(folder_path)
+        ]
+        self._invalidate_render_cache(folder_id)
+        self._storage.remove_folder(folder_id)
+        self._record_change("DELETE", "/".join(folder_path_items))
+        return folder_paths
+
+    def attach_subtree(self, parent_path: str, folder_paths: List[str]):
+        """
+        Adds a subtree returned by `detach_subtree` under an existing folder.
+
+        Args:
+            parent_path (str): The path of the new parent folder, "/" for the root.
+            folder_paths (List[str]): The paths of the folders relative to the parent, parents first.
+        """
+        parent_path_items = self._split_path(parent_path)
+        folder_ids = {"": self._get_folder_id(parent_path_items)[0]}
+        for folder_path in folder_paths:
+            parent, _, folder_name = folder_path.rpartition("/")
+            folder_ids[folder_path] = self._storage.add_folder(
+                folder_name, folder_ids[parent]
+            )
+            self._record_change("CREATE", "/".join(parent_path_items + [folder_path]))
+        self._invalidate_render_cache(folder_ids[folder_paths[0]])
+
+    def bulk_load(self, folder_paths: Iterable[str]) -> int:
+        """
+        Adds many folders in one pass, without parsing commands or writing any output.
+
+        Missing parent folders are created along the way and existing folders are kept, so
+        the paths may overlap with the tree and with each other. The folders of the previous
+        path are remembered, so only the components that differ from it are looked up: sorted
+        paths, e.g. from `sort` or a directory walk, share most of their lookups.
+        With persistence enabled, a checkpoint is written afterwards instead of logging the folders.
+
+        Args:
+            folder_paths (Iterable[str]): The folder paths, e.g. ["foods", "foods/fruits"].
+
+        Returns:
+            int: The number of folders added.
+        """
+        return self._bulk_insert(
+            self._split_path(folder_path) for folder_path in folder_paths
+        )
+
+    def bulk_load_directory(self, root_path: str) -> int:
+        """
+        Adds the subdirectories of a real directory, walked with `os.scandir`, as folders.
+
+        The directory itself is not added: its subdirectories become top-level folders.
+        Symbolic links are not followed and unreadable directories are skipped with a warning.
+
+        Args:
+            root_path (str): The directory to import.
+
+        Returns:
+            int: The number of folders added.
+        """
+        return self._bulk_insert(self._scan_directories(root_path))
+
+    @staticmethod
+    def _scan_directories(root_path: str) -> Iterator[Tuple[str, ...]]:
+        """
+        Walks a directory depth-first, in name order.
+
+        Yields:
+            Tuple[str, ...]: The path components of every subdirectory, parents first.
+        """
+        stack = [(root_path, ())]
+        while stack:
+            path, folder_path_items = stack.pop()
+            try:
+                with os.scandir(path) as entries:
+                    children = sorted(
+                        entry.name
+                        for entry in entries
+                        if entry.is_dir(follow_symlinks=False)
+                    )
+            except OSError as error:
+                logger.warning(f"Cannot scan {path}: {error}")
+                continue
+            for folder_name in reversed(children):
+                stack.append(
+                    (
+                        os.path.join(path, folder_name),
+                        folder_path_items + (folder_name,),
+                    )
+                )
+            if folder_path_items:
+                yield folder_path_items
+
+    def _bulk_insert(self, paths: Iterable[List[str]]) -> int:
+        """
+        Adds the folders of `bulk_load`, given as lists of path components.
+        """
+        added = 0
+        previous, folder_ids = [], [ROOT_ID]
+        for folder_path_items in paths:
+            common = 0
+            for previous_name, folder_name in zip(previous, folder_path_items):
+                if previous_name != folder_name:
+                    break
+                common += 1
+            del folder_ids[common + 1 :]
+            for folder_name in folder_path_items[common:]:
+                parent_id = folder_ids[-1]
+                folder_id = self._storage.get_child(parent_id, folder_name)
+                if folder_id is None:
+                    folder_id = self._storage.add_folder(folder_name, parent_id)
+                    added += 1
+                    if self.changes is not None:
+                        self._record_change(
+                            "CREATE", "/".join(folder_path_items[: len(folder_ids)])
+                        )
+                folder_ids.append(folder_id)
+            previous = folder_path_items
+        if added:
+            self._clear_render_cache()
+            if self._persistence is not None:
+                self.checkpoint()
+        return added
+
+    @staticmethod
+    def _split_path(folder_path: str) -> List[str]:
+        """
+        Splits a slash-separated folder path into its components; the root "/" gives an empty list.
+        """
+        return [item for item in folder_path.strip("/").split("/") if item]
+
+    def _get_folder_id(self, folder_path_items: List[str]) -> Tuple[str, bool]:
+        """
+        Retrieves the ID of a folder by walking its full path from the root.
+
+        Parameters:
+        - folder_path_items (List[str]): The path components of the folder, e.g. ["foods", "fruits"].
+          An empty list stands for the root, whose ID is None.
+
+        Returns:
+        - Tuple[str, bool]: A tuple where:
+          - The first element is the ID of the folder if found, or an empty string if not found.
+          - The second element is a boolean indicating whether the folder was found.
+        """
+        folder_id = ROOT_ID
+        for folder_name in folder_path_items:
+            folder_id = self._storage.get_child(folder_id, folder_name)
+            if folder_id is None:
+                return "", False
+        return folder_id, True
+
     def _get_parent_folder_id(
         self, parent_folder_name: str, depth: int
     ) -> Tuple[str, bool]:
         """
-        Retrieves the ID of a parent folder based on its name and depth level.
+        Retrieves the ID of a parent folder based on its path and depth level.
 
         Parameters:
-        - parent_folder_name (str): The name of the parent folder to find.
-        - depth (int): The depth level at which to search for the parent folder.
+        - parent_folder_name (str): The path of the parent folder relative to the root, e.g. "foods/fruits".
+        - depth (int): The depth level of the parent folder, used to validate the path length.
 
         Returns:
         - Tuple[str, bool]: A tuple where:
           - The first element is the ID of the parent folder if found, or an empty string if not found.
           - The second element is a boolean indicating whether the parent folder was found.
         """
-        folders_name_parent_id = {
-            val.get("name"): key for key, val in self.directory.get(depth, {}).items()
-        }
-        if folders_name_parent_id.get(parent_folder_name):
-            return folders_name_parent_id.get(parent_folder_name), True
-        return "", False
+        parent_path_items = parent_folder_name.strip("/").split("/")
+        if len(parent_path_items) != depth + 1:
+            return "", False
+        return self._get_folder_id(parent_path_items)
 
     def _create_new_folder(
         self, depth: int, folder_name: str, parent_folder_name: str = None
@@ -84,34 +818,55 @@ class DirectoryManager:
         Parameters:
         - depth (int): The depth level where the new folder should be created.
         - folder_name (str): The name of the new folder.
-        - parent_folder_name (str, optional): The name of the parent folder at the level above.
-          If not provided, the new folder is created at the root level.
+        - parent_folder_name (str, optional): The path of the parent folder relative to the root,
+          e.g. "foods/fruits". If not provided, the new folder is created at the root level.
 
         If the depth is 0, the folder is created at the root level with no parent.
         For other depths, the method will check if the specified parent folder exists.
         If the parent folder exists, the new folder is added under it; otherwise, an error is printed.
+        A folder that already exists under the same parent is left untouched.
 
-        The method generates a unique ID for the new folder and updates the directory structure accordingly.
+        The storage engine allocates a unique ID for the new folder and updates the directory structure accordingly.
         """
-        un_id = str(uuid.uuid4())
-        if depth not in self.directory:
-            self.directory[depth] = {}
-
-        if depth == 0:
-            self.directory[depth][un_id] = {"name": folder_name, "parent_id": None}
-        else:
+        parent_id = ROOT_ID
+        if depth != 0:
             parent_id, status = self._get_parent_folder_id(
                 parent_folder_name=parent_folder_name, depth=depth - 1
             )
-            if status:
-                self.directory[depth][un_id] = {
-                    "name": folder_name,
-                    "parent_id": parent_id,
-                }
-            else:
-                logger.warning(
-                    f"ERROR CREATING: {parent_folder_name} doesn't exist on parent level"
-                )
+            if not status:
+                self._report_missing_parent(parent_folder_name)
+                return
+        self._insert_folder(parent_id, folder_name)
+
+    def _report_missing_parent(self, parent_folder_name: str):
+        """
+        Reports a CREATE whose parent folder doesn't exist.
+        """
+        self._report_error(
+            "missing_parent",
+            f"ERROR CREATING: {parent_folder_name} doesn't exist on parent level",
+        )
+
+    def _report_existing_folder(self, folder_name: str):
+        """
+        Reports a CREATE of a folder that already exists.
+        """
+        self._report_error(
+            "already_exists", f"ERROR CREATING: {folder_name} already exists"
+        )
+
+    def _insert_folder(self, parent_id: Hashable, folder_name: str):
+        """
+        Adds a folder under an existing parent, unless the parent already has a folder with that name.
+        """
+        if self._storage.get_child(parent_id, folder_name) is not None:
+            self._report_existing_folder(folder_name)
+            return
+
+        folder_id = self._storage.add_folder(folder_name, parent_id)
+        self._invalidate_render_cache(folder_id)
+        if self.changes is not None:
+            self._record_change("CREATE", self._folder_path(folder_id))
 
     def _add_folder(self, folder_path: str):
         """
@@ -133,88 +888,58 @@ class DirectoryManager:
             self._create_new_folder(
                 depth=folder_depth,
                 folder_name=folder_path_items[-1],
-                parent_folder_name=folder_path_items[-2],
+                parent_folder_name="/".join(folder_path_items[:-1]),
             )
-        logger.info(f"CREATE {folder_path}")
-
-    def __processing_child_folders(self, depth: int, offset: int, parent_id: str):
-        """
-        Processes and repositions child folders under a specified parent folder after a move operation.
-
-        Args:
-            depth (int): The current depth of the folder being processed.
-            offset (int): The difference in depth between the original and new locations of the moved folder.
-            parent_id (str): The ID of the parent folder whose children are being processed.
-
-        Notes:
-            - This method is used to adjust the depth of child folders after a folder has been moved.
-            - It recursively updates the depth of each child folder based on the offset.
-        """
-
-        def processing_child(depth, parent_id, offset):
-            for item_id, item_info in sorted(self.directory.get(depth, {}).items()):
-                if item_info["parent_id"] == parent_id:
-                    self.directory.get(depth).pop(item_id)
-                    new_depth = depth - offset if offset > 0 else 2
-                    self.directory[new_depth][item_id] = item_info
-                    processing_child(depth + 1, item_id, offset)
-
-        processing_child(depth=depth, parent_id=parent_id, offset=offset)
+        self._output.write(f"CREATE {folder_path}")
 
     def __move_folder(
-        self, depth: int, new_depth: int, folder_name: str, new_folder_name: str
+        self, folder_path_items: List[str], new_folder_path_items: List[str]
     ):
         """
-        Moves a folder from its current location to a new location within the directory structure.
+        Moves a folder from its current location under a new parent folder.
 
         Args:
-            depth (int): The current depth of the folder to be moved.
-            new_depth (int): The target depth where the folder should be moved.
-            folder_name (str): The name of the folder to be moved.
-            new_folder_name (str): The name of the target folder where the folder should be moved.
+            folder_path_items (List[str]): The path components of the folder to be moved.
+            new_folder_path_items (List[str]): The path components of the target parent folder,
+                                               or an empty list to move the folder to the root.
 
         Notes:
-            - The method handles moving a folder by adjusting its position in the directory structure.
-            - The movement involves updating the folder's parent ID and recursively processing child folders.
+            - Moving only relinks the folder's parent pointer, so it costs O(1) after the two
+              path lookups regardless of the subtree size; depths are derived from the parents.
         """
-        offset_cursor = 0
+        folder_name = folder_path_items[-1]
+        new_folder_name = "/".join(new_folder_path_items) or "/"
 
-        parent_id, status = self._get_parent_folder_id(
-            parent_folder_name=folder_name, depth=depth
-        )
+        folder_id, status = self._get_folder_id(folder_path_items)
         if not status:
-            logger.warning(f"ERROR MOVE: {folder_name} doesn't exist on level")
-        transfer_data = self.directory.get(depth, {}).pop(parent_id)
-        new_parent_id, new_status = self._get_parent_folder_id(
-            parent_folder_name=new_folder_name, depth=new_depth
-        )
+            self._report_move_error("missing_folder", folder_name, new_folder_name)
+            return
+        new_parent_id, new_status = self._get_folder_id(new_folder_path_items)
         if not new_status:
-            logger.warning(
-                f"ERROR MOVE: {folder_name} to {new_folder_name} doesn't exist"
-            )
+            self._report_move_error("missing_parent", folder_name, new_folder_name)
+            return
+        if new_folder_path_items[: len(folder_path_items)] == folder_path_items:
+            self._report_move_error("invalid_move", folder_name, new_folder_name)
+            return
+        if self._storage.get_child(new_parent_id, folder_name) is not None:
+            self._report_move_error("already_exists", folder_name, new_folder_name)
+            return
 
-        if depth > new_depth:
-            offset_cursor = depth - (new_depth + 1)
-            self.directory[depth - offset_cursor][parent_id] = {
-                "name": transfer_data.get("name"),
-                "parent_id": new_parent_id,
-            }
-            self.__processing_child_folders(
-                depth + 1, offset=offset_cursor, parent_id=parent_id
-            )
+        self._invalidate_render_cache(folder_id)
+        self._storage.move_folder(folder_id, new_parent_id)
+        self._invalidate_render_cache(folder_id)
+        self._record_change("MOVE", "/".join(folder_path_items), new_folder_name)
 
-        if depth < new_depth:
-            offset_cursor = new_depth - depth
-
-        if depth == new_depth:
-            depth = 1
-            self.directory[depth - offset_cursor][parent_id] = {
-                "name": transfer_data.get("name"),
-                "parent_id": new_parent_id,
-            }
-            self.__processing_child_folders(
-                depth=depth, offset=offset_cursor, parent_id=parent_id
-            )
+    def _report_move_error(self, error: str, folder_name: str, new_folder_name: str):
+        """
+        Reports a MOVE that can't be applied, with the message of MOVE_ERRORS[error].
+        """
+        self._report_error(
+            error,
+            MOVE_ERRORS[error].format(
+                folder_name=folder_name, new_folder_name=new_folder_name
+            ),
+        )
 
     def _move_folder(self, folder_path: str, new_folder_path: str):
         """
@@ -223,54 +948,19 @@ class DirectoryManager:
         Args:
             folder_path (str): The current path of the folder to be moved. This should be a
                                hierarchical path like "/parent_folder/old_folder".
-            new_folder_path (str): The new path where the folder should be moved. This should be a
-                                   hierarchical path like "/new_parent_folder/new_folder".
+            new_folder_path (str): The path of the folder to move it into. This should be a
+                                   hierarchical path like "/new_parent_folder/new_folder",
+                                   or "/" to move the folder to the root level.
 
         Notes:
-            This method splits the folder paths into their respective components to determine
-            the current depth and new depth of the folder being moved. It then calls the internal
-            method to handle the actual moving process and prints a message confirming the move.
+            This method splits the folder paths into their respective components and calls the
+            internal method to handle the actual moving process, then prints a message confirming the move.
         """
-        folder_path_items = folder_path.strip("/").split("/")
-        folder_depth = len(folder_path_items) - 1
-        new_folder_path_items = new_folder_path.strip("/").split("/")
-        new_folder_depth = len(new_folder_path_items) - 1
-
         self.__move_folder(
-            depth=folder_depth,
-            folder_name=folder_path_items[-1],
-            new_depth=new_folder_depth,
-            new_folder_name=new_folder_path_items[-1],
+            folder_path_items=folder_path.strip("/").split("/"),
+            new_folder_path_items=self._split_path(new_folder_path),
         )
-        logger.info(f"MOVE {folder_path} {new_folder_path}")
-
-    def __delete_child_folders(self, depth: int, parent_id: str):
-        """
-        Recursively deletes all child folders under a specified parent folder.
-
-        Args:
-            depth (int): The current depth level in the directory hierarchy.
-            parent_id (str): The ID of the parent folder whose child folders are to be deleted.
-
-        Notes:
-            This method starts at the given depth and deletes all folders that have the specified
-            parent_id as their parent. It then recursively processes all subfolders at the next depth level.
-        """
-
-        def delete_child(depth, parent_id):
-            """
-            Helper function to recursively delete child folders.
-
-            Args:
-                depth (int): The current depth level in the directory hierarchy.
-                parent_id (str): The ID of the parent folder whose child folders are being deleted.
-            """
-            for item_id, item_info in sorted(self.directory.get(depth, {}).items()):
-                if item_info["parent_id"] == parent_id:
-                    self.directory.get(depth).pop(item_id)
-                    delete_child(depth + 1, item_id)
-
-        delete_child(depth=depth, parent_id=parent_id)
+        self._output.write(f"MOVE {folder_path} {new_folder_path}")
 
     def _delete_folder(self, folder_path: str):
         """
@@ -281,23 +971,74 @@ class DirectoryManager:
                                hierarchical path like "/parent_folder/child_folder".
 
         Prints:
-            An error message if the folder does not exist at the specified depth.
+            An error message if the folder does not exist at the specified path.
 
         Notes:
             This method assumes that the folder to be deleted is identified by its path,
-            and it recursively deletes all subfolders within the specified folder.
+            and it deletes all subfolders within the specified folder. The folder is only
+            detached from its parent here, which makes the whole subtree invisible at once;
+            its memory is reclaimed incrementally between the following commands.
         """
-        logger.info(f"DELETE {folder_path}")
-        folder_path_items = folder_path.strip("/").split("/")
-        folder_depth = len(folder_path_items) - 1
-        parent_id, status = self._get_parent_folder_id(
-            parent_folder_name=folder_path_items[-1], depth=folder_depth
-        )
+        self._output.write(f"DELETE {folder_path}")
+        self.__delete_folder(folder_path.strip("/").split("/"), folder_path)
+
+    def __delete_folder(self, folder_path_items: List[str], folder_path: str):
+        """
+        Detaches a folder from the tree and queues its subtree for reclamation.
+
+        Args:
+            folder_path_items (List[str]): The path components of the folder to delete.
+            folder_path (str): The path as given in the command, for the error message.
+        """
+        folder_id, status = self._get_folder_id(folder_path_items)
         if not status:
-            logger.warning(f"Cannot delete: {folder_path} doesn't exist on level")
+            self._report_error(
+                "missing_folder", f"Cannot delete: {folder_path} doesn't exist on level"
+            )
         else:
-            self.directory.get(folder_depth).pop(parent_id)
-            self.__delete_child_folders(depth=folder_depth + 1, parent_id=parent_id)
+            self._invalidate_render_cache(folder_id)
+            self._storage.remove_folder(folder_id)
+            self._record_change("DELETE", "/".join(folder_path_items))
+
+    @staticmethod
+    def _parse_list_arguments(arguments: List[str]) -> Tuple[dict, bool]:
+        """
+        Parses the arguments of a LIST command: "[PATH] [--depth N] [--limit K] [--after CURSOR]",
+        or "--since SEQ" alone.
+
+        Args:
+            arguments (List[str]): The whitespace-separated arguments following "LIST".
+
+        Returns:
+        - Tuple[dict, bool]: A tuple where:
+          - The first element holds the keyword arguments for `_show_directory`.
+          - The second element is a boolean indicating whether the arguments are valid.
+        """
+        options = {}
+        flags = {
+            "--depth": "depth",
+            "--limit": "limit",
+            "--after": "after",
+            "--since": "since",
+        }
+        items = iter(arguments)
+        for item in items:
+            if item in flags:
+                value = next(items, None)
+                if value is None:
+                    return {}, False
+                if item != "--after":
+                    if not value.isdecimal() or (int(value) == 0 and item != "--since"):
+                        return {}, False
+                    value = int(value)
+                options[flags[item]] = value
+            elif "folder_path" not in options:
+                options["folder_path"] = item
+            else:
+                return {}, False
+        if "since" in options and len(options) > 1:
+            return {}, False
+        return options, True
 
     def _command_line_parser(self, command_line: str):
         """
@@ -307,36 +1048,56 @@ class DirectoryManager:
         "COMMAND [ARG1] [ARG2]"
 
         Where:
-        - COMMAND is one of "CREATE", "LIST", "MOVE", or "DELETE".
-        - ARG1 and ARG2 are arguments depending on the command.
+        - COMMAND is one of "CREATE", "LIST", "MOVE", "DELETE", "FIND" or "COUNT".
+        - ARG1 and ARG2 are arguments depending on the command. LIST takes the optional
+          arguments "[PATH] [--depth N] [--limit K] [--after CURSOR]" or "--since SEQ", FIND a name or glob
+          pattern and COUNT an optional path.
 
         Args:
             command_line (str): The command line string to parse and execute.
 
         Actions:
             - If the command is "CREATE", calls `_add_folder` with `ARG1` as the folder path.
-            - If the command is "LIST", calls `_show_directory` to display the directory.
+            - If the command is "LIST", calls `_show_directory` with the parsed LIST arguments
+              to display the directory.
             - If the command is "MOVE", calls `_move_folder` with `ARG1` as the folder path
               and `ARG2` as the new folder path.
             - If the command is "DELETE", calls `_delete_folder` with `ARG1` as the folder path.
+            - If the command is "FIND", calls `_find_folders` with `ARG1` as the pattern.
+            - If the command is "COUNT", calls `_count_folders` with `ARG1` as the folder path.
         """
         parts = command_line.split(" ", 2)
         command, folder_path, new_folder_path = (parts + [None, None])[:3]
         if command == "CREATE":
             self._add_folder(folder_path=folder_path)
         if command == "LIST":
-            self._show_directory()
+            list_arguments = command_line.split()[1:]
+            options, status = self._parse_list_arguments(list_arguments)
+            if status:
+                self._show_directory(**options)
+            else:
+                self._report_error(
+                    "invalid_arguments",
+                    f"ERROR LIST: invalid arguments {' '.join(list_arguments)}",
+                )
         if command == "MOVE":
             self._move_folder(folder_path=folder_path, new_folder_path=new_folder_path)
         if command == "DELETE":
             self._delete_folder(folder_path=folder_path)
+        if command == "FIND":
+            self._find_folders(pattern=command_line[len("FIND ") :])
+        if command == "COUNT":
+            self._count_folders(folder_path=folder_path)
 
     def command_execute(self, command: str):
         """
         Executes a given command string by parsing and processing it.
 
         This method parses the command string and delegates the execution
-        to the appropriate method based on the parsed command.
+        to the appropriate method based on the parsed command. With persistence enabled,
+        mutating commands are appended to the write-ahead log before they run. Afterwards, up to
+        `reclaim_budget` folders of previously deleted subtrees are freed. With metrics enabled,
+        the latency of the command is recorded under its command type.
 
         Args:
             command (str): The command string to parse and execute.
@@ -345,7 +1106,224 @@ class DirectoryManager:
         Example:
             command_execute("CREATE /path/to/folder")
             command_execute("LIST")
+            command_execute("LIST /path/to --depth 1 --limit 50 --after folder")
+            command_execute("LIST --since 42")
             command_execute("MOVE /path/to/old_folder /path/to/new_folder")
             command_execute("DELETE /path/to/folder")
+            command_execute("FIND app*")
+            command_execute("COUNT /path/to")
+        """
+        self._execute(command, self._command_line_parser, command)
+
+    def _execute(self, command: str, handler: Callable, *args):
+        """
+        Runs one command: logs it, executes it, then reclaims memory and checkpoints if needed.
+
+        Args:
+            command (str): The command text, used for the write-ahead log, the output sink
+                           and the metrics.
+            handler (Callable): Executes the command when called with `args`.
+        """
+        timed = self.metrics is not None and self.metrics.enabled
+        if timed:
+            started = time.perf_counter_ns()
+        if self._persistence is not None:
+            self._persistence.log(command)
+        handler(*args)
+        self._output.end_command(command)
+        self._storage.reclaim(self.reclaim_budget, self._forget_rendering)
+        if self._persistence is not None and self._persistence.needs_checkpoint():
+            self.checkpoint()
+        if timed:
+            self.metrics.observe_command(
+                command.split(" ", 1)[0], time.perf_counter_ns() - started
+            )
+
+    def __replay_create(self, folder_path_items: List[str], command: str):
+        """
+        Executes a compiled CREATE, with the same errors and output as `_add_folder`.
+        """
+        parent_id, status = self._get_folder_id(folder_path_items[:-1])
+        if status:
+            self._insert_folder(parent_id, folder_path_items[-1])
+        else:
+            self._report_missing_parent("/".join(folder_path_items[:-1]))
+        self._output.write(command)
+
+    def __replay_move(
+        self,
+        folder_path_items: List[str],
+        new_folder_path_items: List[str],
+        command: str,
+    ):
+        """
+        Executes a compiled MOVE, with the same errors and output as `_move_folder`.
+        """
+        self.__move_folder(folder_path_items, new_folder_path_items)
+        self._output.write(command)
+
+    def __replay_delete(self, folder_path_items: List[str], command: str):
+        """
+        Executes a compiled DELETE, with the same errors and output as `_delete_folder`.
+        """
+        self._output.write(command)
+        self.__delete_folder(folder_path_items, command[len("DELETE ") :])
+
+    def replay(self, script: CommandScript):
+        """
+        Executes a compiled command script.
+
+        The commands behave exactly as if their text was passed to `command_execute`, including
+        the output, the write-ahead log and the metrics, but their paths arrive already split into
+        interned components, so no command line is parsed.
+
+        Args:
+            script (CommandScript): The script, compiled with `CommandScript.compile` or loaded
+                                    with `CommandScript.load`.
+
+        Raises:
+            ValueError: If the script holds an unknown opcode.
+        """
+        names, texts, code = script.names, script.texts, script.code
+        position, end = 0, len(code)
+        while position < end:
+            opcode = code[position]
+            if opcode == OP_TEXT:
+                self.command_execute(texts[code[position + 1]])
+                position += 2
+            elif opcode == OP_LIST:
+                self._execute("LIST", self._show_directory)
+                position += 1
+            elif opcode in (OP_CREATE, OP_DELETE, OP_MOVE):
+                size = code[position + 1]
+                position += 2
+                folder_path_items = [
+                    names[name_id] for name_id in code[position : position + size]
+                ]
+                position += size
+                folder_path = "/".join(folder_path_items)
+                if opcode == OP_CREATE:
+                    command = f"CREATE {folder_path}"
+                    self._execute(
+                        command, self.__replay_create, folder_path_items, command
+                    )
+                elif opcode == OP_DELETE:
+                    command = f"DELETE {folder_path}"
+                    self._execute(
+                        command, self.__replay_delete, folder_path_items, command
+                    )
+                elif opcode == OP_MOVE:
+                    size = code[position]
+                    position += 1
+                    new_folder_path_items = [
+                        names[name_id] for name_id in code[position : position + size]
+                    ]
+                    position += size
+                    command = (
+                        f"MOVE {folder_path} {'/'.join(new_folder_path_items) or '/'}"
+                    )
+                    self._execute(
+                        command,
+                        self.__replay_move,
+                        folder_path_items,
+                        new_folder_path_items,
+                        command,
+                    )
+            else:
+                raise ValueError(f"Unknown opcode {opcode} at position {position}")
+
+    def __capture_listing(self, listing: List[str]):
+        """
+        Executes a plain LIST and keeps a copy of its output lines in `listing`.
+        """
+        output, self._output = self._output, MemorySink()
+        try:
+            self._show_directory()
+            listing.extend(self._output.lines)
+        finally:
+            self._output = output
+        self._output.write_lines(listing)
+
+    def __simulate_create(self, folder_path: str, created: set, command: str):
+        """
+        Executes a CREATE inside a skipped subtree: only the set of its created paths is updated,
+        with the same errors and output as `_add_folder`.
+        """
+        parent_path, _, folder_name = folder_path.rpartition("/")
+        if parent_path not in created:
+            self._report_missing_parent(parent_path)
+        elif folder_path in created:
+            self._report_existing_folder(folder_name)
+        else:
+            created.add(folder_path)
+        self._output.write(command)
+
+    def __execute_batch(self, commands: List[str]):
+        """
+        Executes a window of commands, skipping the ones `execute_many` can prove redundant.
+        """
+        groups = find_transient_subtrees(commands)
+        created = {}
+        listing = None
+        for index, command in enumerate(commands):
+            start = groups.get(index)
+            if start == index:
+                folder_path_items = command[len("CREATE ") :].split("/")
+                parent_id, status = self._get_folder_id(folder_path_items[:-1])
+                if status and (
+                    self._storage.get_child(parent_id, folder_path_items[-1]) is None
+                ):
+                    created[start] = {command[len("CREATE ") :]}
+                    self._execute(command, self._output.write, command)
+                    continue
+                created[start] = None
+            elif start is not None and created[start] is not None:
+                if command.startswith("CREATE "):
+                    self._execute(
+                        command,
+                        self.__simulate_create,
+                        command[len("CREATE ") :],
+                        created[start],
+                        command,
+                    )
+                else:
+                    self._execute(command, self._output.write, command)
+                continue
+
+            if command == "LIST":
+                if listing is None:
+                    listing = []
+                    self._execute(command, self.__capture_listing, listing)
+                else:
+                    self._execute(command, self._output.write_lines, listing)
+                continue
+            listing = None
+            self.command_execute(command)
+
+    def execute_many(self, commands: Iterable[str], window: int = BATCH_WINDOW):
+        """
+        Executes a stream of commands, skipping the work that cancels out within a window.
+
+        The result is exactly the same as calling `command_execute` on every command: the same
+        final tree, output lines (echoes included), warnings, write-ahead log and metrics. Only the
+        change log differs: the skipped folders below are never applied, so they don't appear in it.
+        Within each window of commands:
+            - A folder that is created and deleted again before anything could observe it is
+              never added to the tree, nor are the subfolders created inside it meanwhile; their
+              commands only print their echo and the errors they would have raised.
+            - A plain LIST that follows another one with no other command in between reuses
+              the output of the first.
+
+        Args:
+            commands (Iterable[str]): The commands, e.g. the lines of a command file.
+            window (int, optional): The number of commands analyzed at once. Redundant commands
+                                    are only detected within the same window.
         """
-        self._command_line_parser(command)
+        batch = []
+        for command in commands:
+            batch.append(command)
+            if len(batch) >= window:
+                self.__execute_batch(batch)
+                batch = []
+        if batch:
+            self.__execute_batch(batch)
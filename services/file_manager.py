@@ -1,8 +1,38 @@
+import codecs
+import cProfile
+import gzip
+import io
 import os
+import pstats
+import re
+import sys
+import threading
+import tracemalloc
+from typing import BinaryIO, Iterator, List, Optional, Sequence, Union
 
 from loguru import logger
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 from services import DirectoryManager
+from services.compiler import CommandScript
+from services.metrics import Metrics
+from services.output import LoguruSink, OutputSink
+from services.persistence import Persistence
+from services.pipeline import prefetch
+from services.sharding import ShardedExecutor
+from services.storage import DictStorage, Storage
+
+STDIN_PATH = "-"
+DEFAULT_BUFFER_SIZE = 128 * 1024
+DEFAULT_READ_AHEAD = 16
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+PROFILERS = ("cprofile", "tracemalloc")
+PROFILE_TOP = 20
 
 
 class FileManger:
@@ -10,50 +40,352 @@ class FileManger:
     A class to manage file operations and directory updates based on file contents.
 
     Attributes:
-        file_path (str): The path to the file to be processed.
+        file_path (Union[str, Sequence[str]]): The file or directory to be processed, "-" to read
+            from stdin, or a list of them.
+        buffer_size (int): The size in bytes of the read buffer.
+        read_ahead (int): The number of buffers read and parsed ahead of the execution.
+        output (OutputSink): The sink receiving the command results.
         directory_manager (DirectoryManager): An instance of DirectoryManager for managing directory operations.
     """
 
-    def __init__(self, file_path: str):
+    def __init__(
+        self,
+        file_path: Union[str, Sequence[str]],
+        storage: Optional[Storage] = None,
+        buffer_size: int = DEFAULT_BUFFER_SIZE,
+        output: Optional[OutputSink] = None,
+        persistence: Optional[Persistence] = None,
+        metrics: Optional[Metrics] = None,
+        profiler: Optional[str] = None,
+        profile_path: Optional[str] = None,
+        batch_window: Optional[int] = None,
+        workers: Optional[int] = None,
+        read_ahead: int = DEFAULT_READ_AHEAD,
+    ):
         """
         Initializes the FileManger with the path to the file.
 
         Args:
-            file_path (str): The path to the file to be processed.
+            file_path (Union[str, Sequence[str]]): The path to the file to be processed, or "-"
+                to read from stdin, or a list of paths processed one after the other. A directory
+                stands for the files in it, in natural name order ("cmd.2" before "cmd.10").
+                Gzip and zstd compressed files are detected and decompressed on the fly, and
+                scripts compiled with `compile` are replayed without parsing.
+            storage (Storage, optional): The storage engine for the DirectoryManager.
+            buffer_size (int, optional): The size in bytes of the read buffer.
+            output (OutputSink, optional): The sink receiving the command results. Defaults to a LoguruSink.
+            persistence (Persistence, optional): Snapshot and write-ahead log storage to restore
+                the directory from and to log the processed commands to.
+            metrics (Metrics, optional): Collects command latencies and error counts.
+            profiler (str, optional): "cprofile" or "tracemalloc" to profile the processing of
+                the file. The top entries are logged once the file is processed.
+            profile_path (str, optional): Where to dump the raw cProfile stats, loadable with pstats.
+            batch_window (int, optional): Execute the commands through `execute_many` with this
+                window, skipping the commands that cancel out. By default they run one by one.
+            workers (int, optional): Execute the commands on this many worker processes, each
+                owning a shard of the top-level folders on a new engine of the type of
+                `storage`. Can't be combined with persistence, metrics, batch_window or an
+                on-disk SQLiteStorage.
+            read_ahead (int, optional): Read and decompress the files on one thread and split
+                them into lines on another, each stage running up to this many buffers ahead,
+                so the commands execute without waiting for I/O. 0 does all of it inline.
         """
+        if workers is not None and (
+            persistence is not None or metrics is not None or batch_window is not None
+        ):
+            raise ValueError(
+                "workers can't be combined with persistence, metrics or batch_window"
+            )
+        if workers is not None and getattr(storage, "path", ":memory:") != ":memory:":
+            # Every shard opens a new, empty engine of the same type in its own process.
+            raise ValueError("workers can't be combined with an on-disk storage engine")
+        if profiler is not None and profiler not in PROFILERS:
+            raise ValueError(
+                f"Unknown profiler {profiler}, expected one of {PROFILERS}"
+            )
         self.file_path = file_path
-        self.directory_manager = DirectoryManager()
+        self.storage = storage
+        self.buffer_size = buffer_size
+        self.read_ahead = read_ahead
+        self.output = output if output is not None else LoguruSink()
+        self.persistence = persistence
+        self.profiler = profiler
+        self.profile_path = profile_path
+        self.batch_window = batch_window
+        self.workers = workers
+        if workers is not None:
+            self.directory_manager = ShardedExecutor(
+                workers=workers,
+                storage_class=type(storage) if storage is not None else DictStorage,
+                output=self.output,
+            )
+        else:
+            self.directory_manager = DirectoryManager(
+                storage=storage,
+                output=self.output,
+                persistence=persistence,
+                metrics=metrics,
+            )
 
-    def _check_file_existence(self) -> bool:
+    @staticmethod
+    def _natural_key(file_name: str) -> list:
         """
-        Checks if the file at the specified file path exists.
+        Sorts file names with their numbers compared by value, e.g. "cmd.2" before "cmd.10".
+        """
+        return [
+            int(part) if part.isdecimal() else part
+            for part in re.split(r"(\d+)", file_name)
+        ]
+
+    def _input_paths(self) -> Optional[List[str]]:
+        """
+        Lists the files to process, in order, with the directories replaced by their files.
 
         Returns:
-            bool: True if the file exists, False otherwise. If the file does not exist, a message is printed.
+            Optional[List[str]]: The file paths, or None if a path does not exist or a directory
+            holds no files, in which case a message is printed.
         """
-        if not os.path.isfile(self.file_path):
-            logger.warning(f"File not found: {self.file_path}")
-            return False
-        return True
+        paths = [self.file_path] if isinstance(self.file_path, str) else self.file_path
+        file_paths = []
+        for path in paths:
+            if path == STDIN_PATH or os.path.isfile(path):
+                file_paths.append(path)
+            elif os.path.isdir(path):
+                with os.scandir(path) as entries:
+                    file_names = [entry.name for entry in entries if entry.is_file()]
+                if not file_names:
+                    logger.warning(f"No files in {path}")
+                    return None
+                file_paths.extend(
+                    os.path.join(path, file_name)
+                    for file_name in sorted(file_names, key=self._natural_key)
+                )
+            else:
+                logger.warning(f"File not found: {path}")
+                return None
+        return file_paths
+
+    def _open_binary(self, file_path: str) -> BinaryIO:
+        """
+        Opens a file (or stdin) as a buffered binary stream.
+
+        Returns:
+            BinaryIO: A buffered reader that supports peeking at the first bytes.
+        """
+        if file_path == STDIN_PATH:
+            return io.BufferedReader(
+                io.FileIO(sys.stdin.fileno(), "rb", closefd=False),
+                buffer_size=self.buffer_size,
+            )
+        return open(file_path, "rb", buffering=self.buffer_size)
+
+    def _open_decompressed(self, raw: BinaryIO, file_path: str) -> Optional[BinaryIO]:
+        """
+        Wraps a binary stream into a decompressing one if it starts with a gzip or zstd
+        magic number.
+
+        Args:
+            raw (BinaryIO): The buffered binary stream returned by `_open_binary`.
+            file_path (str): The path of the file, for the warning.
+
+        Returns:
+            Optional[BinaryIO]: The stream of the file contents, or None if it can't be decompressed.
+        """
+        magic = raw.peek(len(ZSTD_MAGIC))[: len(ZSTD_MAGIC)]
+        if magic.startswith(GZIP_MAGIC):
+            return gzip.GzipFile(fileobj=raw, mode="rb")
+        if magic == ZSTD_MAGIC:
+            if zstandard is None:
+                logger.warning(
+                    f"Cannot read {file_path}: the zstandard package is required for zstd files"
+                )
+                return None
+            return zstandard.ZstdDecompressor().stream_reader(
+                raw, read_size=self.buffer_size
+            )
+        return raw
+
+    def _read_lines(self, file_path: str) -> Iterator[str]:
+        """
+        Streams the commands of a file one line at a time.
+
+        Only the read buffer and the current line are held in memory, so memory usage does not
+        grow with the size of the file.
+
+        Yields:
+            str: Each line of the file with surrounding whitespace stripped.
+        """
+        with self._open_binary(file_path) as raw:
+            stream = self._open_decompressed(raw, file_path)
+            if stream is None:
+                return
+            for line in io.TextIOWrapper(stream, encoding="utf-8"):
+                yield line.strip()
+
+    def _read_chunks(self, file_paths: List[str]) -> Iterator[Optional[bytes]]:
+        """
+        Reads and decompresses files, the first stage of `_iter_lines`.
 
-    def _file_processing(self):
+        Yields:
+            Optional[bytes]: The contents of the files, `buffer_size` bytes at a time, with None
+            after the end of every file.
         """
-        Processes the file at the specified file path. Reads each line from the file and executes
-        directory commands using the DirectoryManager instance.
+        for file_path in file_paths:
+            with self._open_binary(file_path) as raw:
+                stream = self._open_decompressed(raw, file_path)
+                if stream is not None:
+                    for chunk in iter(lambda: stream.read(self.buffer_size), b""):
+                        yield chunk
+            yield None
 
-        Assumes that each line in the file represents a command to be executed.
+    @staticmethod
+    def _split_lines(chunks: Iterator[Optional[bytes]]) -> Iterator[List[str]]:
         """
-        with open(self.file_path, "r") as file:
-            for line in file.readlines():
-                self.directory_manager.command_execute(command=line.strip())
+        Decodes the chunks of `_read_chunks` and splits them into lines, the second stage of
+        `_iter_lines`. The lines are the same as those of `_read_lines`: universal newlines,
+        surrounding whitespace stripped and no line joined across the end of a file.
+
+        Yields:
+            List[str]: The complete lines of every chunk.
+        """
+        decoder, pending = None, ""
+        for chunk in chunks:
+            if decoder is None:
+                decoder = io.IncrementalNewlineDecoder(
+                    codecs.getincrementaldecoder("utf-8")(), translate=True
+                )
+            lines = (pending + decoder.decode(chunk or b"", final=chunk is None)).split(
+                "\n"
+            )
+            pending = lines.pop()
+            if chunk is None:
+                if pending:
+                    lines.append(pending)
+                decoder, pending = None, ""
+            if lines:
+                yield [line.strip() for line in lines]
+
+    def _iter_lines(self, file_paths: List[str]) -> Iterator[str]:
+        """
+        Streams the commands of several files one line at a time.
+
+        With `read_ahead`, reading and decompressing run on one thread and splitting the lines
+        on another, connected by bounded queues, so the caller executing the commands only waits
+        when it is faster than the disk, and memory stays bounded by the queues.
+
+        Yields:
+            str: Each line of the files with surrounding whitespace stripped.
+        """
+        if not self.read_ahead:
+            for file_path in file_paths:
+                yield from self._read_lines(file_path)
+            return
+        stop = threading.Event()
+        chunks = prefetch(self._read_chunks(file_paths), self.read_ahead, stop)
+        for lines in prefetch(self._split_lines(chunks), self.read_ahead, stop):
+            yield from lines
+
+    def _file_processing(self, file_paths: List[str]):
+        """
+        Processes the files in order. Streams each line from the files and executes directory
+        commands using the DirectoryManager instance.
+
+        Assumes that each line in a file represents a command to be executed, unless the file
+        is a compiled command script, which is replayed as a whole. Consecutive command files are
+        streamed as one, so `batch_window` windows span across them.
+        """
+        text_paths = []
+        for file_path in file_paths + [None]:
+            if file_path is not None and (
+                file_path == STDIN_PATH or not CommandScript.is_script(file_path)
+            ):
+                text_paths.append(file_path)
+                continue
+            if text_paths:
+                self._execute_lines(self._iter_lines(text_paths))
+                text_paths = []
+            if file_path is not None:
+                self.directory_manager.replay(CommandScript.load(file_path))
+
+    def _execute_lines(self, lines: Iterator[str]):
+        """
+        Executes a stream of commands, one by one or in windows of `batch_window`.
+        """
+        if self.batch_window is not None:
+            self.directory_manager.execute_many(lines, self.batch_window)
+            return
+        for line in lines:
+            self.directory_manager.command_execute(command=line)
+
+    def _profiled_processing(self, file_paths: List[str]):
+        """
+        Runs `_file_processing` under the selected profiler and logs its top entries:
+        the functions with the highest cumulative time, or the lines allocating the most memory.
+        cProfile only sees the executing thread, not the `read_ahead` stages.
+        """
+        if self.profiler == "cprofile":
+            profile = cProfile.Profile()
+            profile.runcall(self._file_processing, file_paths)
+            if self.profile_path is not None:
+                profile.dump_stats(self.profile_path)
+            report = io.StringIO()
+            pstats.Stats(profile, stream=report).sort_stats("cumulative").print_stats(
+                PROFILE_TOP
+            )
+            logger.info(f"cProfile report:\n{report.getvalue()}")
+        else:
+            tracemalloc.start()
+            try:
+                self._file_processing(file_paths)
+                snapshot = tracemalloc.take_snapshot()
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+            statistics = snapshot.statistics("lineno")[:PROFILE_TOP]
+            logger.info(
+                f"tracemalloc report (peak {peak / 1024:.1f} KiB):\n"
+                + "\n".join(str(statistic) for statistic in statistics)
+            )
+
+    def compile(self, script_path: str) -> bool:
+        """
+        Compiles the commands of the files into a binary command script for fast replays.
+
+        Args:
+            script_path (str): The path of the compiled script to write.
+
+        Returns:
+            bool: True if the files exist and were compiled, False otherwise.
+        """
+        file_paths = self._input_paths()
+        if file_paths is None:
+            return False
+        CommandScript.compile(self._iter_lines(file_paths)).save(script_path)
+        return True
 
     def execute(self):
         """
         Executes the file processing workflow.
 
-        First, it checks if the file exists. If the file exists, it proceeds to process
-        the file and update the directory.
+        First, it checks if the files exist. If they all exist, it proceeds to process
+        them and update the directory. The worker processes, the output sink, the
+        write-ahead log and the storage engine are closed once the files are processed, which
+        flushes any buffered results.
         """
-        file_existence = self._check_file_existence()
-        if file_existence:
-            self._file_processing()
+        file_paths = self._input_paths()
+        if file_paths is None and self.workers is not None:
+            self.directory_manager.close()
+        if file_paths is not None:
+            try:
+                if self.profiler is None:
+                    self._file_processing(file_paths)
+                else:
+                    self._profiled_processing(file_paths)
+            finally:
+                if self.workers is not None:
+                    self.directory_manager.close()
+                self.output.close()
+                if self.persistence is not None:
+                    self.persistence.close()
+                if self.storage is not None:
+                    self.storage.close()
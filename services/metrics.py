@@ -0,0 +1,224 @@
+import bisect
+import json
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+from .output import OutputSink
+
+LATENCY_BUCKETS = (
+    1e-6,
+    5e-6,
+    1e-5,
+    5e-5,
+    1e-4,
+    5e-4,
+    1e-3,
+    5e-3,
+    1e-2,
+    5e-2,
+    1e-1,
+    5e-1,
+    1.0,
+    5.0,
+)
+COMMAND_TYPES = frozenset(("CREATE", "LIST", "MOVE", "DELETE", "FIND", "COUNT"))
+UNKNOWN_COMMAND = "UNKNOWN"
+
+
+def escape_label(value: str) -> str:
+    """
+    Escapes a Prometheus label value: backslashes, double quotes and newlines.
+    """
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class LatencyHistogram:
+    """
+    A cumulative-friendly latency histogram with fixed bucket bounds (in seconds).
+    """
+
+    __slots__ = ("_bounds_ns", "counts", "count", "total_ns")
+
+    def __init__(self):
+        self._bounds_ns = [int(bound * 1e9) for bound in LATENCY_BUCKETS]
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total_ns = 0
+
+    def observe(self, duration_ns: int):
+        """
+        Records one duration in nanoseconds.
+        """
+        self.counts[bisect.bisect_left(self._bounds_ns, duration_ns)] += 1
+        self.count += 1
+        self.total_ns += duration_ns
+
+    def cumulative_counts(self) -> List[int]:
+        """
+        Returns the number of observations at or below each bound, the last one being +Inf.
+        """
+        cumulative, total = [], 0
+        for count in self.counts:
+            total += count
+            cumulative.append(total)
+        return cumulative
+
+
+class Metrics:
+    """
+    Low-overhead instrumentation of a DirectoryManager.
+
+    Records a latency histogram per command type, error counters, and the time spent writing
+    results to the output sink versus the rest of the command (index work). Recording can be
+    switched on and off at runtime through `enabled`; the folder counts per depth are computed
+    from the tree only when the metrics are exported.
+    """
+
+    def __init__(self, enabled: bool = True):
+        """
+        Initializes empty metrics.
+
+        Args:
+            enabled (bool, optional): Whether recording starts enabled.
+        """
+        self.enabled = enabled
+        self.folder_counter: Optional[Callable[[], Dict[int, int]]] = None
+        self.reset()
+
+    def reset(self):
+        """
+        Clears all recorded values.
+        """
+        self.latencies: Dict[str, LatencyHistogram] = {}
+        self.errors: Dict[str, int] = {}
+        self.command_ns = 0
+        self.output_ns = 0
+
+    def observe_command(self, command_type: str, duration_ns: int):
+        """
+        Records the duration of one command. Anything but a known command type, e.g. a typo or
+        a blank line, is recorded as UNKNOWN, so the number of histograms stays bounded.
+        """
+        if command_type not in COMMAND_TYPES:
+            command_type = UNKNOWN_COMMAND
+        histogram = self.latencies.get(command_type)
+        if histogram is None:
+            histogram = self.latencies[command_type] = LatencyHistogram()
+        histogram.observe(duration_ns)
+        self.command_ns += duration_ns
+
+    def count_error(self, error: str):
+        """
+        Increments the counter of an error kind, e.g. "missing_parent".
+        """
+        if self.enabled:
+            self.errors[error] = self.errors.get(error, 0) + 1
+
+    def to_json(self) -> str:
+        """
+        Returns a JSON snapshot of the metrics.
+        """
+        return json.dumps(
+            {
+                "commands": {
+                    command_type: {
+                        "count": histogram.count,
+                        "sum_seconds": histogram.total_ns / 1e9,
+                        "buckets": dict(
+                            zip(
+                                [str(bound) for bound in LATENCY_BUCKETS] + ["+Inf"],
+                                histogram.cumulative_counts(),
+                            )
+                        ),
+                    }
+                    for command_type, histogram in self.latencies.items()
+                },
+                "errors": self.errors,
+                "index_seconds": (self.command_ns - self.output_ns) / 1e9,
+                "output_seconds": self.output_ns / 1e9,
+                "folders_per_depth": (
+                    self.folder_counter() if self.folder_counter is not None else {}
+                ),
+            }
+        )
+
+    def to_prometheus(self) -> str:
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        lines = [
+            "# HELP directory_command_duration_seconds Duration of the directory commands.",
+            "# TYPE directory_command_duration_seconds histogram",
+        ]
+        for command_type, histogram in sorted(self.latencies.items()):
+            command_type = escape_label(command_type)
+            bounds = [f"{bound:g}" for bound in LATENCY_BUCKETS] + ["+Inf"]
+            for bound, count in zip(bounds, histogram.cumulative_counts()):
+                lines.append(
+                    f'directory_command_duration_seconds_bucket{{command="{command_type}",le="{bound}"}} {count}'
+                )
+            lines.append(
+                f'directory_command_duration_seconds_sum{{command="{command_type}"}} {histogram.total_ns / 1e9}'
+            )
+            lines.append(
+                f'directory_command_duration_seconds_count{{command="{command_type}"}} {histogram.count}'
+            )
+        lines += [
+            "# HELP directory_errors_total Commands that failed, by error kind.",
+            "# TYPE directory_errors_total counter",
+        ]
+        for error, count in sorted(self.errors.items()):
+            lines.append(
+                f'directory_errors_total{{error="{escape_label(error)}"}} {count}'
+            )
+        lines += [
+            "# HELP directory_phase_seconds_total Time spent per phase of the commands.",
+            "# TYPE directory_phase_seconds_total counter",
+            f'directory_phase_seconds_total{{phase="index"}} {(self.command_ns - self.output_ns) / 1e9}',
+            f'directory_phase_seconds_total{{phase="output"}} {self.output_ns / 1e9}',
+        ]
+        if self.folder_counter is not None:
+            lines += [
+                "# HELP directory_folders Number of folders per depth level.",
+                "# TYPE directory_folders gauge",
+            ]
+            for depth, count in sorted(self.folder_counter().items()):
+                lines.append(f'directory_folders{{depth="{depth}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+class TimedSink(OutputSink):
+    """
+    Wraps an output sink and adds the time spent in it to `Metrics.output_ns`.
+    """
+
+    def __init__(self, sink: OutputSink, metrics: Metrics):
+        self.sink = sink
+        self.metrics = metrics
+
+    def write(self, line: str):
+        if not self.metrics.enabled:
+            return self.sink.write(line)
+        started = time.perf_counter_ns()
+        self.sink.write(line)
+        self.metrics.output_ns += time.perf_counter_ns() - started
+
+    def write_lines(self, lines: Iterable[str]):
+        if not self.metrics.enabled:
+            return self.sink.write_lines(lines)
+        started = time.perf_counter_ns()
+        self.sink.write_lines(lines)
+        self.metrics.output_ns += time.perf_counter_ns() - started
+
+    def end_command(self, command: str):
+        if not self.metrics.enabled:
+            return self.sink.end_command(command)
+        started = time.perf_counter_ns()
+        self.sink.end_command(command)
+        self.metrics.output_ns += time.perf_counter_ns() - started
+
+    def flush(self):
+        self.sink.flush()
+
+    def close(self):
+        self.sink.close()
@@ -0,0 +1,108 @@
+from typing import Dict, Iterator, List, Set
+
+
+def _is_canonical(folder_path: str) -> bool:
+    """
+    Returns True if a path is written in canonical form ("a/b", no empty components).
+    """
+    return (
+        bool(folder_path)
+        and folder_path[0] != "/"
+        and folder_path[-1] != "/"
+        and "//" not in folder_path
+    )
+
+
+def _ancestors(folder_path: str) -> Iterator[str]:
+    """
+    Yields the paths of the ancestors of a canonical path, from the top-level folder down.
+    """
+    index = folder_path.find("/")
+    while index != -1:
+        yield folder_path[:index]
+        index = folder_path.find("/", index + 1)
+
+
+def find_transient_subtrees(commands: List[str]) -> Dict[int, int]:
+    """
+    Finds the folders of a window of commands that are created and deleted again unobserved.
+
+    A group starts with "CREATE p" and ends with a later "DELETE p". In between, the only commands
+    touching the path p, its ancestors or its descendants must be CREATEs of descendants of p, and
+    there must be no LIST nor any command with a non-canonical path. Whether a group can really
+    be skipped also depends on the tree at run time (p must not exist yet and its parent must
+    exist), which `DirectoryManager.execute_many` checks when it reaches the first command of
+    the group.
+
+    Args:
+        commands (List[str]): The window of text commands.
+
+    Returns:
+        Dict[int, int]: {index of a command of a group: index of the CREATE starting the group}.
+    """
+    deleted = {command[7:] for command in commands if command.startswith("DELETE ")}
+    groups = {}
+    if not deleted:
+        return groups
+    open_creates: Dict[str, List[int]] = {}
+    open_by_prefix: Dict[str, Set[str]] = {}
+
+    def close(folder_path: str) -> List[int]:
+        members = open_creates.pop(folder_path)
+        for prefix in [*_ancestors(folder_path), folder_path]:
+            open_paths = open_by_prefix[prefix]
+            open_paths.discard(folder_path)
+            if not open_paths:
+                del open_by_prefix[prefix]
+        return members
+
+    for index, command in enumerate(commands):
+        command_type, _, arguments = command.partition(" ")
+        is_create = command_type == "CREATE"
+        if not open_creates and not (is_create and arguments in deleted):
+            continue
+
+        if command_type in ("CREATE", "DELETE") and _is_canonical(arguments):
+            touched = [arguments] if " " not in arguments else None
+        elif command_type == "MOVE":
+            folder_path, _, new_folder_path = arguments.partition(" ")
+            touched = None
+            if _is_canonical(folder_path):
+                folder_name = folder_path.rpartition("/")[2]
+                if new_folder_path == "/":
+                    touched = [folder_path, folder_name]
+                elif _is_canonical(new_folder_path):
+                    touched = [folder_path, f"{new_folder_path}/{folder_name}"]
+        else:
+            touched = None
+        if touched is None:
+            open_creates.clear()
+            open_by_prefix.clear()
+            continue
+
+        folder_path = touched[0]
+        if command_type == "DELETE" and folder_path in open_creates:
+            members = close(folder_path)
+            for member in members:
+                groups[member] = members[0]
+            groups[index] = members[0]
+
+        for touched_path in touched:
+            ancestors = [
+                path for path in _ancestors(touched_path) if path in open_creates
+            ]
+            descendants = list(open_by_prefix.get(touched_path, ()))
+            for open_path in ancestors:
+                if is_create:
+                    open_creates[open_path].append(index)
+                elif open_path in open_creates:
+                    close(open_path)
+            for open_path in descendants:
+                if open_path in open_creates:
+                    close(open_path)
+
+        if is_create and folder_path in deleted:
+            open_creates[folder_path] = [index]
+            for prefix in [*_ancestors(folder_path), folder_path]:
+                open_by_prefix.setdefault(prefix, set()).add(folder_path)
+    return groups
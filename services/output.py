@@ -0,0 +1,214 @@
+import json
+import queue
+import sys
+import threading
+from typing import Iterable, List, Optional, TextIO
+
+from loguru import logger
+
+DEFAULT_BATCH_SIZE = 4096
+DEFAULT_QUEUE_SIZE = 64
+
+
+class OutputSink:
+    """
+    Interface of the sinks that receive the results of the DirectoryManager commands.
+
+    Diagnostics (warnings and errors) keep going through loguru; a sink only receives the result
+    lines, such as the command echoes and the LIST output.
+    """
+
+    def write(self, line: str):
+        """
+        Writes one result line.
+        """
+        raise NotImplementedError
+
+    def write_lines(self, lines: Iterable[str]):
+        """
+        Writes several result lines at once, e.g. a rendered LIST block.
+        """
+        for line in lines:
+            self.write(line)
+
+    def end_command(self, command: str):
+        """
+        Marks the end of the output of a command.
+        """
+
+    def flush(self):
+        """
+        Forces all pending lines out.
+        """
+
+    def close(self):
+        """
+        Flushes the pending lines and releases the sink's resources.
+        """
+        self.flush()
+
+
+class LoguruSink(OutputSink):
+    """
+    The default sink: every result line is logged with `logger.info`.
+    """
+
+    def write(self, line: str):
+        logger.info(line)
+
+
+class NullSink(OutputSink):
+    """
+    A sink that drops all results, for quiet runs and benchmarks.
+    """
+
+    def write(self, line: str):
+        pass
+
+    def write_lines(self, lines: Iterable[str]):
+        pass
+
+
+class MemorySink(OutputSink):
+    """
+    Keeps the result lines in memory, in `lines`.
+    """
+
+    def __init__(self):
+        self.lines: List[str] = []
+
+    def write(self, line: str):
+        self.lines.append(line)
+
+    def write_lines(self, lines: Iterable[str]):
+        self.lines.extend(lines)
+
+
+class BufferedSink(OutputSink):
+    """
+    Writes result lines to a text stream in batches.
+
+    Lines are joined and written once `batch_size` of them are pending, so the cost of the
+    stream I/O is paid once per batch instead of once per line. With `background=True` the
+    batches are handed over to a writer thread through a bounded queue, so command execution
+    does not wait on the stream unless the writer falls behind by more than `queue_size` batches.
+    If the writer thread fails to write, e.g. on a full disk, the sink stops accepting lines and
+    the error is raised by the next `write`, `flush` or `close`.
+    """
+
+    def __init__(
+        self,
+        stream: Optional[TextIO] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        background: bool = False,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+    ):
+        """
+        Initializes the sink.
+
+        Args:
+            stream (TextIO, optional): The stream to write to. Defaults to stdout.
+            batch_size (int, optional): The number of lines written at once.
+            background (bool, optional): Whether to write the batches on a background thread.
+            queue_size (int, optional): The maximum number of batches waiting for the writer thread.
+        """
+        self.stream = stream if stream is not None else sys.stdout
+        self.batch_size = batch_size
+        self._batch = []
+        self._queue = None
+        self._writer = None
+        self._error: Optional[Exception] = None
+        if background:
+            self._queue = queue.Queue(maxsize=queue_size)
+            self._writer = threading.Thread(target=self.__write_batches, daemon=True)
+            self._writer.start()
+
+    def __write_batches(self):
+        """
+        Writer thread loop: writes the queued batches until it receives None. After a failed
+        write, the remaining batches are dropped, so the producer never blocks on a full queue.
+        """
+        while True:
+            text = self._queue.get()
+            try:
+                if text is None:
+                    return
+                if self._error is None:
+                    self.stream.write(text)
+            except Exception as error:
+                self._error = error
+            finally:
+                self._queue.task_done()
+
+    def _raise_error(self):
+        """
+        Raises the error of the writer thread, if it failed, dropping the pending lines.
+        """
+        if self._error is not None:
+            self._batch = []
+            raise self._error
+
+    def _flush_batch(self):
+        """
+        Writes the pending batch to the stream, or hands it over to the writer thread.
+        """
+        if not self._batch:
+            return
+        self._raise_error()
+        text = "\n".join(self._batch) + "\n"
+        self._batch = []
+        if self._queue is not None:
+            self._queue.put(text)
+        else:
+            self.stream.write(text)
+
+    def write(self, line: str):
+        self._raise_error()
+        self._batch.append(line)
+        if len(self._batch) >= self.batch_size:
+            self._flush_batch()
+
+    def write_lines(self, lines: Iterable[str]):
+        self._raise_error()
+        self._batch.extend(lines)
+        if len(self._batch) >= self.batch_size:
+            self._flush_batch()
+
+    def flush(self):
+        self._flush_batch()
+        if self._queue is not None:
+            self._queue.join()
+        self._raise_error()
+        self.stream.flush()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            if self._writer is not None:
+                self._queue.put(None)
+                self._writer.join()
+                self._queue = self._writer = None
+
+
+class JsonLinesSink(BufferedSink):
+    """
+    Writes one JSON object per command: {"command": "LIST", "output": ["LIST", "foods", ...]}.
+    """
+
+    def __init__(self, *args, **kwargs):
+        """
+        Initializes the sink; takes the same arguments as BufferedSink.
+        """
+        super().__init__(*args, **kwargs)
+        self._output: List[str] = []
+
+    def write(self, line: str):
+        self._output.append(line)
+
+    def write_lines(self, lines: Iterable[str]):
+        self._output.extend(lines)
+
+    def end_command(self, command: str):
+        super().write(json.dumps({"command": command, "output": self._output}))
+        self._output = []
@@ -0,0 +1,179 @@
+import mmap
+import os
+import struct
+from typing import Callable, Optional
+
+from loguru import logger
+
+from .storage import ROOT_ID, Storage
+
+SNAPSHOT_MAGIC = b"DIRSNAP1"
+SNAPSHOT_HEADER = struct.Struct("<8sQQ")
+SNAPSHOT_RECORD = struct.Struct("<qI")
+WRITE_BUFFER_SIZE = 1024 * 1024
+MUTATING_COMMANDS = ("CREATE", "MOVE", "DELETE")
+
+
+class Persistence:
+    """
+    Persists a directory tree as a binary snapshot plus a write-ahead log (WAL) of commands.
+
+    Every mutating command gets a sequence number and is appended to the WAL before it runs.
+    A checkpoint writes a snapshot of the whole tree tagged with the last sequence number and
+    truncates the WAL, so a restart only loads the snapshot and replays the commands logged since.
+
+    Snapshot format (little endian): a header (magic, sequence number, folder count) followed by
+    one record per folder (parent record index or -1 for the root, name length, UTF-8 name), with
+    every parent stored before its children.
+    """
+
+    def __init__(
+        self,
+        snapshot_path: str,
+        wal_path: str,
+        checkpoint_interval: Optional[int] = None,
+        fsync: bool = False,
+    ):
+        """
+        Initializes the persistence layer.
+
+        Args:
+            snapshot_path (str): The path of the snapshot file.
+            wal_path (str): The path of the write-ahead log.
+            checkpoint_interval (int, optional): Take a checkpoint automatically after this many
+                logged commands. By default checkpoints are only taken on request.
+            fsync (bool, optional): Whether to fsync the WAL after every command, so that logged
+                commands survive an operating system crash and not only a process crash.
+        """
+        self.snapshot_path = snapshot_path
+        self.wal_path = wal_path
+        self.checkpoint_interval = checkpoint_interval
+        self.fsync = fsync
+        self.seq = 0
+        self._logged = 0
+        self._wal = None
+
+    def _load_snapshot(self, storage: Storage) -> int:
+        """
+        Loads the snapshot into an emptied storage through a read-only memory map.
+
+        Returns:
+            int: The sequence number of the last command included in the snapshot.
+        """
+        storage.clear()
+        if not os.path.isfile(self.snapshot_path):
+            return 0
+        with open(self.snapshot_path, "rb") as file, mmap.mmap(
+            file.fileno(), 0, access=mmap.ACCESS_READ
+        ) as data:
+            magic, seq, count = SNAPSHOT_HEADER.unpack_from(data, 0)
+            if magic != SNAPSHOT_MAGIC:
+                raise ValueError(f"{self.snapshot_path} is not a directory snapshot")
+            folder_ids = []
+            offset = SNAPSHOT_HEADER.size
+            for _ in range(count):
+                parent_index, name_size = SNAPSHOT_RECORD.unpack_from(data, offset)
+                offset += SNAPSHOT_RECORD.size
+                folder_name = data[offset : offset + name_size].decode("utf-8")
+                offset += name_size
+                parent_id = ROOT_ID if parent_index < 0 else folder_ids[parent_index]
+                folder_ids.append(storage.add_folder(folder_name, parent_id))
+        return seq
+
+    def _write_snapshot(self, storage: Storage):
+        """
+        Writes a snapshot of the storage next to the current one and atomically replaces it.
+        """
+        temp_path = f"{self.snapshot_path}.tmp"
+        count = 0
+        with open(temp_path, "wb", buffering=WRITE_BUFFER_SIZE) as file:
+            file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, self.seq, 0))
+            stack = [(ROOT_ID, -1)]
+            while stack:
+                parent_id, parent_index = stack.pop()
+                for folder_name, folder_id in storage.iter_children(parent_id):
+                    name = folder_name.encode("utf-8")
+                    file.write(SNAPSHOT_RECORD.pack(parent_index, len(name)))
+                    file.write(name)
+                    stack.append((folder_id, count))
+                    count += 1
+            file.seek(0)
+            file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, self.seq, count))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.snapshot_path)
+
+    def restore(self, storage: Storage, replay: Callable[[str], None]):
+        """
+        Rebuilds the state: loads the snapshot, then replays the WAL commands logged after it.
+
+        A partially written last WAL line, left by a crash, is ignored and cut off the log.
+
+        Args:
+            storage (Storage): The storage to load the snapshot into.
+            replay (Callable[[str], None]): Executes one replayed command.
+        """
+        self.seq = self._load_snapshot(storage)
+        self._logged = 0
+        if os.path.isfile(self.wal_path):
+            valid_size = 0
+            with open(self.wal_path, "rb") as wal:
+                for line in wal:
+                    seq, _, command = line.partition(b" ")
+                    if not line.endswith(b"\n") or not seq.isdigit():
+                        logger.warning(f"Skipping a torn WAL entry in {self.wal_path}")
+                        break
+                    valid_size += len(line)
+                    if int(seq) <= self.seq:
+                        continue
+                    replay(command[:-1].decode("utf-8"))
+                    self.seq = int(seq)
+                    self._logged += 1
+            if os.path.getsize(self.wal_path) > valid_size:
+                os.truncate(self.wal_path, valid_size)
+        self._wal = open(self.wal_path, "a", encoding="utf-8")
+
+    def log(self, command: str):
+        """
+        Appends a command to the WAL if it changes the tree.
+
+        Args:
+            command (str): The command about to be executed.
+        """
+        if command.split(" ", 1)[0] not in MUTATING_COMMANDS:
+            return
+        self.seq += 1
+        self._logged += 1
+        self._wal.write(f"{self.seq} {command}\n")
+        self._wal.flush()
+        if self.fsync:
+            os.fsync(self._wal.fileno())
+
+    def needs_checkpoint(self) -> bool:
+        """
+        Returns True once `checkpoint_interval` commands have been logged since the last checkpoint.
+        """
+        return (
+            self.checkpoint_interval is not None
+            and self._logged >= self.checkpoint_interval
+        )
+
+    def checkpoint(self, storage: Storage):
+        """
+        Writes a snapshot of the storage and truncates the WAL.
+
+        The WAL is only truncated after the snapshot has replaced the previous one; entries that
+        survive a crash in between are skipped on restore thanks to their sequence numbers.
+        """
+        self._write_snapshot(storage)
+        self._wal.close()
+        self._wal = open(self.wal_path, "w", encoding="utf-8")
+        self._logged = 0
+
+    def close(self):
+        """
+        Closes the WAL.
+        """
+        if self._wal is not None:
+            self._wal.close()
+            self._wal = None
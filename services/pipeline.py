@@ -0,0 +1,87 @@
+import queue
+import threading
+from typing import Iterable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+POLL_INTERVAL = 0.1
+_END = object()
+
+
+class _Failure:
+    """
+    An exception raised by a producer, handed over to be re-raised by the consumer.
+    """
+
+    __slots__ = ("error",)
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def prefetch(
+    items: Iterable[T], size: int, stop: Optional[threading.Event] = None
+) -> Iterator[T]:
+    """
+    Iterates `items` on a background thread, up to `size` items ahead of the consumer.
+
+    The items are handed over through a bounded queue, so a slow consumer makes the producer wait
+    instead of buffering without limit, and an exception of the producer is re-raised by the
+    consumer. Stages chain by prefetching an iterator that consumes another prefetched iterator.
+    When the consumer stops early, `stop` is set and the producer stops at its next item; stages
+    sharing `stop` all stop together, even those waiting on each other.
+
+    Args:
+        items (Iterable[T]): The items, e.g. a generator reading a file.
+        size (int): The maximum number of items waiting in the queue.
+        stop (threading.Event, optional): Set when the consumer stops before the last item.
+
+    Yields:
+        T: The items, in order.
+    """
+    buffer = queue.Queue(maxsize=size)
+    stop = stop if stop is not None else threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        iterator = iter(items)
+        try:
+            for item in iterator:
+                if not put(item):
+                    return
+            put(_END)
+        except BaseException as error:
+            put(_Failure(error))
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    threading.Thread(target=produce, name="prefetch", daemon=True).start()
+    completed = False
+    try:
+        while True:
+            try:
+                item = buffer.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if stop.is_set():
+                    return
+                continue
+            if item is _END:
+                completed = True
+                return
+            if isinstance(item, _Failure):
+                completed = True
+                raise item.error
+            yield item
+    finally:
+        if not completed:
+            stop.set()
@@ -0,0 +1,189 @@
+import bisect
+import fnmatch
+from itertools import islice
+from typing import Callable, Dict, Hashable, Iterator, Optional, Tuple
+
+from .storage import ROOT_ID, ChildIndex, DictStorage, Storage
+
+GLOB_CHARACTERS = "*?["
+
+
+def literal_prefix(pattern: str) -> str:
+    """
+    Returns the part of a glob pattern before its first wildcard, e.g. "app" for "app*[es]".
+    """
+    for index, character in enumerate(pattern):
+        if character in GLOB_CHARACTERS:
+            return pattern[:index]
+    return pattern
+
+
+class IndexedStorage(Storage):
+    """
+    A storage engine wrapper that maintains a global name index and the subtree sizes.
+
+    The name index maps every folder name to the IDs of the folders with that name and keeps the
+    names sorted, so exact and prefix queries are a lookup and a binary search, and a glob only
+    tests the names starting with its literal prefix. Every folder knows how many descendants it
+    has; CREATE, MOVE and DELETE update the counts of the folder's ancestors, in O(depth).
+
+    A removed subtree leaves the index when it is reclaimed, so `find` skips the folders that are
+    removed but not reclaimed yet.
+    """
+
+    def __init__(self, storage: Optional[Storage] = None):
+        """
+        Initializes the wrapper.
+
+        Args:
+            storage (Storage, optional): The wrapped engine. Defaults to a DictStorage. The
+                folders it already holds, e.g. those of a reopened SQLiteStorage, are indexed.
+        """
+        self._storage = storage if storage is not None else DictStorage()
+        self._names = ChildIndex()
+        self._sizes: Dict[Hashable, int] = {}
+        self._total = 0
+        if not self._storage.is_empty():
+            self._index_tree()
+
+    def _index_tree(self):
+        """
+        Indexes the folders already in the wrapped engine, after freeing its removed subtrees,
+        which were never indexed.
+        """
+        self._storage.reclaim()
+        folders = []
+        level = [ROOT_ID]
+        while level:
+            next_level = []
+            for parent_id in level:
+                for folder_name, folder_id in self._storage.iter_children(parent_id):
+                    folder_ids = self._names.get(folder_name)
+                    if folder_ids is None:
+                        folder_ids = self._names[folder_name] = set()
+                    folder_ids.add(folder_id)
+                    folders.append((folder_id, parent_id))
+                    next_level.append(folder_id)
+            level = next_level
+        # Children come after their parents, so a reversed walk counts every subtree bottom-up.
+        for folder_id, parent_id in reversed(folders):
+            if parent_id is not ROOT_ID:
+                self._sizes[parent_id] = (
+                    self._sizes.get(parent_id, 0) + self._sizes.get(folder_id, 0) + 1
+                )
+        self._total = len(folders)
+
+    def _resize(self, parent_id: Optional[Hashable], delta: int):
+        """
+        Adds `delta` to the descendant count of a folder and of all of its ancestors.
+        """
+        while parent_id is not ROOT_ID:
+            size = self._sizes.get(parent_id, 0) + delta
+            if size:
+                self._sizes[parent_id] = size
+            else:
+                del self._sizes[parent_id]
+            parent_id = self._storage.get_folder(parent_id)[1]
+
+    def _unindex(self, folder_id: Hashable, folder_name: str):
+        """
+        Drops a freed folder from the name index and the subtree sizes.
+        """
+        folder_ids = self._names[folder_name]
+        folder_ids.discard(folder_id)
+        if not folder_ids:
+            del self._names[folder_name]
+        self._sizes.pop(folder_id, None)
+
+    def _is_attached(self, folder_id: Hashable) -> bool:
+        """
+        Returns True if a folder is reachable from the root, i.e. not in a removed subtree.
+        """
+        while folder_id is not ROOT_ID:
+            try:
+                folder_name, parent_id = self._storage.get_folder(folder_id)
+            except KeyError:
+                return False
+            if self._storage.get_child(parent_id, folder_name) != folder_id:
+                return False
+            folder_id = parent_id
+        return True
+
+    def clear(self):
+        self._storage.clear()
+        self._names = ChildIndex()
+        self._sizes = {}
+        self._total = 0
+
+    def is_empty(self) -> bool:
+        return self._storage.is_empty()
+
+    def get_child(self, parent_id: Optional[Hashable], folder_name: str):
+        return self._storage.get_child(parent_id, folder_name)
+
+    def iter_children(
+        self, parent_id: Optional[Hashable], after: Optional[str] = None
+    ) -> Iterator[Tuple[str, Hashable]]:
+        return self._storage.iter_children(parent_id, after)
+
+    def get_folder(self, folder_id: Hashable) -> Tuple[str, Optional[Hashable]]:
+        return self._storage.get_folder(folder_id)
+
+    def add_folder(self, folder_name: str, parent_id: Optional[Hashable]) -> Hashable:
+        folder_id = self._storage.add_folder(folder_name, parent_id)
+        folder_ids = self._names.get(folder_name)
+        if folder_ids is None:
+            folder_ids = self._names[folder_name] = set()
+        folder_ids.add(folder_id)
+        self._resize(parent_id, 1)
+        self._total += 1
+        return folder_id
+
+    def move_folder(self, folder_id: Hashable, new_parent_id: Optional[Hashable]):
+        size = self._sizes.get(folder_id, 0) + 1
+        self._resize(self._storage.get_folder(folder_id)[1], -size)
+        self._storage.move_folder(folder_id, new_parent_id)
+        self._resize(new_parent_id, size)
+
+    def remove_folder(self, folder_id: Hashable):
+        size = self._sizes.get(folder_id, 0) + 1
+        self._resize(self._storage.get_folder(folder_id)[1], -size)
+        self._storage.remove_folder(folder_id)
+        self._total -= size
+
+    def reclaim(
+        self,
+        budget: Optional[int] = None,
+        on_free: Optional[Callable[[Hashable, str], None]] = None,
+    ) -> int:
+        def unindex(folder_id: Hashable, folder_name: str):
+            self._unindex(folder_id, folder_name)
+            if on_free is not None:
+                on_free(folder_id, folder_name)
+
+        return self._storage.reclaim(budget, unindex)
+
+    def find(self, pattern: str) -> Iterator[Hashable]:
+        prefix = literal_prefix(pattern)
+        if prefix == pattern:
+            folder_names = [pattern] if pattern in self._names else []
+        else:
+            start = bisect.bisect_left(self._names.names, prefix)
+            folder_names = []
+            for folder_name in islice(self._names.names, start, None):
+                if not folder_name.startswith(prefix):
+                    break
+                if fnmatch.fnmatchcase(folder_name, pattern):
+                    folder_names.append(folder_name)
+        for folder_name in folder_names:
+            for folder_id in self._names[folder_name]:
+                if self._is_attached(folder_id):
+                    yield folder_id
+
+    def close(self):
+        self._storage.close()
+
+    def count_descendants(self, folder_id: Optional[Hashable]) -> int:
+        if folder_id is ROOT_ID:
+            return self._total
+        return self._sizes.get(folder_id, 0)
@@ -0,0 +1,275 @@
+import asyncio
+import contextlib
+from typing import Iterator, List, Optional
+
+from loguru import logger
+
+from .changes import ChangeLog
+from .concurrency import ConcurrentDirectoryManager, TreeSnapshot
+from .directory_manager import DirectoryManager
+from .metrics import Metrics
+from .output import MemorySink
+from .persistence import Persistence
+from .storage import Storage
+
+READ_SIZE = 64 * 1024
+MAX_LINE_SIZE = 64 * 1024
+STREAM_CHUNK_SIZE = 4096
+END_OF_RESPONSE = ""
+
+
+class CommandServer:
+    """
+    Serves the command protocol over TCP or a Unix socket, on a shared ConcurrentDirectoryManager.
+
+    Clients send one command per line and may pipeline as many commands as they like. Every
+    command gets a response holding its output lines, its warnings as "WARNING <message>" lines
+    and a final empty line, in the order the commands were sent; a blank line is answered with
+    just the empty line, so pipelining clients stay in step. The commands are executed on
+    the event loop, in the order they arrive, so clients see each other's changes as one stream:
+        - Everything a read returns is executed as one batch, and the responses of a batch are
+          written with a single socket write.
+        - The server waits for a client to drain its responses before reading more commands
+          from it, so a client that doesn't read its responses can't make the server buffer
+          them without limit. Likewise a command line longer than `max_line_size` bytes is
+          answered with a warning and the rest of it is skipped instead of buffered.
+        - A LIST is streamed from a snapshot of the tree in chunks of `chunk_size` lines, so a
+          large listing neither stalls the other clients nor is rendered all at once.
+        - A client keeping a copy of the tree polls "LIST --since <seq>" and only receives
+          the changes made since its last poll.
+    """
+
+    def __init__(
+        self,
+        storage: Optional[Storage] = None,
+        persistence: Optional[Persistence] = None,
+        metrics: Optional[Metrics] = None,
+        chunk_size: int = STREAM_CHUNK_SIZE,
+        read_size: int = READ_SIZE,
+        max_line_size: int = MAX_LINE_SIZE,
+        changes: Optional[ChangeLog] = None,
+    ):
+        """
+        Initializes the server.
+
+        Args:
+            storage (Storage, optional): The storage engine of the directory manager.
+            persistence (Persistence, optional): Snapshot and write-ahead log storage.
+            metrics (Metrics, optional): Collects the latencies of the executed commands.
+            chunk_size (int, optional): The number of response lines written at once.
+            read_size (int, optional): The maximum number of bytes read from a client at once.
+            max_line_size (int, optional): The maximum length in bytes of a command line.
+            changes (ChangeLog, optional): The change log behind `LIST --since`. Defaults to a new
+                ChangeLog, so clients can keep a copy of the tree up to date with deltas.
+        """
+        self._sink = MemorySink()
+        self.directory_manager = ConcurrentDirectoryManager(
+            storage=storage,
+            output=self._sink,
+            persistence=persistence,
+            metrics=metrics,
+            changes=changes if changes is not None else ChangeLog(),
+        )
+        self.persistence = persistence
+        self.storage = storage
+        self.chunk_size = chunk_size
+        self.read_size = read_size
+        self.max_line_size = max_line_size
+        self._response = None
+        self._handler_id = None
+        self._server = None
+
+    def _capture_warning(self, message):
+        """
+        Loguru sink adding the warnings of the executing command to its response.
+        """
+        if self._response is not None:
+            self._response.append(f"WARNING {message.record['message']}")
+
+    def _execute(self, command: str) -> List[str]:
+        """
+        Executes a command and returns its response lines, warnings included.
+        """
+        self._response = self._sink.lines = []
+        try:
+            self.directory_manager.command_execute(command)
+        except Exception as exception:
+            logger.exception(f"Failed to execute {command}")
+            self._response.append(f"WARNING {exception}")
+        finally:
+            response, self._response = self._response, None
+        return response
+
+    def _listing(self, command: str) -> Optional[Iterator[str]]:
+        """
+        Returns the lines of a valid LIST command, produced lazily from the current snapshot,
+        or None for any other command.
+        """
+        if command.split(" ", 1)[0] != "LIST":
+            return None
+        options, status = DirectoryManager._parse_list_arguments(command.split()[1:])
+        if not status or "since" in options:
+            return None
+        return self._iter_listing(self.directory_manager.snapshot(), **options)
+
+    @staticmethod
+    def _iter_listing(
+        snapshot: TreeSnapshot,
+        folder_path: Optional[str] = None,
+        depth: Optional[int] = None,
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+    ) -> Iterator[str]:
+        """
+        Yields the output of a LIST, the same as `DirectoryManager._show_directory` would write.
+        """
+        yield DirectoryManager._list_echo(folder_path, depth, limit, after)
+        folder_path = folder_path or "/"
+        if not snapshot.exists(folder_path):
+            message = f"Cannot list: {folder_path} doesn't exist"
+            logger.warning(message)
+            yield f"WARNING {message}"
+            return
+        folder_paths = snapshot.iter_directory(
+            folder_path=folder_path,
+            depth=depth,
+            limit=None if limit is None else limit + 1,
+            after=after,
+        )
+        yield from DirectoryManager._iter_page(folder_paths, limit, after)
+
+    @staticmethod
+    async def _send(writer: asyncio.StreamWriter, lines: List[str]):
+        """
+        Writes response lines and waits until the client has room for more.
+        """
+        if lines:
+            writer.write(("\n".join(lines) + "\n").encode("utf-8"))
+            await writer.drain()
+
+    def _reject(self, command: bytes) -> Optional[str]:
+        """
+        Returns the warning for a command line that can't be executed, or None if it is valid.
+        """
+        if len(command) > self.max_line_size:
+            return f"Command longer than {self.max_line_size} bytes"
+        try:
+            command.decode("utf-8")
+        except UnicodeDecodeError:
+            return "Command is not valid UTF-8"
+        return None
+
+    async def _serve(self, commands: List[bytes], writer: asyncio.StreamWriter):
+        """
+        Executes a batch of commands and writes their responses.
+        """
+        response = []
+        for command in commands:
+            message = self._reject(command)
+            if message is not None:
+                logger.warning(message)
+                response.extend([f"WARNING {message}", END_OF_RESPONSE])
+                continue
+            command = command.decode("utf-8").strip()
+            if not command:
+                response.append(END_OF_RESPONSE)
+                continue
+            lines = self._listing(command)
+            if lines is None:
+                response.extend(self._execute(command))
+            else:
+                for line in lines:
+                    response.append(line)
+                    if len(response) >= self.chunk_size:
+                        await self._send(writer, response)
+                        response = []
+            response.append(END_OF_RESPONSE)
+        await self._send(writer, response)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Serves one client connection until it closes.
+        """
+        pending = b""
+        skipping = False
+        try:
+            while True:
+                data = await reader.read(self.read_size)
+                if not data:
+                    break
+                data = pending + data
+                if skipping:
+                    # The rest of an over-long line, already answered.
+                    newline = data.find(b"\n")
+                    if newline < 0:
+                        pending = b""
+                        continue
+                    data, skipping = data[newline + 1 :], False
+                commands = data.split(b"\n")
+                pending = commands.pop()
+                if len(pending) > self.max_line_size:
+                    commands.append(pending)
+                    pending, skipping = b"", True
+                await self._serve(commands, writer)
+            if pending:
+                await self._serve([pending], writer)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def start(
+        self,
+        host: Optional[str] = None,
+        port: Optional[int] = None,
+        path: Optional[str] = None,
+    ):
+        """
+        Starts listening on a TCP address, or on a Unix socket if `path` is given.
+
+        Args:
+            host (str, optional): The address to bind to. Defaults to all interfaces.
+            port (int, optional): The TCP port; 0 picks a free port, see `address`.
+            path (str, optional): The path of the Unix socket.
+        """
+        self._handler_id = logger.add(
+            self._capture_warning, level="WARNING", format="{message}"
+        )
+        if path is not None:
+            self._server = await asyncio.start_unix_server(self._handle, path=path)
+        else:
+            self._server = await asyncio.start_server(self._handle, host, port)
+
+    @property
+    def address(self):
+        """
+        The address the server listens on, e.g. ("127.0.0.1", 8765) or the Unix socket path.
+        """
+        return self._server.sockets[0].getsockname()
+
+    async def serve_forever(self):
+        """
+        Serves the clients until the task is cancelled, then closes the server.
+        """
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self):
+        """
+        Stops accepting clients and closes the write-ahead log and the storage engine.
+        """
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._handler_id is not None:
+            logger.remove(self._handler_id)
+            self._handler_id = None
+        if self.persistence is not None:
+            self.persistence.close()
+        if self.storage is not None:
+            self.storage.close()
@@ -0,0 +1,431 @@
+import heapq
+import multiprocessing
+import os
+import queue
+import zlib
+from collections import deque
+from typing import Callable, Iterable, List, Optional, Type
+
+from loguru import logger
+
+from .compiler import CommandScript
+from .directory_manager import MOVE_ERRORS, DirectoryManager
+from .output import LoguruSink, MemorySink, OutputSink
+from .storage import DictStorage, Storage
+
+SHARD_BATCH_SIZE = 1024
+POLL_INTERVAL = 0.5
+LINE, LINES, WARNING = range(3)
+
+
+class _EventSink(OutputSink):
+    """
+    Records the output lines of a worker as events, in order with the warnings.
+    """
+
+    def __init__(self, events: list):
+        self.events = events
+
+    def write(self, line: str):
+        self.events.append((LINE, line))
+
+    def write_lines(self, lines: Iterable[str]):
+        self.events.append((LINES, lines))
+
+
+def _worker(storage_class: Type[Storage], tasks, results):
+    """
+    Worker process loop: executes batches of commands and function calls on its own shard.
+
+    A task is either (None, [command, ...]), answered with one (command, events, error) tuple
+    per command, or (function, args), answered with a (result, error) tuple where result is
+    function(directory_manager, *args).
+    """
+    events = []
+    logger.remove()
+    logger.add(
+        lambda message: events.append((WARNING, message.record["message"])),
+        level="WARNING",
+        format="{message}",
+    )
+    directory_manager = DirectoryManager(
+        storage=storage_class(), output=_EventSink(events)
+    )
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        function, args = task
+        if function is not None:
+            try:
+                results.put((function(directory_manager, *args), None))
+            except Exception as exception:
+                results.put((None, exception))
+            continue
+        batch = []
+        for command in args:
+            error = None
+            try:
+                directory_manager.command_execute(command)
+            except Exception as exception:
+                error = exception
+            batch.append((command, events[:], error))
+            events.clear()
+        results.put(batch)
+
+
+def _folder_exists(directory_manager: DirectoryManager, folder_path_items: List[str]):
+    return directory_manager._get_folder_id(folder_path_items)[1]
+
+
+def _render_roots(directory_manager: DirectoryManager) -> List[List[str]]:
+    """
+    Renders the shard like a plain LIST and splits the lines into one block per top-level folder.
+    """
+    output, directory_manager._output = directory_manager._output, MemorySink()
+    try:
+        directory_manager._show_directory()
+        lines = directory_manager._output.lines[1:]
+    finally:
+        directory_manager._output = output
+    blocks = []
+    if lines != ["EMPTY DIRECTORY"]:
+        for line in lines:
+            if line.startswith(" "):
+                blocks[-1].append(line)
+            else:
+                blocks.append([line])
+    return blocks
+
+
+def _list_paths(directory_manager: DirectoryManager, *args) -> List[str]:
+    return list(directory_manager.iter_directory("/", *args))
+
+
+class ShardedExecutor:
+    """
+    Executes commands on a pool of worker processes, each owning the top-level folders
+    (and their subtrees) whose name hashes to it.
+
+    Commands on a single top-level folder are sent to its shard in batches and run in parallel
+    with the other shards. A LIST of the whole tree and a MOVE between two shards are executed
+    after all the previous commands, by querying or updating the shards involved. The output
+    and warnings of every command are sent back and emitted in the original command order, so
+    they are exactly the same as with a single DirectoryManager.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        storage_class: Type[Storage] = DictStorage,
+        output: Optional[OutputSink] = None,
+        batch_size: int = SHARD_BATCH_SIZE,
+    ):
+        """
+        Starts the worker processes.
+
+        Args:
+            workers (int, optional): The number of worker processes. Defaults to the CPU count.
+            storage_class (Type[Storage], optional): The storage engine of the shards.
+            output (OutputSink, optional): The sink receiving the command results. Defaults to
+                a LoguruSink.
+            batch_size (int, optional): The number of commands sent to a worker at once.
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.output = output if output is not None else LoguruSink()
+        self.batch_size = batch_size
+        self.max_pending = batch_size * self.workers * 4
+        context = multiprocessing.get_context("spawn")
+        self._tasks = [context.Queue() for _ in range(self.workers)]
+        self._results = [context.Queue() for _ in range(self.workers)]
+        self._processes = [
+            context.Process(
+                target=_worker,
+                args=(storage_class, self._tasks[shard], self._results[shard]),
+                daemon=True,
+            )
+            for shard in range(self.workers)
+        ]
+        for process in self._processes:
+            process.start()
+        self._batches = [[] for _ in range(self.workers)]
+        self._received = [deque() for _ in range(self.workers)]
+        self._pending = deque()
+
+    def __enter__(self) -> "ShardedExecutor":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _shard(self, folder_name: str) -> int:
+        """
+        Returns the shard owning a top-level folder.
+        """
+        return zlib.crc32(folder_name.encode("utf-8")) % self.workers
+
+    def _send(self, shard: int):
+        """
+        Sends the pending batch of commands of a shard to its worker.
+        """
+        if self._batches[shard]:
+            self._tasks[shard].put((None, self._batches[shard]))
+            self._batches[shard] = []
+
+    def _dispatch(self, shard: int, command: str):
+        """
+        Queues a command for a shard, then emits results while too many are pending.
+        """
+        self._batches[shard].append(command)
+        self._pending.append(shard)
+        if len(self._batches[shard]) >= self.batch_size:
+            self._send(shard)
+        while len(self._pending) > self.max_pending:
+            self._emit_next()
+
+    def _emit_next(self):
+        """
+        Waits for the result of the oldest pending command and emits it.
+        """
+        shard = self._pending.popleft()
+        received = self._received[shard]
+        if not received:
+            self._send(shard)
+            received.extend(self._receive(shard))
+        command, events, error = received.popleft()
+        for kind, value in events:
+            if kind == LINE:
+                self.output.write(value)
+            elif kind == LINES:
+                self.output.write_lines(value)
+            else:
+                logger.warning(value)
+        if error is not None:
+            raise error
+        self.output.end_command(command)
+
+    def _drain(self):
+        """
+        Emits the results of all pending commands.
+        """
+        while self._pending:
+            self._emit_next()
+
+    def _receive(self, shard: int):
+        """
+        Waits for the next result of a shard.
+
+        Raises:
+            RuntimeError: If the worker of the shard exited, e.g. was killed, instead of answering.
+        """
+        process = self._processes[shard]
+        while True:
+            try:
+                return self._results[shard].get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if process.is_alive():
+                    continue
+            # The worker may have answered right before exiting.
+            try:
+                return self._results[shard].get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                raise RuntimeError(
+                    f"Worker of shard {shard} exited with code {process.exitcode}"
+                ) from None
+
+    def _call(self, shards: List[int], function: Callable, *args) -> list:
+        """
+        Calls function(directory_manager, *args) on the given shards, once they are drained.
+
+        Raises:
+            Exception: The first error raised by the function on a shard, once every shard has
+                answered.
+        """
+        for shard in shards:
+            self._tasks[shard].put((function, args))
+        answers = [self._receive(shard) for shard in shards]
+        for _, error in answers:
+            if error is not None:
+                raise error
+        return [result for result, _ in answers]
+
+    def _list_all(self, command: str, options: dict):
+        """
+        Executes a LIST of the whole tree by merging the listings of all the shards.
+        """
+        self._drain()
+        folder_path = options.get("folder_path")
+        depth, limit, after = (options.get(key) for key in ("depth", "limit", "after"))
+        self.output.write(DirectoryManager._list_echo(folder_path, depth, limit, after))
+        shards = list(range(self.workers))
+        if folder_path is None and depth is None and limit is None and after is None:
+            blocks = sorted(
+                (
+                    block
+                    for blocks in self._call(shards, _render_roots)
+                    for block in blocks
+                ),
+                key=lambda block: block[0],
+            )
+            if not blocks:
+                self.output.write("EMPTY DIRECTORY")
+            for block in blocks:
+                self.output.write_lines(block)
+        else:
+            listings = self._call(
+                shards,
+                _list_paths,
+                depth,
+                None if limit is None else limit + 1,
+                after,
+            )
+            folder_paths = heapq.merge(
+                *listings, key=lambda item_path: item_path.split("/", 1)[0]
+            )
+            DirectoryManager._write_page(self.output, folder_paths, limit, after)
+        self.output.end_command(command)
+
+    def _find_all(self, command: str, pattern: str):
+        """
+        Executes a FIND by merging the matches of all the shards.
+        """
+        self._drain()
+        self.output.write(command)
+        folder_paths = list(
+            heapq.merge(
+                *self._call(list(range(self.workers)), DirectoryManager.find, pattern)
+            )
+        )
+        self.output.write_lines(folder_paths or ["NOT FOUND"])
+        self.output.end_command(command)
+
+    def _count_all(self, command: str):
+        """
+        Executes a COUNT of the whole tree by adding up the counts of all the shards.
+        """
+        self._drain()
+        self.output.write(command)
+        self.output.write(
+            str(sum(self._call(list(range(self.workers)), DirectoryManager.count)))
+        )
+        self.output.end_command(command)
+
+    def _move_across(
+        self,
+        command: str,
+        folder_path_items: List[str],
+        new_folder_path_items: List[str],
+        shard: int,
+        new_shard: int,
+    ):
+        """
+        Executes a MOVE from one shard to another: the subtree is detached from the first one and
+        rebuilt in the second one, with the same checks as `DirectoryManager._move_folder`.
+        """
+        self._drain()
+        folder_name = folder_path_items[-1]
+        new_folder_name = "/".join(new_folder_path_items) or "/"
+        error = None
+        if not self._call([shard], _folder_exists, folder_path_items)[0]:
+            error = "missing_folder"
+        elif not self._call([new_shard], _folder_exists, new_folder_path_items)[0]:
+            error = "missing_parent"
+        elif self._call(
+            [new_shard], _folder_exists, new_folder_path_items + [folder_name]
+        )[0]:
+            error = "already_exists"
+        else:
+            folder_paths = self._call(
+                [shard], DirectoryManager.detach_subtree, "/".join(folder_path_items)
+            )[0]
+            self._call(
+                [new_shard],
+                DirectoryManager.attach_subtree,
+                new_folder_name,
+                folder_paths,
+            )
+        if error is not None:
+            logger.warning(
+                MOVE_ERRORS[error].format(
+                    folder_name=folder_name, new_folder_name=new_folder_name
+                )
+            )
+        self.output.write(command)
+        self.output.end_command(command)
+
+    def command_execute(self, command: str):
+        """
+        Executes a command on the shard of its top-level folder, or across the shards for
+        a LIST or COUNT of the whole tree, a FIND and a MOVE between two shards.
+
+        Args:
+            command (str): The command string, in the same format as for `DirectoryManager`.
+        """
+        parts = command.split(" ", 2)
+        command_type = parts[0]
+        if command_type == "LIST":
+            options, status = DirectoryManager._parse_list_arguments(
+                command.split()[1:]
+            )
+            folder_path_items = DirectoryManager._split_path(
+                options.get("folder_path", "")
+            )
+            if not status or "since" in options:
+                self._dispatch(0, command)
+            elif not folder_path_items:
+                self._list_all(command, options)
+            else:
+                self._dispatch(self._shard(folder_path_items[0]), command)
+        elif command_type == "MOVE" and len(parts) == 3:
+            folder_path_items = parts[1].strip("/").split("/")
+            new_folder_path_items = DirectoryManager._split_path(parts[2])
+            shard = self._shard(folder_path_items[0])
+            new_shard = self._shard(
+                new_folder_path_items[0]
+                if new_folder_path_items
+                else folder_path_items[-1]
+            )
+            if shard == new_shard:
+                self._dispatch(shard, command)
+            else:
+                self._move_across(
+                    command, folder_path_items, new_folder_path_items, shard, new_shard
+                )
+        elif command_type == "FIND" and len(parts) > 1 and parts[1]:
+            self._find_all(command, command[len("FIND ") :])
+        elif command_type == "COUNT" and not DirectoryManager._split_path(
+            parts[1] if len(parts) > 1 else ""
+        ):
+            self._count_all(command)
+        elif command_type in ("CREATE", "DELETE", "MOVE", "COUNT") and len(parts) > 1:
+            self._dispatch(self._shard(parts[1].strip("/").split("/", 1)[0]), command)
+        else:
+            self._dispatch(0, command)
+
+    def execute_many(self, commands: Iterable[str]):
+        """
+        Executes a stream of commands.
+        """
+        for command in commands:
+            self.command_execute(command)
+
+    def replay(self, script: CommandScript):
+        """
+        Executes a compiled command script.
+        """
+        self.execute_many(script)
+
+    def close(self):
+        """
+        Emits the results of the pending commands and stops the workers.
+        """
+        if not self._processes:
+            return
+        try:
+            self._drain()
+        finally:
+            for tasks in self._tasks:
+                tasks.put(None)
+            for process in self._processes:
+                process.join()
+            self._processes = []
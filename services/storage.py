@@ -0,0 +1,704 @@
+import bisect
+import fnmatch
+import sqlite3
+import sys
+import uuid
+from array import array
+from itertools import chain, islice
+from typing import Callable, Dict, Hashable, Iterable, Iterator, Optional, Tuple, Union
+
+ROOT_ID = None
+
+
+class ChildIndex(dict):
+    """
+    The children of one folder: a {child name: child ID} mapping that also keeps the child
+    names sorted, so children can be listed in name order without sorting them again.
+    """
+
+    __slots__ = ("names",)
+
+    def __init__(self):
+        super().__init__()
+        self.names = []
+
+    def __setitem__(self, folder_name: str, folder_id: Hashable):
+        if folder_name not in self:
+            bisect.insort(self.names, folder_name)
+        super().__setitem__(folder_name, folder_id)
+
+    def __delitem__(self, folder_name: str):
+        super().__delitem__(folder_name)
+        del self.names[bisect.bisect_left(self.names, folder_name)]
+
+    def iter_sorted(
+        self, after: Optional[str] = None
+    ) -> Iterator[Tuple[str, Hashable]]:
+        """
+        Yields the (name, folder_id) pairs of the children in name order.
+
+        Args:
+            after (str, optional): Only yield the children whose name sorts after this one.
+        """
+        start = 0 if after is None else bisect.bisect_right(self.names, after)
+        for folder_name in islice(self.names, start, None):
+            yield folder_name, self[folder_name]
+
+
+CHILD_CHUNK_SIZE = 256
+
+
+class ChildArray:
+    """
+    The children of one folder in arrays sorted by name: their names and their integer IDs.
+
+    It takes 16 bytes per child and no hash table, at the cost of a binary search per lookup.
+    Once a folder has more than 2 * CHILD_CHUNK_SIZE children, `names` and `ids` hold chunks of
+    consecutive children, separated by the first names in `bounds`, so adding or removing a
+    child only moves the entries of one chunk.
+    """
+
+    __slots__ = ("bounds", "names", "ids")
+
+    def __init__(self):
+        self.bounds = None
+        self.names = []
+        self.ids = array("q")
+
+    def __len__(self) -> int:
+        if self.bounds is None:
+            return len(self.names)
+        return sum(map(len, self.names))
+
+    def __bool__(self) -> bool:
+        return bool(self.names)
+
+    def _chunk(self, folder_name: str) -> Tuple[Optional[int], list, array]:
+        """
+        Returns the index of the chunk where a name belongs (None if not chunked) and its arrays.
+        """
+        if self.bounds is None:
+            return None, self.names, self.ids
+        chunk = bisect.bisect_right(self.bounds, folder_name)
+        return chunk, self.names[chunk], self.ids[chunk]
+
+    def get(self, folder_name: str) -> Optional[int]:
+        _, names, ids = self._chunk(folder_name)
+        index = bisect.bisect_left(names, folder_name)
+        if index < len(names) and names[index] == folder_name:
+            return ids[index]
+        return None
+
+    def __setitem__(self, folder_name: str, folder_id: int):
+        chunk, names, ids = self._chunk(folder_name)
+        index = bisect.bisect_left(names, folder_name)
+        if index < len(names) and names[index] == folder_name:
+            ids[index] = folder_id
+            return
+        names.insert(index, folder_name)
+        ids.insert(index, folder_id)
+        if len(names) > 2 * CHILD_CHUNK_SIZE:
+            if chunk is None:
+                self.bounds, self.names, self.ids = [], [names], [ids]
+                chunk = 0
+            self.bounds.insert(chunk, names[CHILD_CHUNK_SIZE])
+            self.names.insert(chunk + 1, names[CHILD_CHUNK_SIZE:])
+            self.ids.insert(chunk + 1, ids[CHILD_CHUNK_SIZE:])
+            del names[CHILD_CHUNK_SIZE:], ids[CHILD_CHUNK_SIZE:]
+
+    def __delitem__(self, folder_name: str):
+        chunk, names, ids = self._chunk(folder_name)
+        index = bisect.bisect_left(names, folder_name)
+        if index == len(names) or names[index] != folder_name:
+            raise KeyError(folder_name)
+        del names[index], ids[index]
+        if chunk is not None and not names:
+            del self.names[chunk], self.ids[chunk]
+            if self.bounds:
+                del self.bounds[max(chunk - 1, 0)]
+            else:
+                self.bounds, self.names, self.ids = None, [], array("q")
+
+    def values(self) -> Iterable[int]:
+        return self.ids if self.bounds is None else chain.from_iterable(self.ids)
+
+    def iter_sorted(self, after: Optional[str] = None) -> Iterator[Tuple[str, int]]:
+        """
+        Yields the (name, folder_id) pairs of the children in name order.
+
+        Args:
+            after (str, optional): Only yield the children whose name sorts after this one.
+        """
+        if self.bounds is None:
+            chunks = [(self.names, self.ids)]
+        else:
+            first = 0 if after is None else bisect.bisect_right(self.bounds, after)
+            chunks = islice(zip(self.names, self.ids), first, None)
+        for names, ids in chunks:
+            start = 0 if after is None else bisect.bisect_right(names, after)
+            yield from zip(islice(names, start, None), islice(ids, start, None))
+            after = None
+
+
+class Storage:
+    """
+    Interface of the storage engines that hold the folders of a DirectoryManager.
+
+    Folders are identified by engine-specific IDs and ``ROOT_ID`` (None) stands for the root.
+    Every engine keeps a child index, so a folder is found by its parent and name without scanning,
+    and only stores parent pointers: depths are derived when needed, so a move is a single relink.
+    """
+
+    def clear(self):
+        """
+        Removes all folders.
+        """
+        raise NotImplementedError
+
+    def is_empty(self) -> bool:
+        """
+        Returns True if the storage holds no folders.
+        """
+        raise NotImplementedError
+
+    def get_child(self, parent_id: Optional[Hashable], folder_name: str):
+        """
+        Returns the ID of the folder named `folder_name` under `parent_id`, or None if there is none.
+        """
+        raise NotImplementedError
+
+    def iter_children(
+        self, parent_id: Optional[Hashable], after: Optional[str] = None
+    ) -> Iterator[Tuple[str, Hashable]]:
+        """
+        Yields (name, folder_id) pairs for the direct children of `parent_id`, in name order.
+        If `after` is given, only the children whose name sorts after it are yielded.
+        """
+        raise NotImplementedError
+
+    def get_folder(self, folder_id: Hashable) -> Tuple[str, Optional[Hashable]]:
+        """
+        Returns the (name, parent_id) of a folder.
+        """
+        raise NotImplementedError
+
+    def add_folder(self, folder_name: str, parent_id: Optional[Hashable]) -> Hashable:
+        """
+        Adds a folder under `parent_id` and returns its newly allocated ID.
+        """
+        raise NotImplementedError
+
+    def move_folder(self, folder_id: Hashable, new_parent_id: Optional[Hashable]):
+        """
+        Relinks a folder, together with its subtree, under `new_parent_id`.
+        """
+        raise NotImplementedError
+
+    def remove_folder(self, folder_id: Hashable):
+        """
+        Detaches a folder, together with all of its descendants, from its parent.
+
+        The detached subtree is immediately unreachable from the root, while its memory is
+        reclaimed later by `reclaim`, so removing a folder costs O(1) regardless of its size.
+        """
+        raise NotImplementedError
+
+    def reclaim(
+        self,
+        budget: Optional[int] = None,
+        on_free: Optional[Callable[[Hashable, str], None]] = None,
+    ) -> int:
+        """
+        Frees up to `budget` folders of previously removed subtrees (all of them if None).
+        `on_free`, if given, is called with the ID and name of every freed folder.
+
+        Returns the number of folders freed.
+        """
+        raise NotImplementedError
+
+    def find(self, pattern: str) -> Iterator[Hashable]:
+        """
+        Yields the IDs of the folders whose name matches a glob pattern, e.g. "app*" (see
+        `fnmatch`, case-sensitive). This walks the whole tree; see IndexedStorage for an index.
+        """
+        level = [ROOT_ID]
+        while level:
+            next_level = []
+            for parent_id in level:
+                for folder_name, folder_id in self.iter_children(parent_id):
+                    if fnmatch.fnmatchcase(folder_name, pattern):
+                        yield folder_id
+                    next_level.append(folder_id)
+            level = next_level
+
+    def count_descendants(self, folder_id: Optional[Hashable]) -> int:
+        """
+        Returns the number of folders below a folder (of all folders for the root) by walking it.
+        """
+        count = 0
+        stack = [folder_id]
+        while stack:
+            for _, child_id in self.iter_children(stack.pop()):
+                stack.append(child_id)
+                count += 1
+        return count
+
+    def close(self):
+        """
+        Releases the resources of the engine, e.g. its files.
+        """
+
+    def get_depth(self, folder_id: Hashable) -> int:
+        """
+        Returns the depth of a folder by following its parent pointers up to the root.
+        """
+        depth = -1
+        while folder_id is not ROOT_ID:
+            folder_id = self.get_folder(folder_id)[1]
+            depth += 1
+        return depth
+
+    def to_dict(self) -> Dict[int, Dict[Hashable, dict]]:
+        """
+        Returns the folders grouped by depth: {depth: {folder_id: {"name": ..., "parent_id": ...}}}.
+
+        The mapping is built level by level from the child index, so it is a snapshot and
+        changes to it are not written back to the storage.
+        """
+        directory = {}
+        level, depth = [ROOT_ID], 0
+        while level:
+            next_level = []
+            for parent_id in level:
+                for folder_name, folder_id in self.iter_children(parent_id):
+                    directory.setdefault(depth, {})[folder_id] = {
+                        "name": folder_name,
+                        "parent_id": parent_id,
+                    }
+                    next_level.append(folder_id)
+            level, depth = next_level, depth + 1
+        return directory
+
+    def load_dict(self, directory: Dict[int, Dict[Hashable, dict]]):
+        """
+        Replaces the stored folders with the ones of a depth-grouped mapping (see `to_dict`).
+
+        The folders get new IDs allocated by the storage engine.
+        """
+        self.clear()
+        new_ids = {ROOT_ID: ROOT_ID}
+        for depth in sorted(directory):
+            for folder_id, folder_info in directory[depth].items():
+                new_ids[folder_id] = self.add_folder(
+                    folder_info["name"], new_ids[folder_info["parent_id"]]
+                )
+
+
+class DictStorage(Storage):
+    """
+    The default storage engine: uuid4 string IDs and one record dict per folder.
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty storage.
+        """
+        self.clear()
+
+    def clear(self):
+        """
+        Resets the folder records (folder ID -> {"name": ..., "parent_id": ...}) and
+        the child index (parent ID -> {child name: child ID}).
+        """
+        self._folders = {}
+        self._children = {ROOT_ID: ChildIndex()}
+        self._garbage = []
+
+    def is_empty(self) -> bool:
+        return not self._children[ROOT_ID]
+
+    def get_child(self, parent_id: Optional[str], folder_name: str) -> Optional[str]:
+        return self._children.get(parent_id, {}).get(folder_name)
+
+    def iter_children(
+        self, parent_id: Optional[str], after: Optional[str] = None
+    ) -> Iterator[Tuple[str, str]]:
+        siblings = self._children.get(parent_id)
+        return siblings.iter_sorted(after) if siblings else iter(())
+
+    def _siblings(self, parent_id: Optional[str]) -> ChildIndex:
+        """
+        Returns the child index of a parent, creating it if the parent has no children yet.
+        """
+        siblings = self._children.get(parent_id)
+        if siblings is None:
+            siblings = self._children[parent_id] = ChildIndex()
+        return siblings
+
+    def get_folder(self, folder_id: str) -> Tuple[str, Optional[str]]:
+        folder_info = self._folders[folder_id]
+        return folder_info["name"], folder_info["parent_id"]
+
+    def add_folder(self, folder_name: str, parent_id: Optional[str]) -> str:
+        un_id = str(uuid.uuid4())
+        self._folders[un_id] = {"name": folder_name, "parent_id": parent_id}
+        self._siblings(parent_id)[folder_name] = un_id
+        return un_id
+
+    def move_folder(self, folder_id: str, new_parent_id: Optional[str]):
+        folder_info = self._folders[folder_id]
+        del self._children[folder_info["parent_id"]][folder_info["name"]]
+        self._siblings(new_parent_id)[folder_info["name"]] = folder_id
+        folder_info["parent_id"] = new_parent_id
+
+    def remove_folder(self, folder_id: str):
+        folder_info = self._folders[folder_id]
+        del self._children[folder_info["parent_id"]][folder_info["name"]]
+        self._garbage.append(folder_id)
+
+    def reclaim(
+        self,
+        budget: Optional[int] = None,
+        on_free: Optional[Callable[[str, str], None]] = None,
+    ) -> int:
+        freed = 0
+        while self._garbage and (budget is None or freed < budget):
+            item_id = self._garbage.pop()
+            folder_info = self._folders.pop(item_id)
+            self._garbage.extend(self._children.pop(item_id, {}).values())
+            if on_free is not None:
+                on_free(item_id, folder_info["name"])
+            freed += 1
+        return freed
+
+    def load_dict(self, directory: Dict[int, Dict[str, dict]]):
+        """
+        Replaces the stored folders with the ones of a depth-grouped mapping, keeping their IDs.
+        """
+        self.clear()
+        for depth in sorted(directory):
+            for folder_id, folder_info in directory[depth].items():
+                self._folders[folder_id] = dict(folder_info)
+                self._siblings(folder_info["parent_id"])[
+                    folder_info["name"]
+                ] = folder_id
+
+
+class CompactStorage(Storage):
+    """
+    A memory-lean storage engine for very large trees.
+
+    Folders get monotonically allocated integer IDs that index parallel arrays of names
+    and parents. Names are interned, so repeated names share a single string object. Only
+    folders that actually have children are in the child index: the ID of the child for a
+    folder with a single one, as in a deep chain, and a ChildArray for the others.
+    """
+
+    _NO_PARENT = -1
+    _REMOVED = -2
+
+    def __init__(self):
+        """
+        Initializes an empty storage.
+        """
+        self.clear()
+
+    def clear(self):
+        """
+        Resets the name and parent arrays and the child indexes.
+        """
+        self._names = []
+        self._parents = array("q")
+        self._roots = ChildArray()
+        self._children: Dict[int, Union[int, ChildArray]] = {}
+        self._garbage = []
+        self._size = 0
+
+    def __len__(self) -> int:
+        """
+        Returns the number of folders held, including removed ones that are not reclaimed yet.
+        """
+        return self._size
+
+    def is_empty(self) -> bool:
+        return not self._roots
+
+    def get_child(self, parent_id: Optional[int], folder_name: str) -> Optional[int]:
+        if parent_id is ROOT_ID:
+            return self._roots.get(folder_name)
+        siblings = self._children.get(parent_id)
+        if siblings is None:
+            return None
+        if siblings.__class__ is int:
+            return siblings if self._names[siblings] == folder_name else None
+        return siblings.get(folder_name)
+
+    def iter_children(
+        self, parent_id: Optional[int], after: Optional[str] = None
+    ) -> Iterator[Tuple[str, int]]:
+        if parent_id is ROOT_ID:
+            return self._roots.iter_sorted(after)
+        siblings = self._children.get(parent_id)
+        if siblings is None:
+            return iter(())
+        if siblings.__class__ is int:
+            folder_name = self._names[siblings]
+            if after is not None and folder_name <= after:
+                return iter(())
+            return iter(((folder_name, siblings),))
+        return siblings.iter_sorted(after)
+
+    def get_folder(self, folder_id: int) -> Tuple[str, Optional[int]]:
+        parent_id = self._parents[folder_id]
+        if parent_id == self._REMOVED:
+            raise KeyError(folder_id)
+        return (
+            self._names[folder_id],
+            None if parent_id == self._NO_PARENT else parent_id,
+        )
+
+    def _link(self, folder_id: int, folder_name: str, parent_id: Optional[int]):
+        """
+        Registers a folder in the child index of its parent.
+        """
+        if parent_id is ROOT_ID:
+            self._roots[folder_name] = folder_id
+            return
+        siblings = self._children.get(parent_id)
+        if siblings is None:
+            self._children[parent_id] = folder_id
+            return
+        if siblings.__class__ is int:
+            sibling_id = siblings
+            siblings = self._children[parent_id] = ChildArray()
+            siblings[self._names[sibling_id]] = sibling_id
+        siblings[folder_name] = folder_id
+
+    def _unlink(self, folder_id: int):
+        """
+        Removes a folder from the child index of its parent.
+        """
+        parent_id = self._parents[folder_id]
+        if parent_id == self._NO_PARENT:
+            del self._roots[self._names[folder_id]]
+            return
+        siblings = self._children[parent_id]
+        if siblings.__class__ is int:
+            del self._children[parent_id]
+            return
+        del siblings[self._names[folder_id]]
+        if len(siblings) == 1:
+            (self._children[parent_id],) = siblings.values()
+
+    def add_folder(self, folder_name: str, parent_id: Optional[int]) -> int:
+        folder_id = len(self._names)
+        folder_name = sys.intern(folder_name)
+        self._names.append(folder_name)
+        self._parents.append(self._NO_PARENT if parent_id is ROOT_ID else parent_id)
+        self._link(folder_id, folder_name, parent_id)
+        self._size += 1
+        return folder_id
+
+    def move_folder(self, folder_id: int, new_parent_id: Optional[int]):
+        self._unlink(folder_id)
+        self._parents[folder_id] = (
+            self._NO_PARENT if new_parent_id is ROOT_ID else new_parent_id
+        )
+        self._link(folder_id, self._names[folder_id], new_parent_id)
+
+    def remove_folder(self, folder_id: int):
+        self._unlink(folder_id)
+        self._parents[folder_id] = self._REMOVED
+        self._garbage.append(folder_id)
+
+    def reclaim(
+        self,
+        budget: Optional[int] = None,
+        on_free: Optional[Callable[[int, str], None]] = None,
+    ) -> int:
+        freed = 0
+        while self._garbage and (budget is None or freed < budget):
+            item_id = self._garbage.pop()
+            children = self._children.pop(item_id, None)
+            if children.__class__ is int:
+                self._garbage.append(children)
+            elif children is not None:
+                self._garbage.extend(children.values())
+            if on_free is not None:
+                on_free(item_id, self._names[item_id])
+            self._names[item_id] = None
+            self._parents[item_id] = self._REMOVED
+            self._size -= 1
+            freed += 1
+        return freed
+
+
+class SQLiteStorage(Storage):
+    """
+    A disk-backed storage engine for trees that don't fit in memory.
+
+    Folders are rows of an SQLite table with never reused integer IDs, and a unique index on (parent, name)
+    serves both the child lookups and the name-ordered child listings. Only SQLite's page cache
+    of hot pages (`cache_size`) stays in memory. The root is stored as parent 0; a removed folder
+    gets a NULL parent, which detaches it at once, and its rows are deleted by `reclaim`.
+
+    Changes are committed every `commit_interval` changes and on `close`. An existing database
+    is opened with its tree, so the engine can also keep a tree between runs.
+    """
+
+    _ROOT = 0
+    _PAGE_SIZE = 1024
+
+    def __init__(
+        self,
+        path: str = ":memory:",
+        cache_size: int = 64 * 1024,
+        commit_interval: int = 10000,
+    ):
+        """
+        Opens or creates the database.
+
+        Args:
+            path (str, optional): The database file. Defaults to an in-memory database.
+            cache_size (int, optional): The size in KiB of SQLite's page cache.
+            commit_interval (int, optional): The number of changes committed at once.
+        """
+        self.path = path
+        self.commit_interval = commit_interval
+        self._changes = 0
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(f"PRAGMA cache_size=-{int(cache_size)}")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS folders ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, parent INTEGER, name TEXT NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS folders_parent_name "
+            "ON folders (parent, name)"
+        )
+        self._garbage = [
+            row[0]
+            for row in self._db.execute("SELECT id FROM folders WHERE parent IS NULL")
+        ]
+
+    def _changed(self):
+        """
+        Counts a change and commits once `commit_interval` changes are pending.
+        """
+        self._changes += 1
+        if self._changes >= self.commit_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Commits the pending changes.
+        """
+        self._db.commit()
+        self._changes = 0
+
+    def close(self):
+        self.flush()
+        self._db.close()
+
+    def _parent(self, parent_id: Optional[int]) -> int:
+        """
+        Returns the value of the parent column for a parent ID.
+        """
+        return self._ROOT if parent_id is ROOT_ID else parent_id
+
+    def clear(self):
+        self._db.execute("DELETE FROM folders")
+        self._garbage = []
+        self._changed()
+
+    def is_empty(self) -> bool:
+        return (
+            self._db.execute(
+                "SELECT 1 FROM folders WHERE parent = ? LIMIT 1", (self._ROOT,)
+            ).fetchone()
+            is None
+        )
+
+    def get_child(self, parent_id: Optional[int], folder_name: str) -> Optional[int]:
+        row = self._db.execute(
+            "SELECT id FROM folders WHERE parent = ? AND name = ?",
+            (self._parent(parent_id), folder_name),
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def iter_children(
+        self, parent_id: Optional[int], after: Optional[str] = None
+    ) -> Iterator[Tuple[str, int]]:
+        parent = self._parent(parent_id)
+        while True:
+            if after is None:
+                rows = self._db.execute(
+                    "SELECT name, id FROM folders WHERE parent = ? ORDER BY name LIMIT ?",
+                    (parent, self._PAGE_SIZE),
+                ).fetchall()
+            else:
+                rows = self._db.execute(
+                    "SELECT name, id FROM folders WHERE parent = ? AND name > ? "
+                    "ORDER BY name LIMIT ?",
+                    (parent, after, self._PAGE_SIZE),
+                ).fetchall()
+            yield from rows
+            if len(rows) < self._PAGE_SIZE:
+                return
+            after = rows[-1][0]
+
+    def get_folder(self, folder_id: int) -> Tuple[str, Optional[int]]:
+        row = self._db.execute(
+            "SELECT name, parent FROM folders WHERE id = ?", (folder_id,)
+        ).fetchone()
+        if row is None or row[1] is None:
+            raise KeyError(folder_id)
+        return row[0], None if row[1] == self._ROOT else row[1]
+
+    def add_folder(self, folder_name: str, parent_id: Optional[int]) -> int:
+        folder_id = self._db.execute(
+            "INSERT INTO folders (parent, name) VALUES (?, ?)",
+            (self._parent(parent_id), folder_name),
+        ).lastrowid
+        self._changed()
+        return folder_id
+
+    def move_folder(self, folder_id: int, new_parent_id: Optional[int]):
+        self._db.execute(
+            "UPDATE folders SET parent = ? WHERE id = ?",
+            (self._parent(new_parent_id), folder_id),
+        )
+        self._changed()
+
+    def remove_folder(self, folder_id: int):
+        self._db.execute("UPDATE folders SET parent = NULL WHERE id = ?", (folder_id,))
+        self._garbage.append(folder_id)
+        self._changed()
+
+    def reclaim(
+        self,
+        budget: Optional[int] = None,
+        on_free: Optional[Callable[[int, str], None]] = None,
+    ) -> int:
+        freed = 0
+        while self._garbage and (budget is None or freed < budget):
+            item_id = self._garbage.pop()
+            self._garbage.extend(
+                row[0]
+                for row in self._db.execute(
+                    "SELECT id FROM folders WHERE parent = ?", (item_id,)
+                )
+            )
+            if on_free is not None:
+                on_free(
+                    item_id,
+                    self._db.execute(
+                        "SELECT name FROM folders WHERE id = ?", (item_id,)
+                    ).fetchone()[0],
+                )
+            self._db.execute("DELETE FROM folders WHERE id = ?", (item_id,))
+            self._changed()
+            freed += 1
+        return freed
@@ -0,0 +1,42 @@
+from unittest.mock import patch
+
+import pytest
+
+from benchmarks.bench import compare, percentile, run
+from benchmarks.workloads import WORKLOADS, build_workload
+from services import DirectoryManager, NullSink
+
+
+@pytest.mark.parametrize("name", WORKLOADS)
+def test_workloads_only_generate_valid_commands(name):
+    directory_manager = DirectoryManager(output=NullSink())
+
+    with patch("loguru.logger.warning") as mocked_warning:
+        for command in build_workload(name, scale=0.02):
+            directory_manager.command_execute(command)
+        mocked_warning.assert_not_called()
+
+
+def test_workloads_are_deterministic():
+    assert list(build_workload("move", 0.02)) == list(build_workload("move", 0.02))
+
+
+def test_percentile():
+    assert percentile([1, 2, 3, 4], 50) == 2
+    assert percentile([1, 2, 3, 4], 99) == 4
+
+
+def test_compare_reports_regressions():
+    results = run(["deep"], scale=0.01, storage="compact", memory=True)
+    baseline = {
+        "deep": {
+            "latency": {
+                "CREATE": {"ops_per_sec": float("inf"), "p99_us": 0.0},
+            }
+        }
+    }
+
+    assert set(results["deep"]["latency"]) == {"CREATE", "LIST", "MOVE", "DELETE"}
+    assert "tree_kib" in results["deep"]["memory"]
+    assert len(compare(results, baseline, threshold=0.1)) == 2
+    assert compare(results, results, threshold=0.1) == []
@@ -0,0 +1,180 @@
+import threading
+
+import pytest
+
+from benchmarks.workloads import build_workload
+from services import (
+    ChangeLog,
+    ConcurrentDirectoryManager,
+    DirectoryManager,
+    MemorySink,
+    NullSink,
+    Persistence,
+)
+
+COMMANDS = [
+    "CREATE foods",
+    "CREATE foods/fruits",
+    "CREATE foods/fruits/apples",
+    "CREATE foods/fruits",
+    "CREATE foods/vegetables",
+    "MOVE foods/fruits/apples foods/vegetables",
+    "MOVE foods/missing /",
+    "MOVE foods/vegetables/apples /",
+    "DELETE foods/fruits",
+    "DELETE foods/fruits",
+]
+
+
+def listing(directory_manager: DirectoryManager, command: str = "LIST") -> list:
+    sink = directory_manager._output
+    sink.lines.clear()
+    directory_manager.command_execute(command)
+    return sink.lines[1:]
+
+
+def test_change_log_records_applied_changes_only():
+    directory_manager = DirectoryManager(output=NullSink(), changes=ChangeLog())
+    for command in COMMANDS:
+        directory_manager.command_execute(command)
+
+    assert [change.command for change in directory_manager.changes.since(0)] == [
+        "CREATE foods",
+        "CREATE foods/fruits",
+        "CREATE foods/fruits/apples",
+        "CREATE foods/vegetables",
+        "MOVE foods/fruits/apples foods/vegetables",
+        "MOVE foods/vegetables/apples /",
+        "DELETE foods/fruits",
+    ]
+    assert directory_manager.changes.seq == 7
+    assert [change.seq for change in directory_manager.changes.since(5)] == [6, 7]
+
+
+def test_list_since_prints_the_delta():
+    directory_manager = DirectoryManager(output=MemorySink(), changes=ChangeLog())
+    for command in COMMANDS[:3]:
+        directory_manager.command_execute(command)
+
+    assert listing(directory_manager, "LIST --since 1") == [
+        "CREATE foods/fruits",
+        "CREATE foods/fruits/apples",
+        "SEQ 3",
+    ]
+    assert listing(directory_manager, "LIST --since 3") == ["SEQ 3"]
+    assert directory_manager._output.lines[0] == "LIST --since 3"
+
+
+@pytest.mark.parametrize("since", [4, 0])
+def test_list_since_resyncs_when_the_changes_are_gone(since):
+    directory_manager = DirectoryManager(
+        output=MemorySink(), changes=ChangeLog(capacity=2)
+    )
+    for command in COMMANDS[:3]:
+        directory_manager.command_execute(command)
+
+    assert listing(directory_manager, f"LIST --since {since}") == [
+        "RESYNC",
+        "foods",
+        " fruits",
+        "  apples",
+        "SEQ 3",
+    ]
+
+
+def test_mirror_kept_up_to_date_with_deltas_matches_the_tree():
+    commands = list(build_workload("move", scale=0.02))
+    directory_manager = DirectoryManager(output=MemorySink(), changes=ChangeLog())
+    mirror = DirectoryManager(output=MemorySink())
+    seq = 0
+    for index in range(0, len(commands), 97):
+        for command in commands[index : index + 97]:
+            directory_manager.command_execute(command)
+        *delta, last = listing(directory_manager, f"LIST --since {seq}")
+        assert "RESYNC" not in delta
+        for command in delta:
+            mirror.command_execute(command)
+        seq = int(last.split()[1])
+
+    assert listing(mirror) == listing(directory_manager)
+
+
+def test_execute_many_feed_rebuilds_the_same_tree():
+    commands = list(build_workload("delete", scale=0.02))
+    directory_manager = DirectoryManager(output=MemorySink(), changes=ChangeLog())
+    directory_manager.execute_many(commands, window=500)
+    mirror = DirectoryManager(output=MemorySink())
+    for change in directory_manager.changes.since(0):
+        mirror.command_execute(change.command)
+
+    assert listing(mirror) == listing(directory_manager)
+
+
+def test_bulk_load_and_replaced_tree_are_recorded():
+    directory_manager = DirectoryManager(output=MemorySink(), changes=ChangeLog())
+    directory_manager.bulk_load(["foods/fruits", "foods/vegetables"])
+    assert [change.command for change in directory_manager.changes.since(0)] == [
+        "CREATE foods",
+        "CREATE foods/fruits",
+        "CREATE foods/vegetables",
+    ]
+
+    directory_manager.directory = directory_manager.directory
+    assert directory_manager.changes.since(3) is None
+    assert directory_manager.changes.since(4) == []
+
+
+def test_restored_tree_needs_a_resync(tmp_path):
+    paths = str(tmp_path / "tree.snapshot"), str(tmp_path / "tree.wal")
+    directory_manager = DirectoryManager(
+        output=NullSink(), persistence=Persistence(*paths)
+    )
+    directory_manager.command_execute("CREATE foods")
+    directory_manager.checkpoint()
+    directory_manager._persistence.close()
+
+    restored = DirectoryManager(
+        output=MemorySink(), persistence=Persistence(*paths), changes=ChangeLog()
+    )
+    assert listing(restored, "LIST --since 0") == ["RESYNC", "foods", "SEQ 1"]
+    assert listing(restored, "LIST --since 1") == ["SEQ 1"]
+
+
+def test_list_since_without_change_log_or_with_other_options_fails():
+    directory_manager = DirectoryManager(output=MemorySink())
+    errors = []
+    directory_manager._report_error = lambda error, message: errors.append(message)
+    directory_manager.command_execute("LIST --since 0")
+    directory_manager.command_execute("LIST foods --since 0")
+    directory_manager.command_execute("LIST --since x")
+
+    assert errors == [
+        "ERROR LIST: --since needs a change log",
+        "ERROR LIST: invalid arguments foods --since 0",
+        "ERROR LIST: invalid arguments --since x",
+    ]
+
+
+def test_subscribers_and_follow_receive_every_change():
+    changes = ChangeLog()
+    directory_manager = ConcurrentDirectoryManager(output=NullSink(), changes=changes)
+    directory_manager.command_execute("CREATE foods")
+    received = []
+    changes.subscribe(received.append)
+    subscription = changes.follow(0)
+    followed = []
+    reader = threading.Thread(
+        target=lambda: followed.extend(change.command for change in subscription)
+    )
+    reader.start()
+    for command in COMMANDS[1:]:
+        directory_manager.command_execute(command)
+    subscription.close()
+    reader.join()
+    changes.unsubscribe(received.append)
+    directory_manager.command_execute("DELETE foods")
+
+    assert [change.seq for change in received] == [2, 3, 4, 5, 6, 7]
+    assert followed == [change.command for change in changes.since(0)[:7]]
+    with pytest.raises(ValueError):
+        changes.follow(42)
@@ -0,0 +1,103 @@
+import io
+from unittest.mock import patch
+
+import pytest
+
+from benchmarks.workloads import build_workload
+from services import CommandScript, DirectoryManager, FileManger, JsonLinesSink
+from services.compiler import OP_CREATE, OP_LIST, OP_TEXT
+
+COMMANDS = [
+    "CREATE fruits",
+    "CREATE fruits/apples",
+    "CREATE fruits/apples/fuji",
+    "CREATE /vegetables",
+    "CREATE grains/squash",
+    "CREATE fruits",
+    "CREATE fruits//pears",
+    "LIST",
+    "MOVE fruits/apples vegetables",
+    "MOVE vegetables/apples /",
+    "MOVE apples apples/fuji",
+    "MOVE pears vegetables",
+    "LIST fruits --depth 1",
+    "DELETE apples/fuji",
+    "DELETE fruits/apples",
+    "LIST",
+]
+
+
+def text_output(commands):
+    stream = io.StringIO()
+    directory_manager = DirectoryManager(output=JsonLinesSink(stream=stream))
+    for command in commands:
+        directory_manager.command_execute(command)
+    directory_manager._output.close()
+    return stream.getvalue()
+
+
+def compiled_output(script):
+    stream = io.StringIO()
+    directory_manager = DirectoryManager(output=JsonLinesSink(stream=stream))
+    directory_manager.replay(script)
+    directory_manager._output.close()
+    return stream.getvalue()
+
+
+def test_compile_interns_path_components():
+    script = CommandScript.compile(["CREATE fruits", "CREATE fruits/apples"])
+
+    assert len(script) == 2
+    assert script.names == ["fruits", "apples"]
+    assert list(script.code) == [OP_CREATE, 1, 0, OP_CREATE, 2, 0, 1]
+
+
+def test_compile_keeps_non_canonical_commands_as_text():
+    script = CommandScript.compile(["CREATE /fruits", "LIST --depth 1", "LIST"])
+
+    assert script.texts == ["CREATE /fruits", "LIST --depth 1"]
+    assert list(script.code[:2]) == [OP_TEXT, 0]
+
+
+@patch("loguru.logger.warning")
+def test_replay_matches_command_execute(mock_logger_warning):
+    expected = text_output(COMMANDS)
+    text_warnings = mock_logger_warning.call_args_list.copy()
+    mock_logger_warning.reset_mock()
+
+    assert compiled_output(CommandScript.compile(COMMANDS)) == expected
+    assert mock_logger_warning.call_args_list == text_warnings
+
+
+def test_replay_matches_command_execute_on_workloads():
+    for name in ("move", "delete"):
+        commands = list(build_workload(name, scale=0.02))
+        assert compiled_output(CommandScript.compile(commands)) == text_output(commands)
+
+
+def test_replay_rejects_an_unknown_opcode():
+    script = CommandScript.compile(["CREATE fruits", "LIST"])
+    script.code[3] = OP_LIST + 10
+
+    with pytest.raises(ValueError, match="Unknown opcode"):
+        DirectoryManager(output=JsonLinesSink(stream=io.StringIO())).replay(script)
+
+
+@patch("loguru.logger.info")
+def test_file_manager_replays_a_saved_script(mock_logger_info, tmp_path):
+    file_path = tmp_path / "commands.txt"
+    file_path.write_text("CREATE fruits\nCREATE fruits/apples\nLIST\n")
+    script_path = tmp_path / "commands.bin"
+
+    assert FileManger(file_path=str(file_path)).compile(str(script_path))
+    assert CommandScript.load(str(script_path)).names == ["fruits", "apples"]
+    FileManger(file_path=str(script_path)).execute()
+
+    logged = [call[0][0] for call in mock_logger_info.call_args_list]
+    assert logged == [
+        "CREATE fruits",
+        "CREATE fruits/apples",
+        "LIST",
+        "fruits",
+        " apples",
+    ]
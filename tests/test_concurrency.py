@@ -0,0 +1,213 @@
+import random
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from benchmarks.workloads import build_workload
+from services import (
+    CompactStorage,
+    ConcurrentDirectoryManager,
+    DictStorage,
+    DirectoryManager,
+    IndexedStorage,
+    NullSink,
+    Persistence,
+    SQLiteStorage,
+)
+from services.concurrency import _Branch, _SnapshotNode
+
+COMMANDS = [
+    "CREATE foods",
+    "CREATE foods/fruits",
+    "CREATE foods/fruits/apples",
+    "CREATE foods/vegetables",
+    "CREATE animals",
+    "MOVE foods/fruits/apples foods/vegetables",
+    "DELETE foods/fruits",
+    "CREATE foods/grains",
+]
+
+
+@pytest.mark.parametrize("storage_class", [DictStorage, CompactStorage])
+def test_snapshot_matches_directory_manager(storage_class):
+    commands = list(build_workload("move", scale=0.02))
+    expected = DirectoryManager(output=NullSink())
+    directory_manager = ConcurrentDirectoryManager(
+        storage=storage_class(), output=NullSink()
+    )
+    for command in commands:
+        expected.command_execute(command)
+        directory_manager.command_execute(command)
+
+    snapshot = directory_manager.snapshot()
+    assert list(snapshot.iter_directory()) == list(expected.iter_directory())
+    assert list(snapshot.iter_directory("r0", depth=1, limit=3, after="f1")) == list(
+        expected.iter_directory("r0", depth=1, limit=3, after="f1")
+    )
+    assert list(snapshot.iter_directory(depth=1, after="r0/f1")) == list(
+        expected.iter_directory(depth=1, after="r0/f1")
+    )
+    assert snapshot.version == directory_manager._storage.snapshot.version
+
+
+def test_snapshot_is_not_changed_by_later_commands():
+    directory_manager = ConcurrentDirectoryManager(output=NullSink())
+    for command in COMMANDS[:4]:
+        directory_manager.command_execute(command)
+    snapshot = directory_manager.snapshot()
+
+    for command in COMMANDS[4:]:
+        directory_manager.command_execute(command)
+
+    assert snapshot.render() == ["foods", " fruits", "  apples", " vegetables"]
+    assert directory_manager.snapshot().render() == [
+        "animals",
+        "foods",
+        " grains",
+        " vegetables",
+        "  apples",
+    ]
+    assert snapshot.version == 4
+    assert directory_manager.snapshot().version == 8
+
+
+def test_list_does_not_publish_a_new_version():
+    directory_manager = ConcurrentDirectoryManager(output=NullSink())
+    directory_manager.command_execute("CREATE foods")
+    snapshot = directory_manager.snapshot()
+    directory_manager.command_execute("LIST")
+    directory_manager.command_execute("CREATE foods")
+
+    assert directory_manager.snapshot() is snapshot
+    assert snapshot.exists("foods") and not snapshot.exists("foods/fruits")
+
+
+def test_readers_never_see_a_half_applied_move():
+    directory_manager = ConcurrentDirectoryManager(output=NullSink())
+    for command in ["CREATE a", "CREATE b", "CREATE a/moved", "CREATE a/moved/x"]:
+        directory_manager.command_execute(command)
+    stop = threading.Event()
+    seen = []
+
+    def read():
+        while not stop.is_set():
+            folders = list(directory_manager.iter_directory())
+            seen.append(sum(folder.endswith("moved") for folder in folders))
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    for _ in range(500):
+        directory_manager.command_execute("MOVE a/moved b")
+        directory_manager.command_execute("MOVE b/moved a")
+    stop.set()
+    reader.join()
+
+    assert seen and set(seen) == {1}
+
+
+def test_restore_publishes_a_snapshot(tmp_path):
+    paths = str(tmp_path / "tree.snapshot"), str(tmp_path / "tree.wal")
+    directory_manager = ConcurrentDirectoryManager(
+        output=NullSink(), persistence=Persistence(*paths)
+    )
+    for command in COMMANDS:
+        directory_manager.command_execute(command)
+    directory_manager.checkpoint()
+    directory_manager.command_execute("CREATE foods/grains/rice")
+    directory_manager._persistence.close()
+
+    restored = ConcurrentDirectoryManager(
+        output=NullSink(), persistence=Persistence(*paths)
+    )
+    assert restored.snapshot().render() == directory_manager.snapshot().render()
+    assert restored.snapshot().exists("foods/grains/rice")
+
+
+def test_bulk_load_is_published_at_once():
+    directory_manager = ConcurrentDirectoryManager(output=NullSink())
+    directory_manager.bulk_load(
+        f"r{root}/f{folder}" for root in range(3) for folder in range(50)
+    )
+
+    snapshot = directory_manager.snapshot()
+    assert snapshot.version == 1
+    assert len(list(snapshot.iter_directory())) == 153
+
+
+@pytest.mark.parametrize("indexed", [False, True])
+def test_reopened_sqlite_database_is_in_the_snapshot(tmp_path, indexed):
+    path = str(tmp_path / "tree.db")
+    expected = DirectoryManager(storage=SQLiteStorage(path), output=NullSink())
+    for command in COMMANDS:
+        expected.command_execute(command)
+    expected._storage.close()
+
+    storage = SQLiteStorage(path)
+    directory_manager = ConcurrentDirectoryManager(
+        storage=IndexedStorage(storage) if indexed else storage, output=NullSink()
+    )
+    snapshot = directory_manager.snapshot()
+    assert snapshot.render() == [
+        "animals",
+        "foods",
+        " grains",
+        " vegetables",
+        "  apples",
+    ]
+    directory_manager.command_execute("DELETE foods/vegetables")
+    directory_manager.command_execute("MOVE foods/grains animals")
+    assert directory_manager.snapshot().render() == ["animals", " grains", "foods"]
+    assert snapshot.exists("foods/vegetables/apples")
+
+
+def test_snapshot_node_copies_share_unchanged_pieces():
+    rng = random.Random(7)
+    owner = object()
+    node, children, frozen = _SnapshotNode(owner), {}, []
+    with patch("services.concurrency.SNAPSHOT_PIECE_SIZE", 2):
+        for step in range(2000):
+            folder_name = f"f{rng.randrange(100):02}"
+            if rng.random() < 0.6:
+                node[folder_name] = children[folder_name] = _SnapshotNode(owner)
+            elif folder_name in children:
+                del node[folder_name], children[folder_name]
+            if step % 50 == 0:
+                frozen.append((node, dict(children)))
+                owner = object()
+                node = node.copy(owner)
+            assert node.get(folder_name) is children.get(folder_name)
+            assert list(node.iter_sorted(after=folder_name)) == sorted(
+                item for item in children.items() if item[0] > folder_name
+            )
+
+    assert len(node) == len(children)
+    for frozen_node, frozen_children in frozen:
+        assert list(frozen_node.iter_sorted()) == sorted(frozen_children.items())
+
+
+def leaf_pieces(node: _SnapshotNode) -> list:
+    pieces, leaves = [node._tree], []
+    while pieces:
+        piece = pieces.pop()
+        if isinstance(piece, _Branch):
+            pieces.extend(piece.pieces)
+        else:
+            leaves.append(piece)
+    return leaves
+
+
+def test_wide_ingestion_does_not_copy_the_siblings():
+    directory_manager = ConcurrentDirectoryManager(output=NullSink())
+    directory_manager.command_execute("CREATE root")
+    for index in range(2000):
+        directory_manager.command_execute(f"CREATE root/f{index}")
+    before = leaf_pieces(directory_manager.snapshot()._get_node("root"))
+
+    directory_manager.command_execute("CREATE root/new")
+    after = leaf_pieces(directory_manager.snapshot()._get_node("root"))
+
+    assert len(before) > 30
+    copied = [leaf for leaf in after if not any(leaf is piece for piece in before)]
+    assert len(copied) == 1 and "new" in copied[0].names
+    assert len(after) == len(before)
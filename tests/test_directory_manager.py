@@ -2,7 +2,8 @@ from unittest.mock import patch
 
 import pytest
 
-from services import DirectoryManager
+from benchmarks.workloads import build_workload
+from services import DirectoryManager, MemorySink
 
 
 @pytest.fixture
@@ -69,7 +70,7 @@ def test_add_folder_invalid_path(directory_manager):
 
 def test_draw_directory(directory_manager):
     expected_output = (
-        "foods\n" " grains\n" " fruits\n" "  fuji\n" " vegetables\n" "  squash\n"
+        "foods\n" " fruits\n" "  fuji\n" " grains\n" " vegetables\n" "  squash\n"
     )
 
     with patch("loguru.logger.info") as mock_info:
@@ -91,9 +92,9 @@ def test_show_directory_non_empty(directory_manager):
     expected_output = (
         "LIST\n"
         "foods\n"
-        " grains\n"
         " fruits\n"
         "  fuji\n"
+        " grains\n"
         " vegetables\n"
         "  squash\n"
     )
@@ -103,3 +104,216 @@ def test_show_directory_non_empty(directory_manager):
         actual_output = "\n".join(call[0][0] for call in mock_info.call_args_list)
         print(actual_output)
         assert actual_output.strip() == expected_output.strip()
+
+
+def test_get_folder_id_walks_full_path(directory_manager):
+    directory_manager._add_folder("/foods/vegetables/fuji")
+
+    folder_id, status = directory_manager._get_folder_id(
+        ["foods", "vegetables", "fuji"]
+    )
+
+    assert status
+    assert directory_manager.directory[2][folder_id]["parent_id"] == (
+        "76ce2622-5886-4757-80a4-e2d5489202c1"
+    )
+    assert directory_manager._get_folder_id(["foods", "grains", "fuji"]) == ("", False)
+
+
+def test_move_folder_updates_subtree_depth(directory_manager):
+    directory_manager._move_folder("/foods/fruits", "/foods/vegetables/squash")
+
+    assert directory_manager._get_folder_id(["foods", "fruits"]) == ("", False)
+    assert directory_manager.directory[3]["528c32f8-f5fc-4862-bbb8-3798c8e74a7c"] == {
+        "name": "fruits",
+        "parent_id": "8f04f1e9-922b-4ba5-bb44-fbc54035260a",
+    }
+    assert "de54de84-83e0-48ae-b3ac-ecd760229c81" in directory_manager.directory[4]
+
+
+def test_move_folder_into_itself(directory_manager):
+    with patch("loguru.logger.warning") as mocked_warning:
+        directory_manager._move_folder("/foods/fruits", "/foods/fruits/fuji")
+        mocked_warning.assert_any_call("ERROR MOVE: fruits can't be moved into itself")
+
+
+def test_delete_folder_removes_subtree(directory_manager):
+    directory_manager._delete_folder("/foods/fruits")
+
+    assert directory_manager._get_folder_id(["foods", "fruits", "fuji"]) == ("", False)
+    assert "de54de84-83e0-48ae-b3ac-ecd760229c81" not in directory_manager.directory[2]
+    assert len(directory_manager.directory[1]) == 2
+
+
+def test_show_directory_refreshes_only_changed_subtrees(directory_manager):
+    directory_manager.command_execute("CREATE drinks")
+    directory_manager._show_directory()
+    drinks_id, _ = directory_manager._get_folder_id(["drinks"])
+    drinks_lines = directory_manager._render_cache[drinks_id]
+
+    directory_manager.command_execute("CREATE foods/grains/rice")
+
+    assert directory_manager._render_cache[drinks_id] is drinks_lines
+    with patch("loguru.logger.info") as mock_info:
+        directory_manager._show_directory()
+        actual_output = [call[0][0] for call in mock_info.call_args_list]
+        assert actual_output[1:6] == ["drinks", "foods", " fruits", "  fuji", " grains"]
+        assert actual_output[6] == "  rice"
+
+
+def expected_tree(directory_manager):
+    return [
+        " " * folder_path.count("/") + folder_path.rsplit("/", 1)[-1]
+        for folder_path in directory_manager.iter_directory()
+    ] or ["EMPTY DIRECTORY"]
+
+
+@pytest.mark.parametrize("workload", ["move", "delete"])
+def test_render_cache_matches_the_tree(workload):
+    directory_manager = DirectoryManager(output=MemorySink())
+    with patch("services.directory_manager.RENDER_CHUNK_SIZE", 2):
+        for index, command in enumerate(build_workload(workload, scale=0.02)):
+            directory_manager.command_execute(command)
+            if index % 37 == 0:
+                directory_manager._output.lines.clear()
+                directory_manager.command_execute("LIST")
+                assert directory_manager._output.lines[1:] == expected_tree(
+                    directory_manager
+                )
+
+
+def test_render_cache_rerenders_one_chunk_of_a_wide_folder():
+    directory_manager = DirectoryManager(output=MemorySink())
+    directory_manager.bulk_load(f"root/f{index:05}" for index in range(5000))
+    directory_manager.command_execute("LIST")
+    storage = directory_manager._storage
+    iter_children = storage.iter_children
+    rendered = []
+
+    def counted(*args):
+        for child in iter_children(*args):
+            rendered.append(child)
+            yield child
+
+    storage.iter_children = counted
+    directory_manager.command_execute("CREATE root/f02500x")
+    directory_manager.command_execute("DELETE root/f04000")
+    directory_manager.command_execute("LIST")
+
+    assert len(rendered) < 4 * 256
+    assert directory_manager._output.lines[-5001:] == expected_tree(directory_manager)
+
+
+def list_output(directory_manager, command):
+    with patch("loguru.logger.info") as mock_info:
+        directory_manager.command_execute(command)
+        return [call[0][0] for call in mock_info.call_args_list]
+
+
+def test_iter_directory(directory_manager):
+    assert list(directory_manager.iter_directory("/foods", depth=1)) == [
+        "fruits",
+        "grains",
+        "vegetables",
+    ]
+    assert list(directory_manager.iter_directory("/foods", limit=3)) == [
+        "fruits",
+        "fruits/fuji",
+        "grains",
+    ]
+    assert list(directory_manager.iter_directory("/foods", after="fruits/fuji")) == [
+        "grains",
+        "vegetables",
+        "vegetables/squash",
+    ]
+    assert list(directory_manager.iter_directory("/", after="foods", depth=2)) == [
+        "foods/fruits",
+        "foods/grains",
+        "foods/vegetables",
+    ]
+    assert (
+        list(directory_manager.iter_directory("/", after="foods/fruits", depth=1)) == []
+    )
+
+
+def test_show_directory_scoped(directory_manager):
+    assert list_output(directory_manager, "LIST /foods/vegetables") == [
+        "LIST /foods/vegetables",
+        "squash",
+    ]
+    assert list_output(directory_manager, "LIST /foods/grains") == [
+        "LIST /foods/grains",
+        "EMPTY DIRECTORY",
+    ]
+
+
+def test_show_directory_paginated(directory_manager):
+    assert list_output(directory_manager, "LIST foods --limit 2") == [
+        "LIST foods --limit 2",
+        "fruits",
+        " fuji",
+        "NEXT fruits/fuji",
+    ]
+    assert list_output(
+        directory_manager, "LIST foods --limit 2 --after fruits/fuji"
+    ) == [
+        "LIST foods --limit 2 --after fruits/fuji",
+        "grains",
+        "vegetables",
+        "NEXT vegetables",
+    ]
+    assert list_output(directory_manager, "LIST foods --after vegetables/squash") == [
+        "LIST foods --after vegetables/squash",
+    ]
+
+
+def test_show_directory_invalid_arguments(directory_manager):
+    with patch("loguru.logger.warning") as mocked_warning:
+        directory_manager.command_execute("LIST --depth zero")
+        mocked_warning.assert_called_once_with(
+            "ERROR LIST: invalid arguments --depth zero"
+        )
+        directory_manager.command_execute("LIST --depth ²")
+        mocked_warning.assert_called_with("ERROR LIST: invalid arguments --depth ²")
+        directory_manager.command_execute("LIST /missing")
+        mocked_warning.assert_called_with("Cannot list: /missing doesn't exist")
+
+
+def test_bulk_load(directory_manager):
+    with patch("loguru.logger.info") as mocked_info:
+        added = directory_manager.bulk_load(
+            ["animals/cats", "animals/dogs/beagle", "foods/fruits/pears", "foods"]
+        )
+        mocked_info.assert_not_called()
+
+    assert added == 5
+    assert list(directory_manager.iter_directory(depth=2)) == [
+        "animals",
+        "animals/cats",
+        "animals/dogs",
+        "foods",
+        "foods/fruits",
+        "foods/grains",
+        "foods/vegetables",
+    ]
+    assert list(directory_manager.iter_directory("foods/fruits")) == [
+        "fuji",
+        "pears",
+    ]
+
+
+def test_bulk_load_directory(tmp_path):
+    for path in ["foods/fruits/apples", "foods/grains", "animals"]:
+        (tmp_path / path).mkdir(parents=True)
+    (tmp_path / "foods" / "notes.txt").write_text("not a folder")
+
+    directory_manager = DirectoryManager()
+
+    assert directory_manager.bulk_load_directory(str(tmp_path)) == 5
+    assert list(directory_manager.iter_directory()) == [
+        "animals",
+        "foods",
+        "foods/fruits",
+        "foods/fruits/apples",
+        "foods/grains",
+    ]
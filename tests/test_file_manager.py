@@ -0,0 +1,126 @@
+import gzip
+from unittest.mock import patch
+
+import pytest
+
+from services import FileManger, MemorySink, NullSink
+
+COMMANDS = "CREATE fruits\nCREATE fruits/apples\nLIST\n"
+
+
+def executed_commands(file_manager):
+    with patch.object(
+        file_manager.directory_manager, "command_execute"
+    ) as mock_execute:
+        file_manager.execute()
+        return [call.kwargs["command"] for call in mock_execute.call_args_list]
+
+
+def test_file_processing_streams_lines(tmp_path):
+    file_path = tmp_path / "commands.txt"
+    file_path.write_text(COMMANDS)
+
+    file_manager = FileManger(file_path=str(file_path), buffer_size=4)
+
+    assert executed_commands(file_manager) == [
+        "CREATE fruits",
+        "CREATE fruits/apples",
+        "LIST",
+    ]
+
+
+def test_file_processing_gzip(tmp_path):
+    file_path = tmp_path / "commands.txt.gz"
+    file_path.write_bytes(gzip.compress(COMMANDS.encode()))
+
+    assert executed_commands(FileManger(file_path=str(file_path)))[-1] == "LIST"
+
+
+def test_file_processing_zstd(tmp_path):
+    zstandard = pytest.importorskip("zstandard")
+    file_path = tmp_path / "commands.txt.zst"
+    file_path.write_bytes(zstandard.ZstdCompressor().compress(COMMANDS.encode()))
+
+    assert executed_commands(FileManger(file_path=str(file_path)))[-1] == "LIST"
+
+
+def test_file_processing_stdin(tmp_path):
+    file_path = tmp_path / "commands.txt"
+    file_path.write_text(COMMANDS)
+
+    with open(file_path, "rb") as stdin, patch("sys.stdin", stdin):
+        assert len(executed_commands(FileManger(file_path="-"))) == 3
+
+
+def test_missing_file():
+    file_manager = FileManger(file_path="missing.txt")
+
+    with patch("loguru.logger.warning") as mocked_warning:
+        assert executed_commands(file_manager) == []
+        mocked_warning.assert_called_once_with("File not found: missing.txt")
+
+
+def test_directory_of_files_is_processed_in_natural_order(tmp_path):
+    (tmp_path / "commands.10").write_text("CREATE fruits/apples\n")
+    (tmp_path / "commands.2").write_bytes(gzip.compress(b"CREATE fruits"))
+    (tmp_path / "commands.1").write_text("LIST\r\n")
+
+    assert executed_commands(FileManger(file_path=str(tmp_path), buffer_size=3)) == [
+        "LIST",
+        "CREATE fruits",
+        "CREATE fruits/apples",
+    ]
+
+
+def test_natural_order_compares_only_decimal_numbers():
+    file_names = ["cmd.1\u00b22", "cmd.10", "cmd.1\u00b21", "cmd.2"]
+
+    assert sorted(file_names, key=FileManger._natural_key) == [
+        "cmd.1\u00b21",
+        "cmd.1\u00b22",
+        "cmd.2",
+        "cmd.10",
+    ]
+
+
+@pytest.mark.parametrize("read_ahead", [0, 1, 16])
+def test_many_files_with_a_compiled_script(tmp_path, read_ahead):
+    script_path = tmp_path / "middle.bin"
+    (tmp_path / "middle.txt").write_text("CREATE fruits/apples\nCREATE fruits/pears\n")
+    FileManger(file_path=str(tmp_path / "middle.txt")).compile(str(script_path))
+    (tmp_path / "first.txt").write_text("CREATE fruits\n\n  CREATE vegetables  ")
+    (tmp_path / "last.txt").write_text("DELETE vegetables\nLIST\n")
+    sink = MemorySink()
+
+    FileManger(
+        file_path=[
+            str(tmp_path / name) for name in ("first.txt", "middle.bin", "last.txt")
+        ],
+        output=sink,
+        read_ahead=read_ahead,
+    ).execute()
+
+    assert sink.lines[-4:] == ["LIST", "fruits", " apples", " pears"]
+    assert sink.lines[:3] == [
+        "CREATE fruits",
+        "CREATE vegetables",
+        "CREATE fruits/apples",
+    ]
+
+
+def test_read_errors_reach_the_executing_thread(tmp_path):
+    (tmp_path / "commands.txt").write_bytes(b"CREATE fruits\n\xff\n")
+
+    with pytest.raises(UnicodeDecodeError):
+        FileManger(
+            file_path=str(tmp_path / "commands.txt"), output=NullSink()
+        ).execute()
+
+
+def test_missing_file_among_many_processes_nothing(tmp_path):
+    (tmp_path / "commands.txt").write_text(COMMANDS)
+    file_manager = FileManger(file_path=[str(tmp_path / "commands.txt"), "missing.txt"])
+
+    with patch("loguru.logger.warning") as mocked_warning:
+        assert executed_commands(file_manager) == []
+        mocked_warning.assert_called_once_with("File not found: missing.txt")
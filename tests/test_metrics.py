@@ -0,0 +1,94 @@
+import json
+from unittest.mock import patch
+
+from services import DirectoryManager, FileManger, Metrics, NullSink
+
+COMMANDS = [
+    "CREATE fruits",
+    "CREATE fruits/apples",
+    "CREATE fruits/apples/fuji",
+    "CREATE vegetables",
+    "CREATE grains/squash",
+    "MOVE fruits/pears vegetables",
+    "LIST",
+]
+
+
+def run_commands(metrics):
+    directory_manager = DirectoryManager(output=NullSink(), metrics=metrics)
+    for command in COMMANDS:
+        directory_manager.command_execute(command)
+    return directory_manager
+
+
+@patch("loguru.logger.warning")
+def test_metrics_record_latencies_and_errors(mock_logger_warning):
+    metrics = Metrics()
+    run_commands(metrics)
+
+    assert metrics.latencies["CREATE"].count == 5
+    assert metrics.latencies["MOVE"].count == 1
+    assert metrics.latencies["LIST"].cumulative_counts()[-1] == 1
+    assert metrics.errors == {"missing_parent": 1, "missing_folder": 1}
+    assert 0 < metrics.output_ns <= metrics.command_ns
+
+
+@patch("loguru.logger.warning")
+def test_metrics_can_be_disabled_at_runtime(mock_logger_warning):
+    metrics = Metrics(enabled=False)
+    directory_manager = run_commands(metrics)
+
+    assert metrics.latencies == {} and metrics.errors == {}
+    metrics.enabled = True
+    directory_manager.command_execute("LIST")
+    assert list(metrics.latencies) == ["LIST"]
+
+
+@patch("loguru.logger.warning")
+def test_metrics_export(mock_logger_warning):
+    metrics = Metrics()
+    run_commands(metrics)
+
+    snapshot = json.loads(metrics.to_json())
+    assert snapshot["folders_per_depth"] == {"0": 2, "1": 1, "2": 1}
+    assert snapshot["commands"]["CREATE"]["buckets"]["+Inf"] == 5
+
+    text = metrics.to_prometheus()
+    assert 'directory_command_duration_seconds_count{command="CREATE"} 5' in text
+    assert (
+        'directory_command_duration_seconds_bucket{command="MOVE",le="+Inf"} 1' in text
+    )
+    assert 'directory_errors_total{error="missing_parent"} 1' in text
+    assert 'directory_folders{depth="2"} 1' in text
+    assert 'directory_phase_seconds_total{phase="output"}' in text
+
+
+def test_unknown_commands_share_one_label_and_labels_are_escaped():
+    metrics = Metrics()
+    directory_manager = DirectoryManager(output=NullSink(), metrics=metrics)
+    for command in ['bad"label\\x', "", "CRAETE fruits"]:
+        directory_manager.command_execute(command)
+    metrics.count_error('odd"kind\n')
+
+    assert list(metrics.latencies) == ["UNKNOWN"]
+    assert metrics.latencies["UNKNOWN"].count == 3
+    text = metrics.to_prometheus()
+    assert 'directory_command_duration_seconds_count{command="UNKNOWN"} 3' in text
+    assert 'directory_errors_total{error="odd\\"kind\\n"} 1' in text
+
+
+@patch("loguru.logger.info")
+def test_file_manager_profiler_logs_a_report(mock_logger_info, tmp_path):
+    file_path = tmp_path / "commands.txt"
+    file_path.write_text("CREATE fruits\nLIST\n")
+    profile_path = tmp_path / "commands.prof"
+
+    FileManger(
+        file_path=str(file_path),
+        output=NullSink(),
+        profiler="cprofile",
+        profile_path=str(profile_path),
+    ).execute()
+
+    assert profile_path.exists()
+    assert mock_logger_info.call_args[0][0].startswith("cProfile report:")
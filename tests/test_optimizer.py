@@ -0,0 +1,93 @@
+import io
+from unittest.mock import patch
+
+from benchmarks.workloads import build_workload
+from services import DictStorage, DirectoryManager, FileManger, JsonLinesSink
+from services.optimizer import find_transient_subtrees
+
+COMMANDS = [
+    "CREATE fruits",
+    "LIST",
+    "LIST",
+    "CREATE tmp",
+    "CREATE tmp/a",
+    "CREATE tmp/a",
+    "CREATE tmp/b/c",
+    "CREATE fruits/apples",
+    "DELETE tmp",
+    "LIST",
+    "LIST",
+    "CREATE fruits",
+    "CREATE fruits/pears",
+    "DELETE fruits",
+    "CREATE grains/squash",
+    "CREATE held",
+    "MOVE fruits held",
+    "DELETE held",
+    "LIST",
+]
+
+
+def run(commands, batched, window=4096):
+    stream = io.StringIO()
+    directory_manager = DirectoryManager(output=JsonLinesSink(stream=stream))
+    if batched:
+        directory_manager.execute_many(commands, window=window)
+    else:
+        for command in commands:
+            directory_manager.command_execute(command)
+    directory_manager._output.close()
+    return stream.getvalue(), list(directory_manager.iter_directory())
+
+
+def test_find_transient_subtrees():
+    groups = find_transient_subtrees(COMMANDS)
+
+    assert groups == {3: 3, 4: 3, 5: 3, 6: 3, 8: 3, 11: 11, 12: 11, 13: 11}
+
+
+@patch("loguru.logger.warning")
+def test_execute_many_matches_command_execute(mock_logger_warning):
+    expected_output, expected_tree = run(COMMANDS, batched=False)
+    expected_warnings = mock_logger_warning.call_args_list.copy()
+    mock_logger_warning.reset_mock()
+
+    output, tree = run(COMMANDS, batched=True)
+    assert output == expected_output
+    assert tree == expected_tree
+    assert mock_logger_warning.call_args_list == expected_warnings
+
+
+@patch("loguru.logger.warning")
+def test_execute_many_skips_transient_folders(mock_logger_warning):
+    storage = DictStorage()
+    directory_manager = DirectoryManager(storage=storage, output=JsonLinesSink())
+    with patch.object(storage, "add_folder", wraps=storage.add_folder) as add_folder:
+        directory_manager.execute_many(COMMANDS)
+
+    added = [call.args[0] for call in add_folder.call_args_list]
+    assert "tmp" not in added and "a" not in added
+    assert "pears" in added
+
+
+def test_execute_many_matches_command_execute_on_workloads():
+    for name in ("delete", "move"):
+        commands = list(build_workload(name, scale=0.05))
+        assert run(commands, batched=True, window=64) == run(commands, batched=False)
+
+
+@patch("loguru.logger.info")
+def test_file_manager_batch_window(mock_logger_info, tmp_path):
+    file_path = tmp_path / "commands.txt"
+    file_path.write_text("CREATE tmp\nCREATE tmp/a\nDELETE tmp\nLIST\n")
+
+    FileManger(file_path=str(file_path), batch_window=16).execute()
+
+    logged = [call[0][0] for call in mock_logger_info.call_args_list]
+    assert logged == [
+        "CREATE tmp",
+        "CREATE tmp/a",
+        "DELETE tmp",
+        "LIST",
+        "EMPTY DIRECTORY",
+    ]
@@ -0,0 +1,79 @@
+import io
+import json
+import threading
+
+from services import BufferedSink, DirectoryManager, JsonLinesSink, NullSink
+
+COMMANDS = ["CREATE fruits", "CREATE fruits/apples", "LIST"]
+
+
+def run_commands(output):
+    directory_manager = DirectoryManager(output=output)
+    for command in COMMANDS:
+        directory_manager.command_execute(command)
+    output.close()
+
+
+def test_buffered_sink_writes_in_batches():
+    stream = io.StringIO()
+    output = BufferedSink(stream=stream, batch_size=3)
+
+    output.write("CREATE fruits")
+    output.write("CREATE fruits/apples")
+    assert stream.getvalue() == ""
+    output.write_lines(["LIST", "fruits"])
+    assert stream.getvalue() == "CREATE fruits\nCREATE fruits/apples\nLIST\nfruits\n"
+
+
+def test_buffered_sink_background_writer():
+    stream = io.StringIO()
+    run_commands(BufferedSink(stream=stream, batch_size=2, background=True))
+
+    assert stream.getvalue() == (
+        "CREATE fruits\nCREATE fruits/apples\nLIST\nfruits\n apples\n"
+    )
+
+
+def test_json_lines_sink_writes_one_object_per_command():
+    stream = io.StringIO()
+    run_commands(JsonLinesSink(stream=stream))
+
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert records[0] == {"command": "CREATE fruits", "output": ["CREATE fruits"]}
+    assert records[2] == {"command": "LIST", "output": ["LIST", "fruits", " apples"]}
+
+
+def test_null_sink_drops_output(capsys):
+    run_commands(NullSink())
+
+    assert capsys.readouterr().out == ""
+
+
+class FailingStream(io.StringIO):
+    def write(self, text):
+        raise OSError("No space left on device")
+
+
+def test_background_writer_error_is_raised_instead_of_hanging():
+    sink = BufferedSink(FailingStream(), batch_size=1, background=True, queue_size=2)
+    errors = []
+
+    def write():
+        try:
+            for index in range(10):
+                sink.write(f"line {index}")
+        except OSError as error:
+            errors.append(error)
+        for call in (sink.flush, sink.close):
+            try:
+                call()
+            except OSError as error:
+                errors.append(error)
+
+    writer = threading.Thread(target=write, daemon=True)
+    writer.start()
+    writer.join(timeout=5)
+
+    assert not writer.is_alive()
+    assert len(errors) == 3
+    assert str(errors[0]) == "No space left on device"
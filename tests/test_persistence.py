@@ -0,0 +1,106 @@
+from unittest.mock import patch
+
+import pytest
+
+from services import CompactStorage, DirectoryManager, Metrics, NullSink, Persistence
+
+COMMANDS = [
+    "CREATE foods",
+    "CREATE foods/fruits",
+    "CREATE foods/fruits/apples",
+    "CREATE foods/vegetables",
+    "LIST",
+    "MOVE foods/fruits/apples foods/vegetables",
+    "DELETE foods/fruits",
+]
+
+
+@pytest.fixture
+def persistence_paths(tmp_path):
+    return str(tmp_path / "tree.snapshot"), str(tmp_path / "tree.wal")
+
+
+def open_directory_manager(persistence_paths, **kwargs):
+    return DirectoryManager(
+        output=NullSink(), persistence=Persistence(*persistence_paths, **kwargs)
+    )
+
+
+def test_restore_replays_wal(persistence_paths):
+    directory_manager = open_directory_manager(persistence_paths)
+    for command in COMMANDS:
+        directory_manager.command_execute(command)
+    directory_manager._persistence.close()
+
+    with open(persistence_paths[1]) as wal:
+        assert wal.readline() == "1 CREATE foods\n"
+        assert len(wal.readlines()) == 5
+
+    restored = open_directory_manager(persistence_paths)
+    assert list(restored.iter_directory()) == list(directory_manager.iter_directory())
+    assert restored._persistence.seq == 6
+
+
+def test_checkpoint_writes_snapshot_and_truncates_wal(persistence_paths):
+    directory_manager = open_directory_manager(persistence_paths, checkpoint_interval=4)
+    for command in COMMANDS:
+        directory_manager.command_execute(command)
+    directory_manager._persistence.close()
+
+    with open(persistence_paths[1]) as wal:
+        assert wal.read() == (
+            "5 MOVE foods/fruits/apples foods/vegetables\n6 DELETE foods/fruits\n"
+        )
+
+    restored = DirectoryManager(
+        storage=CompactStorage(),
+        output=NullSink(),
+        persistence=Persistence(*persistence_paths),
+    )
+    assert list(restored.iter_directory()) == [
+        "foods",
+        "foods/vegetables",
+        "foods/vegetables/apples",
+    ]
+
+
+def test_restore_drops_torn_wal_entry(persistence_paths):
+    with open(persistence_paths[1], "w") as wal:
+        wal.write("1 CREATE foods\n2 CREATE foods/fru")
+
+    directory_manager = open_directory_manager(persistence_paths)
+    directory_manager.command_execute("CREATE foods/vegetables")
+    directory_manager._persistence.close()
+
+    with open(persistence_paths[1]) as wal:
+        assert wal.read() == "1 CREATE foods\n2 CREATE foods/vegetables\n"
+
+
+def test_bulk_load_is_checkpointed(persistence_paths):
+    directory_manager = open_directory_manager(persistence_paths)
+    directory_manager.command_execute("CREATE foods")
+    directory_manager.bulk_load(["foods/fruits/apples", "animals"])
+    directory_manager._persistence.close()
+
+    restored = open_directory_manager(persistence_paths)
+    assert list(restored.iter_directory()) == list(directory_manager.iter_directory())
+
+
+def test_restore_does_not_report_the_errors_again(persistence_paths):
+    directory_manager = open_directory_manager(persistence_paths)
+    for command in ["CREATE foods", "CREATE foods", "DELETE missing"]:
+        directory_manager.command_execute(command)
+    directory_manager._persistence.close()
+
+    metrics = Metrics()
+    with patch("loguru.logger.warning") as mocked_warning:
+        restored = DirectoryManager(
+            output=NullSink(),
+            persistence=Persistence(*persistence_paths),
+            metrics=metrics,
+        )
+        mocked_warning.assert_not_called()
+    assert metrics.errors == {}
+    assert list(restored.iter_directory()) == ["foods"]
+    restored.command_execute("CREATE foods")
+    assert sum(metrics.errors.values()) == 1
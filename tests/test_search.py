@@ -0,0 +1,128 @@
+from unittest.mock import patch
+
+import pytest
+
+from benchmarks.workloads import build_workload
+from services import (
+    CompactStorage,
+    DictStorage,
+    DirectoryManager,
+    IndexedStorage,
+    MemorySink,
+    SQLiteStorage,
+)
+
+COMMANDS = [
+    "CREATE foods",
+    "CREATE foods/fruits",
+    "CREATE foods/fruits/apples",
+    "CREATE foods/fruits/apricots",
+    "CREATE foods/vegetables",
+    "CREATE foods/vegetables/apples",
+    "CREATE animals",
+    "MOVE foods/fruits animals",
+    "DELETE foods/vegetables",
+]
+
+
+@pytest.fixture(params=[DictStorage, CompactStorage, SQLiteStorage])
+def directory_manager(request):
+    dm = DirectoryManager(
+        storage=IndexedStorage(request.param()), output=MemorySink(), reclaim_budget=1
+    )
+    for command in COMMANDS:
+        dm.command_execute(command)
+    return dm
+
+
+def test_find(directory_manager):
+    assert directory_manager.find("apples") == ["animals/fruits/apples"]
+    assert directory_manager.find("ap*") == [
+        "animals/fruits/apples",
+        "animals/fruits/apricots",
+    ]
+    assert directory_manager.find("*s") == [
+        "animals",
+        "animals/fruits",
+        "animals/fruits/apples",
+        "animals/fruits/apricots",
+        "foods",
+    ]
+    assert directory_manager.find("vegetables") == []
+
+
+def test_count(directory_manager):
+    assert directory_manager.count() == 5
+    assert directory_manager.count("animals") == 3
+    assert directory_manager.count("animals/fruits/apples") == 0
+    assert directory_manager.count("foods") == 0
+    assert directory_manager.count("missing") is None
+
+
+def test_reclaim_removes_folders_from_the_index(directory_manager):
+    directory_manager._storage.reclaim()
+
+    assert "vegetables" not in directory_manager._storage._names
+    assert len(directory_manager._storage._names["apples"]) == 1
+
+
+def test_find_and_count_commands(directory_manager):
+    directory_manager._output.lines.clear()
+    with patch("loguru.logger.warning") as mocked_warning:
+        for command in ["FIND apri*", "FIND pears", "COUNT animals", "COUNT", "FIND"]:
+            directory_manager.command_execute(command)
+        directory_manager.command_execute("COUNT missing")
+        mocked_warning.assert_any_call("ERROR FIND: missing pattern")
+        mocked_warning.assert_called_with("Cannot count: missing doesn't exist")
+
+    assert directory_manager._output.lines == [
+        "FIND apri*",
+        "animals/fruits/apricots",
+        "FIND pears",
+        "NOT FOUND",
+        "COUNT animals",
+        "3",
+        "COUNT",
+        "5",
+        "FIND",
+        "COUNT missing",
+    ]
+
+
+@pytest.mark.parametrize("name", ["move", "delete"])
+def test_index_matches_full_walk(name):
+    indexed = DirectoryManager(
+        storage=IndexedStorage(CompactStorage()), output=MemorySink()
+    )
+    walked = DirectoryManager(storage=CompactStorage(), output=MemorySink())
+    for command in build_workload(name, scale=0.02):
+        indexed.command_execute(command)
+        walked.command_execute(command)
+
+    for pattern in ["f1*", "n?", "leaf", "s[0-2]*", "*"]:
+        assert indexed.find(pattern) == walked.find(pattern)
+    for folder_path in ["/", "r0", "r1/f3", "s0"]:
+        assert indexed.count(folder_path) == walked.count(folder_path)
+
+
+def test_reopened_sqlite_database_is_indexed(tmp_path):
+    path = str(tmp_path / "tree.db")
+    storage = SQLiteStorage(path)
+    directory_manager = DirectoryManager(storage=storage, output=MemorySink())
+    for command in COMMANDS:
+        directory_manager.command_execute(command)
+    # Left for `reclaim`, like after a crash.
+    storage.remove_folder(
+        directory_manager._get_folder_id(["animals", "fruits", "apricots"])[0]
+    )
+    storage.close()
+
+    directory_manager = DirectoryManager(
+        storage=IndexedStorage(SQLiteStorage(path)), output=MemorySink()
+    )
+    assert directory_manager.count() == 4
+    assert directory_manager.count("animals") == 2
+    assert directory_manager.find("ap*") == ["animals/fruits/apples"]
+    directory_manager.command_execute("DELETE animals/fruits")
+    assert directory_manager.count() == 2
+    assert directory_manager.find("*s") == ["animals", "foods"]
@@ -0,0 +1,128 @@
+import asyncio
+
+from benchmarks.loadtest import client_commands, load_test
+from services import CommandServer, DirectoryManager, MemorySink
+
+COMMANDS = [
+    "CREATE foods",
+    "CREATE foods/fruits",
+    "CREATE foods/fruits/apples",
+    "CREATE foods/fruits",
+    "MOVE foods/fruits /",
+    "LIST",
+    "LIST fruits --depth 1 --limit 1",
+    "LIST missing",
+    "DELETE foods",
+    "LIST",
+]
+
+
+async def request(server: CommandServer, payload: bytes) -> bytes:
+    reader, writer = await asyncio.open_connection(*server.address)
+    writer.write(payload)
+    writer.write_eof()
+    data = await reader.read()
+    writer.close()
+    await writer.wait_closed()
+    return data
+
+
+def serve(payload: bytes, **kwargs) -> bytes:
+    async def main():
+        server = CommandServer(**kwargs)
+        await server.start("127.0.0.1", 0)
+        try:
+            return await request(server, payload)
+        finally:
+            await server.close()
+
+    return asyncio.run(main())
+
+
+def test_pipelined_responses_match_directory_manager():
+    sink = MemorySink()
+    directory_manager = DirectoryManager(output=sink)
+    expected = []
+    for command in COMMANDS:
+        directory_manager.command_execute(command)
+        expected.extend(sink.lines + [""])
+        sink.lines.clear()
+
+    data = serve("".join(f"{command}\n" for command in COMMANDS).encode())
+    responses = data.decode().split("\n")[:-1]
+
+    warnings = [line for line in responses if line.startswith("WARNING ")]
+    assert warnings == [
+        "WARNING ERROR CREATING: fruits already exists",
+        "WARNING Cannot list: missing doesn't exist",
+    ]
+    assert [line for line in responses if line not in warnings] == expected
+
+
+def test_large_list_is_streamed_in_chunks():
+    commands = ["CREATE big"] + [f"CREATE big/f{index:04}" for index in range(300)]
+    payload = "\n".join(commands + ["LIST big"]).encode()
+
+    data = serve(payload, chunk_size=16)
+    responses = data.decode().split("\n\n")
+
+    assert responses[-2].split("\n") == ["LIST big"] + [
+        f"f{index:04}" for index in range(300)
+    ]
+
+
+def test_client_commands_are_scoped_to_the_client():
+    assert client_commands(["CREATE a", "MOVE a/b /", "LIST"], 3) == [
+        "CREATE client3",
+        "CREATE client3/a",
+        "MOVE client3/a/b client3",
+        "LIST client3",
+    ]
+
+
+def test_load_test_reports_latency():
+    async def main():
+        server = CommandServer()
+        await server.start("127.0.0.1", 0)
+        try:
+            commands = ["CREATE a", "CREATE a/b", "LIST", "MOVE a/b /", "DELETE a"]
+            return await load_test(commands, 3, 2, *server.address)
+        finally:
+            await server.close()
+
+    report = asyncio.run(main())
+
+    assert report["commands"] == 18
+    assert 0 < report["p50_us"] <= report["p99_us"]
+
+
+def test_list_since_returns_the_changes_between_polls():
+    commands = ["CREATE foods", "LIST --since 0", "CREATE foods/fruits", "DELETE foods"]
+    data = serve(
+        "".join(f"{command}\n" for command in commands + ["LIST --since 1"]).encode()
+    )
+    responses = data.decode().split("\n\n")
+
+    assert responses[1] == "LIST --since 0\nCREATE foods\nSEQ 1"
+    assert responses[4] == "LIST --since 1\nCREATE foods/fruits\nDELETE foods\nSEQ 3"
+
+
+def test_invalid_and_over_long_lines_get_a_warning_and_the_rest_is_served():
+    payload = b"CREATE a\n\xff\xfe\nCREATE " + b"x" * 200 + b"\nCREATE b\nLIST\n"
+
+    data = serve(payload, max_line_size=64, read_size=16)
+    responses = data.decode().split("\n\n")
+
+    assert responses[:5] == [
+        "CREATE a",
+        "WARNING Command is not valid UTF-8",
+        "WARNING Command longer than 64 bytes",
+        "CREATE b",
+        "LIST\na\nb",
+    ]
+
+
+def test_blank_lines_get_an_empty_response():
+    data = serve(b"CREATE a\n\n  \nLIST\n")
+
+    assert data == b"CREATE a\n\n\n\nLIST\na\n\n"
@@ -0,0 +1,117 @@
+import io
+from unittest.mock import patch
+
+import pytest
+
+from benchmarks.workloads import build_workload
+from services import (
+    CompactStorage,
+    DirectoryManager,
+    FileManger,
+    JsonLinesSink,
+    MemorySink,
+    ShardedExecutor,
+    SQLiteStorage,
+)
+
+COMMANDS = [
+    "LIST",
+    "CREATE fruits",
+    "CREATE vegetables",
+    "CREATE grains",
+    "CREATE fruits/apples",
+    "CREATE fruits/apples/fuji",
+    "CREATE vegetables/squash",
+    "CREATE grains/squash",
+    "CREATE fruits/apples",
+    "LIST",
+    "MOVE grains/squash vegetables",
+    "MOVE fruits/apples grains",
+    "MOVE grains/apples /",
+    "MOVE vegetables/squash /",
+    "MOVE apples/fuji fruits",
+    "MOVE pears grains",
+    "MOVE fruits/fuji oats",
+    "LIST",
+    "LIST / --depth 1",
+    "LIST --limit 2",
+    "LIST --limit 2 --after fruits/fuji",
+    "LIST apples",
+    "LIST fruits --depth 1",
+    "LIST oats",
+    "LIST --depth",
+    "FIND squash",
+    "FIND *s",
+    "FIND",
+    "COUNT",
+    "COUNT apples",
+    "COUNT oats",
+    "DELETE fruits",
+    "DELETE fruits",
+    "LIST",
+]
+
+
+def run(commands, sharded):
+    stream = io.StringIO()
+    output = JsonLinesSink(stream=stream)
+    if sharded:
+        with ShardedExecutor(workers=3, output=output, batch_size=2) as executor:
+            executor.execute_many(commands)
+    else:
+        directory_manager = DirectoryManager(output=output)
+        for command in commands:
+            directory_manager.command_execute(command)
+    output.close()
+    return stream.getvalue()
+
+
+@patch("loguru.logger.warning")
+def test_sharded_execution_matches_sequential(mock_logger_warning):
+    expected = run(COMMANDS, sharded=False)
+    expected_warnings = mock_logger_warning.call_args_list.copy()
+    mock_logger_warning.reset_mock()
+
+    assert run(COMMANDS, sharded=True) == expected
+    assert mock_logger_warning.call_args_list == expected_warnings
+
+
+def test_sharded_execution_matches_sequential_on_workloads():
+    commands = list(build_workload("move", scale=0.02))
+    assert run(commands, sharded=True) == run(commands, sharded=False)
+
+
+@patch("loguru.logger.info")
+def test_file_manager_workers(mock_logger_info, tmp_path):
+    file_path = tmp_path / "commands.txt"
+    file_path.write_text("CREATE b\nCREATE a\nCREATE c\nCREATE a/x\nMOVE c a\nLIST\n")
+
+    FileManger(file_path=str(file_path), storage=CompactStorage(), workers=2).execute()
+
+    logged = [call[0][0] for call in mock_logger_info.call_args_list]
+    assert logged[-5:] == ["LIST", "a", " c", " x", "b"]
+
+
+def _fail(directory_manager):
+    raise LookupError("broken shard")
+
+
+def test_worker_errors_are_raised_instead_of_hanging():
+    with ShardedExecutor(workers=2, output=MemorySink()) as executor:
+        with pytest.raises(LookupError, match="broken shard"):
+            executor._call([0, 1], _fail)
+        executor.command_execute("CREATE fruits")
+        executor.command_execute("COUNT")
+        assert executor.output.lines[-1] == "1"
+
+        executor._processes[1].kill()
+        executor._processes[1].join()
+        with pytest.raises(RuntimeError, match="shard 1 exited"):
+            executor.command_execute("COUNT")
+
+
+def test_workers_reject_an_on_disk_database(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "tree.db"))
+    with pytest.raises(ValueError, match="on-disk"):
+        FileManger(file_path="commands.txt", storage=storage, workers=2)
+    storage.close()
@@ -0,0 +1,228 @@
+import tracemalloc
+from unittest.mock import patch
+
+import pytest
+
+from services import CompactStorage, DictStorage, DirectoryManager, SQLiteStorage
+from services.storage import ROOT_ID
+
+
+@pytest.fixture(params=[DictStorage, CompactStorage, SQLiteStorage])
+def directory_manager(request):
+    dm = DirectoryManager(storage=request.param())
+    for command in [
+        "CREATE foods",
+        "CREATE foods/fruits",
+        "CREATE foods/fruits/apples",
+        "CREATE foods/fruits/apples/fuji",
+        "CREATE foods/vegetables",
+        "CREATE animals",
+        "CREATE animals/fruits",
+    ]:
+        dm.command_execute(command)
+    return dm
+
+
+def folder_names(directory):
+    return {
+        depth: sorted(folder["name"] for folder in folders.values())
+        for depth, folders in directory.items()
+    }
+
+
+def test_compact_storage_allocates_integer_ids():
+    storage = CompactStorage()
+    first_id = storage.add_folder("foods", None)
+    second_id = storage.add_folder("fruits", first_id)
+
+    assert (first_id, second_id) == (0, 1)
+    assert storage.get_folder(second_id) == ("fruits", 0)
+    assert storage.get_depth(second_id) == 1
+    assert storage.to_dict() == {
+        0: {0: {"name": "foods", "parent_id": None}},
+        1: {1: {"name": "fruits", "parent_id": 0}},
+    }
+
+
+def test_compact_storage_interns_names():
+    storage = CompactStorage()
+    storage.add_folder("".join(["fru", "its"]), None)
+    storage.add_folder("".join(["fr", "uits"]), 0)
+
+    assert storage._names[0] is storage._names[1]
+
+
+def test_compact_storage_load_dict_remaps_ids():
+    storage = CompactStorage()
+    storage.load_dict(
+        {
+            0: {"a": {"name": "foods", "parent_id": None}},
+            1: {"b": {"name": "fruits", "parent_id": "a"}},
+        }
+    )
+
+    assert storage.get_child(storage.get_child(None, "foods"), "fruits") == 1
+
+
+@patch("services.storage.CHILD_CHUNK_SIZE", 2)
+def test_compact_storage_child_index_shapes():
+    storage = CompactStorage()
+    parent_id = storage.add_folder("foods", None)
+    names = [f"f{index}" for index in (7, 3, 9, 1, 5, 8, 2, 6, 4, 0)]
+    folder_ids = {name: storage.add_folder(name, parent_id) for name in names[:1]}
+    assert storage._children[parent_id] == folder_ids["f7"]
+
+    folder_ids.update((name, storage.add_folder(name, parent_id)) for name in names[1:])
+    assert storage._children[parent_id].bounds
+    assert list(storage.iter_children(parent_id, after="f4")) == [
+        (f"f{index}", folder_ids[f"f{index}"]) for index in range(5, 10)
+    ]
+    for name in names[:-1]:
+        storage.remove_folder(storage.get_child(parent_id, name))
+    assert storage._children[parent_id] == folder_ids["f0"]
+    assert list(storage.iter_children(parent_id, after="f0")) == []
+
+    storage.remove_folder(parent_id)
+    assert storage.reclaim() == 11
+    assert storage._children == {}
+
+
+def folder_memory(storage_class, names, deep: bool) -> float:
+    tracemalloc.start()
+    try:
+        storage = storage_class()
+        started = tracemalloc.get_traced_memory()[0]
+        parent_id = ROOT_ID
+        for name in names:
+            folder_id = storage.add_folder(name, parent_id)
+            if deep:
+                parent_id = folder_id
+        return (tracemalloc.get_traced_memory()[0] - started) / len(names)
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.mark.parametrize("deep", [False, True])
+def test_compact_storage_memory_per_folder(deep):
+    names = [f"f{index}" for index in range(20000)]
+
+    compact = folder_memory(CompactStorage, names, deep)
+    assert compact < folder_memory(DictStorage, names, deep) / 2
+
+
+def test_move_folder(directory_manager):
+    directory_manager.command_execute("MOVE foods/fruits/apples animals/fruits")
+
+    assert folder_names(directory_manager.directory) == {
+        0: ["animals", "foods"],
+        1: ["fruits", "fruits", "vegetables"],
+        2: ["apples"],
+        3: ["fuji"],
+    }
+
+
+def test_move_folder_to_shallower_level(directory_manager):
+    directory_manager.command_execute("MOVE foods/fruits/apples animals")
+
+    assert folder_names(directory_manager.directory) == {
+        0: ["animals", "foods"],
+        1: ["apples", "fruits", "fruits", "vegetables"],
+        2: ["fuji"],
+    }
+
+
+def test_move_folder_to_root(directory_manager):
+    directory_manager.command_execute("MOVE foods/fruits/apples /")
+
+    assert folder_names(directory_manager.directory) == {
+        0: ["animals", "apples", "foods"],
+        1: ["fruits", "fruits", "fuji", "vegetables"],
+    }
+
+
+def test_move_folder_only_relinks_the_moved_folder(directory_manager):
+    storage = directory_manager._storage
+    fuji_id, _ = directory_manager._get_folder_id(["foods", "fruits", "apples", "fuji"])
+    apples_id = storage.get_folder(fuji_id)[1]
+
+    directory_manager.command_execute("MOVE foods/fruits/apples foods/vegetables")
+
+    assert storage.get_folder(fuji_id)[1] == apples_id
+    assert storage.get_depth(fuji_id) == 3
+    assert directory_manager._get_folder_id(
+        ["foods", "vegetables", "apples", "fuji"]
+    ) == (fuji_id, True)
+
+
+def test_delete_folder(directory_manager):
+    directory_manager.command_execute("DELETE foods/fruits")
+
+    assert folder_names(directory_manager.directory) == {
+        0: ["animals", "foods"],
+        1: ["fruits", "vegetables"],
+    }
+
+
+def test_delete_everything_lists_empty_directory(directory_manager):
+    directory_manager.command_execute("DELETE foods")
+    directory_manager.command_execute("DELETE animals")
+
+    with patch("loguru.logger.info") as mock_info:
+        directory_manager.command_execute("LIST")
+        actual_output = "\n".join(call[0][0] for call in mock_info.call_args_list)
+        assert actual_output == "LIST\nEMPTY DIRECTORY"
+
+
+def test_delete_folder_defers_reclamation(directory_manager):
+    storage = directory_manager._storage
+    fuji_id, _ = directory_manager._get_folder_id(["foods", "fruits", "apples", "fuji"])
+
+    directory_manager._delete_folder("/foods/fruits")
+
+    assert directory_manager._get_folder_id(["foods", "fruits"]) == ("", False)
+    assert storage.get_folder(fuji_id)[0] == "fuji"
+    assert storage.reclaim(budget=2) == 2
+    assert storage.reclaim() == 1
+    assert storage.reclaim() == 0
+
+
+def test_command_execute_reclaims_within_budget(directory_manager):
+    directory_manager.reclaim_budget = 1
+    directory_manager.command_execute("DELETE foods")
+
+    assert directory_manager._storage.reclaim() == 4
+
+
+def test_sqlite_storage_keeps_the_tree_on_disk(tmp_path):
+    path = str(tmp_path / "tree.db")
+    directory_manager = DirectoryManager(storage=SQLiteStorage(path))
+    for command in ["CREATE foods", "CREATE foods/fruits", "CREATE animals"]:
+        directory_manager.command_execute(command)
+    directory_manager._storage.remove_folder(
+        directory_manager._get_folder_id(["foods"])[0]
+    )
+    directory_manager._storage.close()
+
+    storage = SQLiteStorage(path)
+    assert DirectoryManager(storage=storage).directory == {
+        0: {3: {"name": "animals", "parent_id": None}}
+    }
+    assert storage.reclaim() == 2
+    assert storage.add_folder("foods", None) == 4
+
+
+def test_sqlite_storage_lists_children_in_pages():
+    storage = SQLiteStorage()
+    storage._PAGE_SIZE = 3
+    for index in range(10):
+        storage.add_folder(f"f{index}", None)
+
+    assert [name for name, _ in storage.iter_children(None)] == [
+        f"f{index}" for index in range(10)
+    ]
+    assert [name for name, _ in storage.iter_children(None, after="f5")] == [
+        "f6",
+        "f7",
+        "f8",
+        "f9",
+    ]